@@ -27,6 +27,7 @@ import os
 import sys
 import time
 import json
+import gzip
 import base64
 import psutil
 import win32gui
@@ -203,6 +204,7 @@ class GlobalState:
         self.windows_opened = []
         self.latest_screenshot_b64 = None
         self.last_mouse_pos = None
+        self.retry_after_until = 0.0   # server backpressure (429 Retry-After)
         
         # Auto-generate device ID (persistent)
         self.device_id = self._get_or_create_device_id()
@@ -556,6 +558,20 @@ def punch_out():
         print(f"[PUNCH-OUT] ❌ {e}")
         return False, str(e)
 
+def post_compressed(url, headers, timeout, **kwargs):
+    """
+    POST with a gzip-compressed body (Content-Encoding: gzip).
+    Window lists and the base64 screenshot shrink well; the backend
+    decompresses tracker requests before parsing them.
+    """
+    req = requests.Request('POST', url, headers=headers, **kwargs).prepare()
+    body = req.body.encode() if isinstance(req.body, str) else req.body
+    req.body = gzip.compress(body, compresslevel=6)
+    req.headers['Content-Encoding'] = 'gzip'
+    req.headers['Content-Length'] = str(len(req.body))
+    with requests.Session() as session:
+        return session.send(req, timeout=timeout)
+
 def upload_data():
     """
     Upload tracking data
@@ -589,9 +605,15 @@ def upload_data():
             'X-Tracker-Token': CONFIG['tracker_token']
         }
         
-        response = requests.post(url, json=payload, headers=headers, timeout=15)
+        response = post_compressed(url, headers, 15, json=payload)
         
-        if response.status_code == 200:
+        if response.status_code == 429:
+            # Backpressure: keep the data, upload again after Retry-After
+            wait = float(response.headers.get('Retry-After') or CONFIG['upload_interval'])
+            STATE.retry_after_until = time.time() + wait
+            print(f"[UPLOAD] 🚦 Rate limited — next upload in {wait:.0f}s")
+            return False
+        elif response.status_code in (200, 202):   # 202 = spooled by the server, still accepted
             print("[UPLOAD] ✅ Data uploaded")
             STATE.reset_for_upload()
             return True
@@ -696,7 +718,7 @@ class DataUploader(Thread):
         while self.running:
             if STATE.is_tracking:
                 upload_data()
-            time.sleep(CONFIG['upload_interval'])
+            time.sleep(max(CONFIG['upload_interval'], STATE.retry_after_until - time.time()))
 
 class HeartbeatSender(Thread):
     def __init__(self):
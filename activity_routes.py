@@ -4,11 +4,14 @@ ACTIVITY_ROUTES.PY - Activity Logs & Website Visits (Admin-Only)
 ✅ Secure company-scoped activity access
 ✅ Activity logs with filtering
 ✅ Website visits with time range
+✅ App usage from the app_usage_hourly rollup
+✅ Website visits grouped by interned domain ids
 """
 
 from flask import Blueprint, request, jsonify
 from admin_auth_routes import require_admin_auth
 from db import get_db
+from app_usage import local_day_hours, app_usage_totals
 from datetime import datetime, timedelta
 
 activity_bp = Blueprint('activity', __name__)
@@ -192,88 +195,53 @@ def get_member_website_visits(member_id):
             if not member:
                 return jsonify({'error': 'Member not found'}), 404
             
-            # Get website visits from browser history in activity_log
+            # Website visits per domain: url_ids reference dim_urls, grouped by domain id.
+            # The timestamp bounds (a day wider than the local dates) keep partition pruning.
             cur.execute(
                 """
-                SELECT 
-                    timestamp,
-                    browser_history
-                FROM activity_log
-                WHERE company_id = %s 
-                  AND member_id = %s 
-                  AND tracking_date >= %s
-                  AND tracking_date <= %s
-                  AND browser_history IS NOT NULL
-                  AND browser_history != '[]'
-                ORDER BY timestamp DESC
+                WITH visits AS (
+                    SELECT 
+                        u.domain_id,
+                        COUNT(*) as visit_count,
+                        MIN(a.timestamp) as first_visit,
+                        MAX(a.timestamp) as last_visit,
+                        COUNT(DISTINCT u.id) as unique_urls,
+                        (ARRAY_AGG(u.id ORDER BY a.timestamp DESC))[1] as latest_url_id
+                    FROM activity_log a
+                    CROSS JOIN LATERAL unnest(a.url_ids) AS v(url_id)
+                    JOIN dim_urls u ON u.id = v.url_id
+                    WHERE a.company_id = %s 
+                      AND a.member_id = %s 
+                      AND a.local_date >= %s
+                      AND a.local_date <= %s
+                      AND a.timestamp >= %s::date - INTERVAL '1 day'
+                      AND a.timestamp < %s::date + INTERVAL '2 days'
+                      AND a.url_ids IS NOT NULL
+                    GROUP BY u.domain_id
+                    ORDER BY visit_count DESC
+                    LIMIT %s
+                )
+                SELECT d.domain, lu.url, visits.*
+                FROM visits
+                JOIN dim_domains d ON d.id = visits.domain_id
+                JOIN dim_urls lu ON lu.id = visits.latest_url_id
+                ORDER BY visits.visit_count DESC
                 """,
-                (company_id, member_id, start_date, end_date)
+                (company_id, member_id, start_date, end_date, start_date, end_date, limit)
             )
-            raw_data = cur.fetchall()
-            
-            # Parse and aggregate website visits
-            import json
-            from urllib.parse import urlparse
-            
-            website_stats = {}
-            
-            for row in raw_data:
-                try:
-                    browser_history = json.loads(row['browser_history'])
-                    timestamp = row['timestamp']
-                    
-                    for url in browser_history:
-                        if not url or url == 'N/A':
-                            continue
-                        
-                        # Parse domain
-                        try:
-                            parsed = urlparse(url)
-                            domain = parsed.netloc or parsed.path.split('/')[0]
-                            
-                            if domain not in website_stats:
-                                website_stats[domain] = {
-                                    'domain': domain,
-                                    'url': url,
-                                    'visit_count': 0,
-                                    'first_visit': timestamp,
-                                    'last_visit': timestamp,
-                                    'urls': set(),
-                                    'total_time_seconds': 0
-                                }
-                            
-                            website_stats[domain]['visit_count'] += 1
-                            website_stats[domain]['last_visit'] = max(
-                                website_stats[domain]['last_visit'], 
-                                timestamp
-                            )
-                            website_stats[domain]['first_visit'] = min(
-                                website_stats[domain]['first_visit'], 
-                                timestamp
-                            )
-                            website_stats[domain]['urls'].add(url)
-                            # Estimate 5 seconds per visit
-                            website_stats[domain]['total_time_seconds'] += 5
-                        except Exception:
-                            continue
-                except Exception:
-                    continue
             
             # Format results
             websites = []
-            for domain, stats in sorted(
-                website_stats.items(), 
-                key=lambda x: x[1]['visit_count'], 
-                reverse=True
-            )[:limit]:
+            for stats in cur.fetchall():
                 websites.append({
                     'domain': stats['domain'],
                     'url': stats['url'],
                     'visit_count': stats['visit_count'],
                     'first_visit': stats['first_visit'].isoformat(),
                     'last_visit': stats['last_visit'].isoformat(),
-                    'unique_urls': len(stats['urls']),
-                    'total_time_seconds': stats['total_time_seconds']
+                    'unique_urls': stats['unique_urls'],
+                    # Estimate 5 seconds per visit
+                    'total_time_seconds': stats['visit_count'] * 5
                 })
             
             return jsonify({
@@ -312,7 +280,7 @@ def get_member_app_usage(member_id):
     - Only app usage for admin's company
     
     Query params:
-    - date: Filter by date (YYYY-MM-DD), defaults to today
+    - date: Filter by date (YYYY-MM-DD), defaults to today IST
     - limit: Number of apps (default 20, max 100)
     """
     try:
@@ -329,7 +297,11 @@ def get_member_app_usage(member_id):
             except ValueError:
                 return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
         else:
-            filter_date = datetime.utcnow().date()
+            # Get current IST date (rollup hours are IST)
+            from datetime import timezone
+            ist_offset = timezone(timedelta(hours=5, minutes=30))
+            ist_now = datetime.now(ist_offset)
+            filter_date = ist_now.date()
         
         with get_db() as conn:
             cur = conn.cursor()
@@ -348,29 +320,9 @@ def get_member_app_usage(member_id):
             if not member:
                 return jsonify({'error': 'Member not found'}), 404
             
-            # Get app usage statistics
-            cur.execute(
-                """
-                SELECT 
-                    app_name,
-                    COUNT(*) as usage_count,
-                    SUM(CASE WHEN is_idle = FALSE AND is_locked = FALSE 
-                        THEN duration_seconds ELSE 0 END) as active_seconds,
-                    SUM(CASE WHEN is_idle = TRUE 
-                        THEN duration_seconds ELSE 0 END) as idle_seconds,
-                    SUM(duration_seconds) as total_seconds
-                FROM activity_logs
-                WHERE company_id = %s 
-                  AND member_id = %s 
-                  AND tracking_date = %s
-                  AND app_name IS NOT NULL
-                GROUP BY app_name
-                ORDER BY total_seconds DESC
-                LIMIT %s
-                """,
-                (company_id, member_id, filter_date, limit)
-            )
-            apps = cur.fetchall()
+            # Get app usage statistics (hourly rollup, local day)
+            first_hour, last_hour = local_day_hours(filter_date)
+            apps = app_usage_totals(cur, company_id, first_hour, last_hour, member_id=member_id, limit=limit)
             
             # Format results
             result = []
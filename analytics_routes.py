@@ -6,11 +6,15 @@ ANALYTICS_ROUTES.PY - Advanced Analytics (Synchronous + psycopg2)
 ✅ PostgreSQL aggregations
 ✅ FIXED: Uses admin_auth for proper authentication
 ✅ FIXED: Changed activity_logs to activity_log to match schema
+✅ App usage answered from the app_usage_hourly rollup
+✅ Window dwell time from window_activity
 """
 
 from flask import Blueprint, request, jsonify
 from admin_auth_routes import require_admin_auth
 from db import get_db
+from app_usage import local_hour_range, app_usage_totals, app_usage_by_hour
+from window_activity import window_usage
 from datetime import datetime, timedelta
 
 analytics_bp = Blueprint('analytics', __name__)
@@ -47,7 +51,7 @@ def get_member_analytics(member_id):
                 SELECT 
                     COUNT(*) as total_activities,
                     COALESCE(SUM(total_seconds), 0) / 3600.0 as total_hours,
-                    COUNT(DISTINCT DATE(timestamp)) as active_days
+                    COUNT(DISTINCT local_date) as active_days
                 FROM activity_log
                 WHERE member_id = %s 
                   AND timestamp >= %s 
@@ -57,31 +61,22 @@ def get_member_analytics(member_id):
             )
             stats = cur.fetchone()
             
-            # Top apps - FIXED: activity_log (not activity_logs)
-            cur.execute(
-                """
-                SELECT 
-                    current_process as app_name,
-                    COUNT(*) as count,
-                    COALESCE(SUM(total_seconds), 0) / 3600.0 as hours
-                FROM activity_log
-                WHERE member_id = %s 
-                  AND timestamp >= %s 
-                  AND timestamp <= %s
-                  AND current_process IS NOT NULL
-                GROUP BY current_process
-                ORDER BY hours DESC
-                LIMIT 10
-                """,
-                (member_id, start_date, end_date)
-            )
-            top_apps = cur.fetchall()
+            # Top apps (hourly rollup)
+            first_hour, last_hour = local_hour_range(start_date, end_date)
+            top_apps = [
+                {
+                    'app_name': app['app_name'],
+                    'count': app['usage_count'],
+                    'hours': app['total_seconds'] / 3600
+                }
+                for app in app_usage_totals(cur, company_id, first_hour, last_hour, member_id=member_id, limit=10)
+            ]
             
             # Daily activity - FIXED: activity_log (not activity_logs)
             cur.execute(
                 """
                 SELECT 
-                    DATE(timestamp) as date,
+                    local_date as date,
                     COUNT(*) as activity_count,
                     COALESCE(SUM(total_seconds), 0) / 3600.0 as hours
                 FROM activity_log
@@ -128,7 +123,7 @@ def get_productivity_trends():
             cur.execute(
                 """
                 SELECT 
-                    DATE(timestamp) as date,
+                    local_date as date,
                     COUNT(DISTINCT member_id) as active_members,
                     COUNT(*) as total_activities,
                     COALESCE(SUM(total_seconds), 0) / 3600.0 as total_hours,
@@ -169,26 +164,18 @@ def get_app_usage():
         with get_db() as conn:
             cur = conn.cursor()
             
-            # FIXED: activity_log (not activity_logs)
-            cur.execute(
-                """
-                SELECT 
-                    current_process as app_name,
-                    COUNT(*) as usage_count,
-                    COUNT(DISTINCT member_id) as unique_users,
-                    COALESCE(SUM(total_seconds), 0) / 3600.0 as total_hours,
-                    COALESCE(AVG(total_seconds), 0) as avg_duration_seconds
-                FROM activity_log
-                WHERE company_id = %s 
-                  AND timestamp >= %s 
-                  AND timestamp <= %s
-                  AND current_process IS NOT NULL
-                GROUP BY current_process
-                ORDER BY total_hours DESC
-                """,
-                (company_id, start_date, end_date)
-            )
-            apps = cur.fetchall()
+            # Hourly rollup
+            first_hour, last_hour = local_hour_range(start_date, end_date)
+            apps = [
+                {
+                    'app_name': app['app_name'],
+                    'usage_count': app['usage_count'],
+                    'unique_users': app['unique_users'],
+                    'total_hours': app['total_seconds'] / 3600,
+                    'avg_duration_seconds': app['total_seconds'] / app['usage_count'] if app['usage_count'] else 0
+                }
+                for app in app_usage_totals(cur, company_id, first_hour, last_hour)
+            ]
             
             return jsonify({
                 'success': True,
@@ -310,7 +297,7 @@ def get_activity_analytics():
                     is_idle,
                     locked,
                     total_seconds as duration_seconds,
-                    timestamp::date as tracking_date
+                    local_date as tracking_date
                 FROM activity_log
                 WHERE company_id = %s 
                   AND member_id = %s
@@ -375,25 +362,20 @@ def get_apps_analytics():
         with get_db() as conn:
             cur = conn.cursor()
             
-            # Get raw application logs - FIXED: activity_log (not activity_logs)
-            cur.execute(
-                """
-                SELECT 
-                    current_process as app_name,
-                    timestamp,
-                    total_seconds as duration_seconds,
-                    timestamp::date as tracking_date
-                FROM activity_log
-                WHERE company_id = %s 
-                  AND member_id = %s
-                  AND timestamp >= %s 
-                  AND timestamp <= %s
-                  AND current_process IS NOT NULL
-                ORDER BY timestamp
-                """,
-                (company_id, member_id, start_date, end_date)
-            )
-            app_logs = cur.fetchall()
+            # One entry per app per local hour (hourly rollup)
+            first_hour, last_hour = local_hour_range(start_date, end_date)
+            app_logs = [
+                {
+                    'app_name': row['app_name'],
+                    'timestamp': row['hour'],
+                    'duration_seconds': row['total_seconds'],
+                    'active_seconds': row['active_seconds'],
+                    'idle_seconds': row['idle_seconds'],
+                    'samples': row['samples'],
+                    'tracking_date': row['hour'].date()
+                }
+                for row in app_usage_by_hour(cur, company_id, member_id, first_hour, last_hour)
+            ]
             
             return jsonify({
                 'success': True,
@@ -432,7 +414,7 @@ def get_websites_analytics():
                     browser_history,
                     timestamp,
                     total_seconds as duration_seconds,
-                    timestamp::date as tracking_date
+                    local_date as tracking_date
                 FROM activity_log
                 WHERE company_id = %s 
                   AND member_id = %s
@@ -455,6 +437,56 @@ def get_websites_analytics():
         return jsonify({'error': 'Failed to fetch website analytics'}), 500
 
 
+# ============================================================================
+# WINDOW ANALYTICS
+# ============================================================================
+
+@analytics_bp.route('/analytics/windows', methods=['GET'])
+@require_admin_auth
+def get_windows_analytics():
+    """
+    Get per-window dwell time and visits for a member
+
+    Query params:
+    - member_id: required
+    - start_date / end_date: IST dates (YYYY-MM-DD), default the last 7 days
+    - limit: Number of windows (default 50, max 500)
+    """
+    try:
+        company_id = request.company_id
+        member_id = request.args.get('member_id')
+        limit = min(int(request.args.get('limit', 50)), 500)
+        
+        if not member_id:
+            return jsonify({'error': 'member_id is required'}), 400
+        
+        from datetime import timezone
+        ist_offset = timezone(timedelta(hours=5, minutes=30))
+        ist_today = datetime.now(ist_offset).date()
+        try:
+            start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') else ist_today - timedelta(days=6)
+            end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else ist_today
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        with get_db() as conn:
+            cur = conn.cursor()
+            windows = window_usage(cur, company_id, member_id, start_date, end_date, limit=limit)
+            
+            return jsonify({
+                'success': True,
+                'windows': windows,
+                'date_range': {
+                    'start': start_date.isoformat(),
+                    'end': end_date.isoformat()
+                }
+            }), 200
+    
+    except Exception as e:
+        print(f"❌ Windows analytics error: {e}")
+        return jsonify({'error': 'Failed to fetch window analytics'}), 500
+
+
 # ============================================================================
 # WORK BEHAVIOR ANALYTICS
 # ============================================================================
@@ -493,7 +525,8 @@ def get_work_behavior_analytics():
             )
             attendance = cur.fetchone()
             
-            # Get activity logs for the day - FIXED: activity_log (not activity_logs)
+            # Get activity logs for the local day; the timestamp bounds (a day wider
+            # than any zone offset) let Postgres skip partitions outside it
             cur.execute(
                 """
                 SELECT 
@@ -505,10 +538,12 @@ def get_work_behavior_analytics():
                 FROM activity_log
                 WHERE company_id = %s 
                   AND member_id = %s
-                  AND DATE(timestamp) = %s
+                  AND local_date = %s
+                  AND timestamp >= %s::date - INTERVAL '1 day'
+                  AND timestamp < %s::date + INTERVAL '2 days'
                 ORDER BY timestamp
                 """,
-                (company_id, member_id, date)
+                (company_id, member_id, date, date, date)
             )
             activities = cur.fetchall()
             
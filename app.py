@@ -26,6 +26,10 @@ load_dotenv()
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "change-this-in-prod")
 
+# Trackers send gzip/zstd bodies; decompress (size-capped) before Flask parses them
+from request_compression import DecompressionMiddleware
+app.wsgi_app = DecompressionMiddleware(app.wsgi_app, path_prefixes=('/tracker/',))
+
 CORS(app, resources={
     r"/*": {
         "origins": "*",
@@ -51,6 +55,16 @@ socketio = SocketIO(
 # ======================================================================
 
 from db import check_db_health
+from screenshot_pipeline import start_screenshot_pipeline, get_pipeline_stats
+from tracker_cache import get_company_schema, get_cache_stats
+from presence import start_presence_flusher, get_presence_stats
+from ingest_admission import get_admission_stats
+from ingest_spool import start_ingest_spool, get_spool_stats
+from partitions import start_partition_maintenance, get_partition_stats
+from retention import start_retention_engine, get_retention_stats
+from app_usage import start_app_usage_rollup, get_app_usage_stats
+from dimensions import get_dimension_stats
+from blob_store import check_blob_store
 
 print("🔒 Multi-Tenant Secure Backend Starting...")
 
@@ -89,6 +103,33 @@ load_blueprint(configuration_bp, "Configuration")  # NEW!
 load_blueprint(tracker_bp, "Tracker")
 load_blueprint(attendance_bp, "Attendance")
 
+# Warn when screenshots would be stored on a disk a redeploy wipes
+check_blob_store()
+
+# Drain any screenshots queued before a restart
+start_screenshot_pipeline()
+
+# Write heartbeat/status presence behind to Postgres
+start_presence_flusher()
+
+# Replay uploads spooled while Postgres was slow or down
+start_ingest_spool()
+
+# Create upcoming activity_log / screenshots partitions ahead of time
+start_partition_maintenance()
+
+# Expire activity data and screenshots per company retention policy
+start_retention_engine()
+
+# Fold new activity into the hourly app usage rollup
+start_app_usage_rollup()
+
+# Resolve companies schema once so tracker auth never hits information_schema
+try:
+    get_company_schema()
+except Exception as e:
+    print(f"⚠️ Could not resolve companies schema at startup: {e}")
+
 
 # ======================================================================
 # HEALTH CHECK
@@ -102,7 +143,16 @@ def health():
         "status": "healthy" if healthy else "degraded",
         "database": "connected" if healthy else "disconnected",
         "service": "work-eye-secure-backend",
-        "architecture": "multi-tenant-isolated"
+        "architecture": "multi-tenant-isolated",
+        "screenshot_pipeline": get_pipeline_stats(),
+        "tracker_auth_cache": get_cache_stats(),
+        "presence": get_presence_stats(),
+        "ingest_admission": get_admission_stats(),
+        "ingest_spool": get_spool_stats(),
+        "partitions": get_partition_stats(),
+        "retention": get_retention_stats(),
+        "app_usage_rollup": get_app_usage_stats(),
+        "dimensions": get_dimension_stats()
     }), 200 if healthy else 503
 
 @app.route("/api")
@@ -123,7 +173,7 @@ def api_root():
             "GET /api/dashboard/member/<id>/live",
             "GET /api/tracker/download",
             "GET /api/screenshots/<member_id>",
-            "GET /api/screenshots/image/<screenshot_id>",
+            "GET /api/screenshots/image/<screenshot_id>?size=thumb|preview|full",
             "GET /api/activity-logs/<member_id>",
             "GET /api/website-visits/<member_id>",
             "GET /api/app-usage/<member_id>",
@@ -135,6 +185,7 @@ def api_root():
             "POST /tracker/punch-in",
             "POST /tracker/punch-out",
             "POST /tracker/upload",
+            "POST /tracker/upload-batch",
             "POST /tracker/heartbeat",
             "GET /api/tracker/configuration"
         ]
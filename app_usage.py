@@ -0,0 +1,370 @@
+"""
+APP_USAGE.PY - Hourly application usage rollup
+==============================================
+✅ app_usage_hourly holds one row per (member, local hour, process): the
+   seconds spent in that process and the number of samples
+✅ A background job folds new activity_log rows in by id (watermark in
+   rollup_watermarks), recomputing every (member, hour) they touch and the
+   hour of the device's next sample, so late uploads (spool replays, offline
+   trackers) land in the right hour
+✅ The watermark stays APP_USAGE_ROLLUP_LAG_SECONDS behind MAX(id), so ids
+   taken by transactions that commit later are not skipped
+✅ App usage endpoints read hundreds of rollup rows instead of grouping
+   every activity_log sample in the range
+✅ One worker per batch does the work (advisory lock), the others skip
+
+Trackers send cumulative counters, so a sample's seconds are the increase
+of total/active/idle_seconds since the previous sample of the same device
+session (the whole value for the first sample of a session or after a
+counter reset), attributed to the sample's current_process. Hours are
+Asia/Kolkata local hours like member_day_state. Requires
+scripts/add_app_usage_hourly.py.
+"""
+
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+
+import pytz
+
+from db import get_db
+from member_day import LOCAL_TIMEZONE
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+APP_USAGE_ROLLUP_ENABLED = os.getenv('APP_USAGE_ROLLUP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+APP_USAGE_ROLLUP_INTERVAL_SECONDS = float(os.getenv('APP_USAGE_ROLLUP_INTERVAL_SECONDS', '60'))
+# activity_log ids folded per transaction
+APP_USAGE_ROLLUP_BATCH = int(os.getenv('APP_USAGE_ROLLUP_BATCH', '20000'))
+# Only ids that were already taken this long ago are folded (longer-running
+# ingest transactions would commit rows below the watermark)
+APP_USAGE_ROLLUP_LAG_SECONDS = float(os.getenv('APP_USAGE_ROLLUP_LAG_SECONDS', '300'))
+
+# pg_advisory_xact_lock key for rollup batches
+APP_USAGE_LOCK_KEY = 0x61707075
+
+WATERMARK_NAME = 'app_usage_hourly'
+
+_LOCAL_ZONE = pytz.timezone(LOCAL_TIMEZONE)
+
+# Local hour of a UTC (naive) timestamp expression, and the reverse
+LOCAL_HOUR_SQL = "date_trunc('hour', ({expr}) AT TIME ZONE 'UTC' AT TIME ZONE '" + LOCAL_TIMEZONE + "')"
+UTC_OF_LOCAL_SQL = "(({expr}) AT TIME ZONE '" + LOCAL_TIMEZONE + "' AT TIME ZONE 'UTC')"
+
+# Hours of the new rows, plus the hour of each row's next sample from the
+# same device: a late row changes that sample's baseline counters
+DIRTY_HOURS_SQL = f"""
+    SELECT member_id, {LOCAL_HOUR_SQL.format(expr='timestamp')} AS hour
+    FROM activity_log
+    WHERE id > %(after)s AND id <= %(upto)s AND member_id IS NOT NULL
+    UNION
+    SELECT a.member_id, {LOCAL_HOUR_SQL.format(expr='n.timestamp')}
+    FROM activity_log a
+    CROSS JOIN LATERAL (
+        SELECT timestamp
+        FROM activity_log n
+        WHERE n.member_id = a.member_id AND n.device_id = a.device_id
+          AND n.timestamp > a.timestamp AND n.timestamp < a.timestamp + INTERVAL '1 day'
+        ORDER BY n.timestamp
+        LIMIT 1
+    ) n
+    WHERE a.id > %(after)s AND a.id <= %(upto)s AND a.member_id IS NOT NULL
+"""
+
+CLEAR_HOURS_SQL = """
+    DELETE FROM app_usage_hourly h
+    USING unnest(%(members)s::int[], %(hours)s::timestamp[]) AS d(member_id, hour)
+    WHERE h.member_id = d.member_id AND h.hour = d.hour
+"""
+
+
+def _increment(column):
+    return (
+        f"CASE WHEN prev_{column} IS NULL OR new_session OR {column} < prev_{column} "
+        f"THEN {column} ELSE {column} - prev_{column} END"
+    )
+
+
+# Rebuilds the given (member, hour) pairs from their samples plus, per
+# device, the sample just before the hour (its counters are the baseline)
+ROLLUP_HOURS_SQL = f"""
+    WITH dirty AS (
+        SELECT * FROM unnest(%(members)s::int[], %(hours)s::timestamp[]) AS d(member_id, hour)
+    ),
+    samples AS (
+        SELECT a.company_id, a.member_id, d.hour, a.device_id, a.session_start, a.timestamp,
+               a.total_seconds, a.active_seconds, a.idle_seconds, a.current_process, FALSE AS is_seed
+        FROM dirty d
+        JOIN activity_log a
+          ON a.member_id = d.member_id
+         AND a.timestamp >= {UTC_OF_LOCAL_SQL.format(expr='d.hour')}
+         AND a.timestamp < {UTC_OF_LOCAL_SQL.format(expr="d.hour + INTERVAL '1 hour'")}
+    ),
+    seeds AS (
+        SELECT f.company_id, f.member_id, f.hour, f.device_id, p.session_start, p.timestamp,
+               p.total_seconds, p.active_seconds, p.idle_seconds, NULL::varchar AS current_process, TRUE AS is_seed
+        FROM (
+            SELECT company_id, member_id, hour, device_id, MIN(timestamp) AS first_at
+            FROM samples GROUP BY 1, 2, 3, 4
+        ) f
+        CROSS JOIN LATERAL (
+            -- A baseline older than a day is treated as a new session
+            SELECT session_start, timestamp, total_seconds, active_seconds, idle_seconds
+            FROM activity_log p
+            WHERE p.member_id = f.member_id AND p.device_id = f.device_id
+              AND p.timestamp < f.first_at AND p.timestamp >= f.first_at - INTERVAL '1 day'
+            ORDER BY p.timestamp DESC
+            LIMIT 1
+        ) p
+    ),
+    steps AS (
+        SELECT s.*,
+               LAG(total_seconds) OVER w AS prev_total_seconds,
+               LAG(active_seconds) OVER w AS prev_active_seconds,
+               LAG(idle_seconds) OVER w AS prev_idle_seconds,
+               LAG(session_start) OVER w IS DISTINCT FROM session_start AS new_session
+        FROM (SELECT * FROM samples UNION ALL SELECT * FROM seeds) s
+        WINDOW w AS (PARTITION BY member_id, hour, device_id ORDER BY timestamp, is_seed DESC)
+    )
+    INSERT INTO app_usage_hourly (
+        company_id, member_id, hour, process, total_seconds, active_seconds, idle_seconds, samples
+    )
+    SELECT company_id, member_id, hour, current_process,
+           SUM({_increment('total_seconds')}), SUM({_increment('active_seconds')}),
+           SUM({_increment('idle_seconds')}), COUNT(*)
+    FROM steps
+    WHERE NOT is_seed AND current_process IS NOT NULL AND current_process <> ''
+    GROUP BY 1, 2, 3, 4
+    ORDER BY 2, 3, 4
+    ON CONFLICT (member_id, hour, process) DO UPDATE
+    SET total_seconds = EXCLUDED.total_seconds,
+        active_seconds = EXCLUDED.active_seconds,
+        idle_seconds = EXCLUDED.idle_seconds,
+        samples = EXCLUDED.samples,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+
+# ============================================================================
+# ROLLUP
+# ============================================================================
+
+def rollup_hours(cur, pairs):
+    """Recompute app_usage_hourly for [(member_id, local hour)]. Returns the rows written."""
+    if not pairs:
+        return 0
+    params = {'members': [p[0] for p in pairs], 'hours': [p[1] for p in pairs]}
+    cur.execute(CLEAR_HOURS_SQL, params)
+    cur.execute(ROLLUP_HOURS_SQL, params)
+    return cur.rowcount
+
+
+def rollup_batch(batch_size=None, lag_seconds=None):
+    """
+    Fold the next batch of activity_log ids into app_usage_hourly (one
+    transaction), up to the safe id: the MAX(id) observed (the horizon) at
+    least lag_seconds ago, by which time the transactions holding lower ids
+    have committed. Each time the horizon matures it becomes the safe id and
+    the current MAX(id) becomes the new horizon. Returns {'hours', 'rows',
+    'last_id', 'safe_id'}, or None when another worker holds the lock.
+    """
+    batch_size = batch_size or APP_USAGE_ROLLUP_BATCH
+    lag_seconds = APP_USAGE_ROLLUP_LAG_SECONDS if lag_seconds is None else lag_seconds
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (APP_USAGE_LOCK_KEY,))
+        if not cur.fetchone()['locked']:
+            return None
+
+        cur.execute("""
+            SELECT last_id, safe_id, horizon_id, horizon_at
+            FROM rollup_watermarks WHERE name = %s FOR UPDATE
+        """, (WATERMARK_NAME,))
+        watermark = cur.fetchone() or {'last_id': 0, 'safe_id': 0, 'horizon_id': None, 'horizon_at': None}
+        last_id = watermark['last_id']
+        safe_id = watermark['safe_id']
+        horizon_id, horizon_at = watermark['horizon_id'], watermark['horizon_at']
+
+        cur.execute("SELECT COALESCE(MAX(id), 0) AS max_id, LOCALTIMESTAMP AS now FROM activity_log")
+        row = cur.fetchone()
+        if lag_seconds <= 0:
+            safe_id = row['max_id']
+            horizon_id, horizon_at = row['max_id'], row['now']
+        elif horizon_at is None or horizon_at <= row['now'] - timedelta(seconds=lag_seconds):
+            safe_id = max(safe_id, horizon_id or 0)
+            horizon_id, horizon_at = row['max_id'], row['now']
+        upper = max(last_id, min(safe_id, last_id + batch_size))
+
+        pairs = []
+        if upper > last_id:
+            cur.execute(DIRTY_HOURS_SQL, {'after': last_id, 'upto': upper})
+            pairs = [(r['member_id'], r['hour']) for r in cur.fetchall()]
+        rows = rollup_hours(cur, pairs)
+
+        cur.execute("""
+            INSERT INTO rollup_watermarks (name, last_id, safe_id, horizon_id, horizon_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (name) DO UPDATE
+            SET last_id = EXCLUDED.last_id, safe_id = EXCLUDED.safe_id,
+                horizon_id = EXCLUDED.horizon_id, horizon_at = EXCLUDED.horizon_at,
+                updated_at = EXCLUDED.updated_at
+        """, (WATERMARK_NAME, upper, safe_id, horizon_id, horizon_at))
+
+    return {'hours': len(pairs), 'rows': rows, 'last_id': upper, 'safe_id': safe_id}
+
+
+def run_app_usage_rollup(batch_size=None, lag_seconds=None):
+    """Fold batches up to the safe id. Returns the totals, or None if another worker is rolling up."""
+    totals = {'batches': 0, 'hours': 0, 'rows': 0, 'last_id': None}
+    while True:
+        result = rollup_batch(batch_size, lag_seconds)
+        if result is None:
+            return None if totals['batches'] == 0 else totals
+        totals['batches'] += 1
+        totals['hours'] += result['hours']
+        totals['rows'] += result['rows']
+        totals['last_id'] = result['last_id']
+        if result['last_id'] >= result['safe_id']:
+            return totals
+
+
+_rollup_lock = threading.Lock()
+_rollup_thread = None
+_rollup_stats = {
+    'runs': 0,
+    'hours_rolled_up': 0,
+    'errors': 0,
+    'last_id': None,
+    'last_run_at': None,
+    'last_error': None
+}
+
+
+def _rollup_loop():
+    while True:
+        try:
+            totals = run_app_usage_rollup()
+            with _rollup_lock:
+                if totals is not None:
+                    _rollup_stats['runs'] += 1
+                    _rollup_stats['hours_rolled_up'] += totals['hours']
+                    _rollup_stats['last_id'] = totals['last_id']
+                    _rollup_stats['last_run_at'] = datetime.utcnow().isoformat()
+                _rollup_stats['last_error'] = None
+        except Exception as e:
+            print(f"⚠️ App usage rollup error: {e}")
+            with _rollup_lock:
+                _rollup_stats['errors'] += 1
+                _rollup_stats['last_error'] = str(e)
+        time.sleep(APP_USAGE_ROLLUP_INTERVAL_SECONDS)
+
+
+def start_app_usage_rollup():
+    """Start this worker's app usage rollup thread (idempotent)"""
+    global _rollup_thread
+    if not APP_USAGE_ROLLUP_ENABLED:
+        print("📊 App usage rollup disabled (APP_USAGE_ROLLUP_ENABLED=false)")
+        return
+    with _rollup_lock:
+        if _rollup_thread is not None and _rollup_thread.is_alive():
+            return
+        _rollup_thread = threading.Thread(target=_rollup_loop, name='app-usage-rollup', daemon=True)
+        _rollup_thread.start()
+    print(f"📊 App usage rollup started (every {APP_USAGE_ROLLUP_INTERVAL_SECONDS:.0f}s)")
+
+
+def get_app_usage_stats():
+    with _rollup_lock:
+        stats = dict(_rollup_stats)
+    stats.update({'enabled': APP_USAGE_ROLLUP_ENABLED, 'interval_seconds': APP_USAGE_ROLLUP_INTERVAL_SECONDS})
+    return stats
+
+
+# ============================================================================
+# QUERIES
+# ============================================================================
+
+def local_hour_range(start, end):
+    """
+    (first, last) local hours covering the UTC range [start, end]; accepts
+    ISO strings or datetimes, naive values being UTC
+    """
+    bounds = []
+    for value in (start, end):
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if value.tzinfo is None:
+            value = pytz.utc.localize(value)
+        bounds.append(value.astimezone(_LOCAL_ZONE).replace(tzinfo=None, minute=0, second=0, microsecond=0))
+    return bounds[0], bounds[1]
+
+
+def local_day_hours(day):
+    """(first, last) local hours of a local date"""
+    first = datetime.combine(day, datetime.min.time())
+    return first, first + timedelta(hours=23)
+
+
+def app_usage_totals(cur, company_id, first_hour, last_hour, member_id=None, limit=None):
+    """
+    Per process usage over local hours [first_hour, last_hour], most used
+    first: app_name, usage_count, unique_users and total/active/idle seconds
+    """
+    query = """
+        SELECT
+            process as app_name,
+            SUM(samples) as usage_count,
+            COUNT(DISTINCT member_id) as unique_users,
+            SUM(total_seconds) as total_seconds,
+            SUM(active_seconds) as active_seconds,
+            SUM(idle_seconds) as idle_seconds
+        FROM app_usage_hourly
+        WHERE company_id = %s
+          AND hour >= %s
+          AND hour <= %s
+    """
+    params = [company_id, first_hour, last_hour]
+    if member_id is not None:
+        query += " AND member_id = %s"
+        params.append(member_id)
+    query += " GROUP BY process ORDER BY total_seconds DESC"
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    cur.execute(query, params)
+    return cur.fetchall()
+
+
+def app_usage_by_hour(cur, company_id, member_id, first_hour, last_hour):
+    """A member's app_usage_hourly rows over local hours [first_hour, last_hour], oldest first"""
+    cur.execute("""
+        SELECT process as app_name, hour, total_seconds, active_seconds, idle_seconds, samples
+        FROM app_usage_hourly
+        WHERE company_id = %s
+          AND member_id = %s
+          AND hour >= %s
+          AND hour <= %s
+        ORDER BY hour, process
+    """, (company_id, member_id, first_hour, last_hour))
+    return cur.fetchall()
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'LOCAL_HOUR_SQL',
+    'rollup_hours',
+    'rollup_batch',
+    'run_app_usage_rollup',
+    'start_app_usage_rollup',
+    'get_app_usage_stats',
+    'local_hour_range',
+    'local_day_hours',
+    'app_usage_totals',
+    'app_usage_by_hour'
+]
@@ -11,6 +11,7 @@ ATTENDANCE_ROUTES.PY - Complete Attendance System with Punch In/Out
 from flask import Blueprint, request, jsonify
 from admin_auth_routes import require_admin_auth
 from db import get_db, get_ist_now, IST
+from presence import set_punched_in, apply_live_presence
 from datetime import datetime, timedelta
 from collections import defaultdict
 import calendar
@@ -114,6 +115,7 @@ def punch_in():
             """, (punch_time, punch_time, member_id))
             
             conn.commit()
+            set_punched_in(company_id, member_id, True)
             
             print(f"✅ PUNCH-IN SUCCESS: {member_name} - punch_id={punch_log['id']}, time={punch_log['punch_in_time']}")
             
@@ -236,6 +238,7 @@ def punch_out():
             """, (punch_out_time, member_id))
             
             conn.commit()
+            set_punched_in(company_id, member_id, False)
             
             # Format duration for display
             hours = duration_minutes // 60
@@ -288,7 +291,7 @@ def get_members_attendance():
                         SUM(COALESCE(duration_minutes, 0)) as total_minutes
                     FROM punch_logs
                     WHERE company_id = %s 
-                      AND punch_date = CURRENT_DATE
+                      AND punch_date = %s
                     GROUP BY member_id
                 )
                 SELECT 
@@ -309,9 +312,9 @@ def get_members_attendance():
                 LEFT JOIN today_punches tp ON m.id = tp.member_id
                 WHERE m.company_id = %s AND m.is_active = TRUE
                 ORDER BY m.name
-            """, (company_id, company_id))
+            """, (company_id, get_ist_now().date(), company_id))
             
-            members = cur.fetchall()
+            members = apply_live_presence(cur.fetchall())
             
             members_list = []
             for member in members:
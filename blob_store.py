@@ -0,0 +1,182 @@
+"""
+BLOB_STORE.PY - Storage backends for screenshot image bytes
+===========================================================
+✅ Postgres keeps image metadata plus a locator; the bytes live in a backend
+✅ `local`: append-only pack files on this host's disk (screenshot_packs.py),
+   served zero-copy through wsgi.file_wrapper / sendfile()
+✅ `db`: BYTEA in the row itself, for hosts without a persistent disk and as
+   the fallback when a local write fails
+✅ Same locator columns on `screenshot_blobs` and `screenshot_renditions`:
+   storage_backend, pack_file, pack_offset, pack_length (+ data for `db`)
+
+SCREENSHOT_BLOB_STORE picks the backend for new images. Rows keep the backend
+they were written with, so switching never strands existing images; existing
+BYTEA rows are moved out by scripts/add_blob_store.py. check_blob_store()
+warns at startup when `local` writes to a filesystem that a redeploy wipes.
+"""
+
+import os
+import hashlib
+from io import BytesIO
+
+from screenshot_packs import append_blob, read_blob, open_record, save_root
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+BLOB_STORE = os.getenv('SCREENSHOT_BLOB_STORE', 'local').lower()
+
+# Filesystems that don't outlive the container (image layers, memory)
+EPHEMERAL_FILESYSTEMS = ('overlay', 'aufs', 'tmpfs', 'ramfs')
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+# A backend stores image bytes and hands back the locator columns to save
+# with the row. Locators are dicts (or DB rows) with storage_backend, data,
+# pack_file, pack_offset and pack_length; open() returns (file object, length)
+# positioned at the image.
+
+class DatabaseBlobStore:
+    name = 'db'
+
+    def put(self, company_id, data, content_hash):
+        return {'storage_backend': self.name, 'data': data,
+                'pack_file': None, 'pack_offset': None, 'pack_length': None}
+
+    def open(self, locator):
+        data = self.read(locator)
+        return BytesIO(data), len(data)
+
+    def read(self, locator):
+        if locator['data'] is None:
+            raise LookupError('no database copy')
+        return bytes(locator['data'])
+
+
+class LocalBlobStore:
+    name = 'local'
+
+    def put(self, company_id, data, content_hash):
+        pack_file, pack_offset, pack_length = append_blob(company_id, data, content_hash)
+        return {'storage_backend': self.name, 'data': None,
+                'pack_file': pack_file, 'pack_offset': pack_offset, 'pack_length': pack_length}
+
+    def open(self, locator):
+        return open_record(locator['pack_file'], locator['pack_offset'], locator['pack_length']), locator['pack_length']
+
+    def read(self, locator):
+        return bytes(read_blob(locator['pack_file'], locator['pack_offset'], locator['pack_length']))
+
+
+STORES = {store.name: store for store in (DatabaseBlobStore(), LocalBlobStore())}
+
+
+def get_blob_store(name=None):
+    name = name or BLOB_STORE
+    if name not in STORES:
+        raise ValueError(f"Unknown screenshot blob store '{name}' (use one of: {', '.join(STORES)})")
+    return STORES[name]
+
+
+def put_blob(company_id, data, content_hash=None):
+    """
+    Store image bytes with the configured backend and return the locator
+    columns. Falls back to the database when the backend write fails.
+    """
+    content_hash = content_hash or hashlib.sha256(data).hexdigest()
+    store = get_blob_store()
+    try:
+        return store.put(company_id, data, content_hash)
+    except Exception as e:
+        if store.name == DatabaseBlobStore.name:
+            raise
+        print(f"⚠️ Blob store '{store.name}' write failed ({e}), keeping image in the database")
+        return STORES[DatabaseBlobStore.name].put(company_id, data, content_hash)
+
+
+def open_blob(locator, load_data=None):
+    """
+    (file object, length) for a stored image, or (None, 0) when it is gone.
+
+    A local pack copy is preferred, also for `db` rows mirrored to the
+    filesystem. When the pack isn't on this host the database copy is used:
+    locator['data'] if it was selected, else load_data().
+    """
+    if locator['pack_file']:
+        try:
+            return STORES[LocalBlobStore.name].open(locator)
+        except OSError as e:
+            print(f"⚠️ Pack read failed for {locator['pack_file']} ({e}), using database copy")
+    data = locator.get('data')
+    if data is None and load_data is not None:
+        data = load_data()
+    if data is None:
+        return None, 0
+    data = bytes(data)
+    return BytesIO(data), len(data)
+
+
+def load_blob(locator):
+    """Bytes of a stored image (local pack copy preferred), or None when it is gone"""
+    if locator['pack_file']:
+        try:
+            return STORES[LocalBlobStore.name].read(locator)
+        except OSError as e:
+            print(f"⚠️ Pack read failed for {locator['pack_file']} ({e}), using database copy")
+    return bytes(locator['data']) if locator.get('data') is not None else None
+
+
+def _mount_of(path):
+    """(mount point, filesystem type) holding `path` from /proc/mounts, or None off Linux"""
+    try:
+        with open('/proc/mounts', 'r', encoding='utf-8') as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) >= 3]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best = None
+    for mount_point, fstype in mounts:
+        mount_point = mount_point.replace('\\040', ' ')
+        inside = path == mount_point or path.startswith(mount_point.rstrip('/') + '/')
+        if inside and (best is None or len(mount_point) > len(best[0])):
+            best = (mount_point, fstype)
+    return best
+
+
+def check_blob_store():
+    """
+    Warn when the local store writes images to a filesystem that won't
+    survive a redeploy: an image layer or memory filesystem, or the root
+    filesystem on Render (its disks are mounted at their own path).
+    """
+    if BLOB_STORE != LocalBlobStore.name:
+        return
+    root = save_root()
+    mount = _mount_of(root)
+    if mount is None:
+        return
+    mount_point, fstype = mount
+    if fstype in EPHEMERAL_FILESYSTEMS or (os.getenv('RENDER') and mount_point == '/'):
+        print(f"⚠️ SCREENSHOT_BLOB_STORE=local keeps images only in {root} ({fstype} mounted at {mount_point}), "
+              f"which is not a persistent mount: they are lost on redeploy. Point SCREENSHOT_SAVE_PATH at a "
+              f"persistent disk or set SCREENSHOT_BLOB_STORE=db")
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'BLOB_STORE',
+    'DatabaseBlobStore',
+    'LocalBlobStore',
+    'get_blob_store',
+    'put_blob',
+    'open_blob',
+    'load_blob',
+    'check_blob_store'
+]
@@ -8,11 +8,14 @@ CONFIGURATION_ROUTES.PY - Enhanced Company Configuration Management
 ✅ Configuration broadcast to active trackers
 ✅ JSONB support for working_days
 ✅ FIXED: Use admin_id (INTEGER) instead of admin_email (STRING) for last_modified_by
+✅ Per-company ingest limits (uploads per minute + burst) for admission control
 """
 
 from flask import Blueprint, request, jsonify
 from admin_auth_routes import require_admin_auth
 from db import get_db, get_ist_now
+from tracker_cache import invalidate_company
+from ingest_admission import ingest_limits
 from datetime import datetime
 import json
 
@@ -85,6 +88,10 @@ def get_configuration():
                         office_start_time TIME DEFAULT '09:00:00',
                         office_end_time TIME DEFAULT '18:00:00',
                         working_days JSONB DEFAULT '[1,2,3,4,5]'::jsonb,
+                        ingest_rate_per_minute INTEGER NULL,
+                        ingest_burst INTEGER NULL,
+                        activity_retention_days INTEGER NULL,
+                        screenshot_retention_days INTEGER NULL,
                         last_modified_by INTEGER REFERENCES admin_users(id),
                         last_modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -104,6 +111,10 @@ def get_configuration():
                     office_start_time,
                     office_end_time,
                     working_days,
+                    ingest_rate_per_minute,
+                    ingest_burst,
+                    activity_retention_days,
+                    screenshot_retention_days,
                     last_modified_by,
                     last_modified_at,
                     created_at
@@ -130,6 +141,8 @@ def get_configuration():
                     ) VALUES (%s, 10, 5, '09:00:00', '18:00:00', %s::jsonb)
                     RETURNING id, company_id, screenshot_interval_minutes, idle_timeout_minutes,
                               office_start_time, office_end_time, working_days,
+                              ingest_rate_per_minute, ingest_burst,
+                              activity_retention_days, screenshot_retention_days,
                               last_modified_by, last_modified_at, created_at
                 """, (company_id, json.dumps(default_working_days)))
                 
@@ -158,6 +171,10 @@ def get_configuration():
                     'office_start_time': str(config['office_start_time']),
                     'office_end_time': str(config['office_end_time']),
                     'working_days': working_days,
+                    'ingest_rate_per_minute': config['ingest_rate_per_minute'],
+                    'ingest_burst': config['ingest_burst'],
+                    'activity_retention_days': config['activity_retention_days'],
+                    'screenshot_retention_days': config['screenshot_retention_days'],
                     'last_modified_by': config['last_modified_by'],
                     'last_modified_at': config['last_modified_at'].isoformat() if config['last_modified_at'] else None,
                     'created_at': config['created_at'].isoformat() if config['created_at'] else None
@@ -208,6 +225,13 @@ def update_configuration():
         office_end = config_data.get('office_end_time', '18:00:00')
         working_days = config_data.get('working_days', [1, 2, 3, 4, 5])
         
+        # Ingest limits and retention are only changed when sent (null = back to server default)
+        limit_updates = {
+            key: config_data[key]
+            for key in ('ingest_rate_per_minute', 'ingest_burst', 'activity_retention_days', 'screenshot_retention_days')
+            if key in config_data
+        }
+        
         # Validation
         if not (1 <= screenshot_interval <= 60):
             return jsonify({'error': 'Screenshot interval must be between 1 and 60 minutes'}), 400
@@ -222,6 +246,19 @@ def update_configuration():
         if not all(isinstance(day, int) and 0 <= day <= 6 for day in working_days):
             return jsonify({'error': 'Working days must contain integers between 0 (Sunday) and 6 (Saturday)'}), 400
         
+        rate = limit_updates.get('ingest_rate_per_minute')
+        if rate is not None and not (isinstance(rate, int) and not isinstance(rate, bool) and 0 <= rate <= 100000):
+            return jsonify({'error': 'Ingest rate must be between 0 (unlimited) and 100000 uploads per minute'}), 400
+        
+        burst = limit_updates.get('ingest_burst')
+        if burst is not None and not (isinstance(burst, int) and not isinstance(burst, bool) and 1 <= burst <= 10000):
+            return jsonify({'error': 'Ingest burst must be between 1 and 10000 uploads'}), 400
+        
+        for key in ('activity_retention_days', 'screenshot_retention_days'):
+            days = limit_updates.get(key)
+            if days is not None and not (isinstance(days, int) and not isinstance(days, bool) and 0 <= days <= 3650):
+                return jsonify({'error': 'Retention must be between 0 (keep forever) and 3650 days'}), 400
+        
         with get_db() as conn:
             cur = conn.cursor()
             
@@ -240,14 +277,15 @@ def update_configuration():
                 # Update existing configuration
                 print(f"✏️ Updating existing configuration (ID: {existing['id']})")
                 
-                cur.execute("""
+                limit_sets = ''.join(f"{key} = %s,\n                        " for key in limit_updates)
+                cur.execute(f"""
                     UPDATE company_configurations
                     SET screenshot_interval_minutes = %s,
                         idle_timeout_minutes = %s,
                         office_start_time = %s,
                         office_end_time = %s,
                         working_days = %s::jsonb,
-                        last_modified_by = %s,
+                        {limit_sets}last_modified_by = %s,
                         last_modified_at = %s
                     WHERE company_id = %s
                     RETURNING id, last_modified_at, created_at
@@ -257,6 +295,7 @@ def update_configuration():
                     office_start,
                     office_end,
                     working_days_json,
+                    *limit_updates.values(),
                     admin_id,  # FIXED: Now using admin_id (INTEGER)
                     get_ist_now(),
                     company_id
@@ -273,9 +312,13 @@ def update_configuration():
                         office_start_time,
                         office_end_time,
                         working_days,
+                        ingest_rate_per_minute,
+                        ingest_burst,
+                        activity_retention_days,
+                        screenshot_retention_days,
                         last_modified_by,
                         last_modified_at
-                    ) VALUES (%s, %s, %s, %s, %s, %s::jsonb, %s, %s)
+                    ) VALUES (%s, %s, %s, %s, %s, %s::jsonb, %s, %s, %s, %s, %s, %s)
                     RETURNING id, last_modified_at, created_at
                 """, (
                     company_id,
@@ -284,6 +327,10 @@ def update_configuration():
                     office_start,
                     office_end,
                     working_days_json,
+                    limit_updates.get('ingest_rate_per_minute'),
+                    limit_updates.get('ingest_burst'),
+                    limit_updates.get('activity_retention_days'),
+                    limit_updates.get('screenshot_retention_days'),
                     admin_id,  # FIXED: Now using admin_id (INTEGER)
                     get_ist_now()
                 ))
@@ -291,6 +338,10 @@ def update_configuration():
             result = cur.fetchone()
             conn.commit()
             
+            # Tracker auth cache holds the ingest limits
+            if 'ingest_rate_per_minute' in limit_updates or 'ingest_burst' in limit_updates:
+                invalidate_company(company_id)
+            
             print(f"✅ Configuration saved successfully")
             print(f"   Screenshot: {screenshot_interval}min, Idle: {idle_timeout}min")
             print(f"   Office: {office_start} - {office_end}")
@@ -364,7 +415,9 @@ def get_tracker_configuration():
                     idle_timeout_minutes,
                     office_start_time,
                     office_end_time,
-                    working_days
+                    working_days,
+                    ingest_rate_per_minute,
+                    ingest_burst
                 FROM company_configurations
                 WHERE company_id = %s
             """, (company_id,))
@@ -375,13 +428,16 @@ def get_tracker_configuration():
                 # Return defaults if no configuration exists
                 print(f"⚠️ No configuration found, returning defaults")
                 register_tracker(company_id, tracker_id)
+                rate, burst = ingest_limits(None)
                 return jsonify({
                     'success': True,
                     'screenshot_interval_minutes': 10,
                     'idle_timeout_minutes': 5,
                     'office_start_time': '09:00:00',
                     'office_end_time': '18:00:00',
-                    'working_days': [1, 2, 3, 4, 5]
+                    'working_days': [1, 2, 3, 4, 5],
+                    'ingest_rate_per_minute': rate,
+                    'ingest_burst': burst
                 }), 200
             
             # Parse working_days
@@ -394,6 +450,8 @@ def get_tracker_configuration():
             # Register this tracker as active
             register_tracker(company_id, tracker_id)
             
+            rate, burst = ingest_limits(config)
+            
             print(f"✅ Configuration sent to tracker: screenshot={config['screenshot_interval_minutes']}min, idle={config['idle_timeout_minutes']}min")
             print(f"📊 Total active trackers for company {company_id}: {get_active_tracker_count(company_id)}")
             
@@ -404,6 +462,8 @@ def get_tracker_configuration():
                 'office_start_time': str(config['office_start_time']),
                 'office_end_time': str(config['office_end_time']),
                 'working_days': working_days,
+                'ingest_rate_per_minute': rate,
+                'ingest_burst': burst,
                 'sync_interval_seconds': 300  # Tell tracker to re-sync every 5 minutes
             }), 200
             
@@ -9,11 +9,14 @@ DASHBOARD_ROUTES - ENHANCED WITH ACCURATE DATA AND FILTERS
 ✅ All timestamps in IST (Indian Standard Time)
 ✅ FIXED: Improved idle status detection with detailed logging
 ✅ NEW: Activity Trends endpoint for 7-day chart
+✅ Today's counters read from member_day_state (one row per member)
 """
 
 from flask import Blueprint, request, jsonify
 from admin_auth_routes import require_admin_auth
 from db import get_db, get_ist_now, convert_to_ist, IST
+from presence import apply_live_presence
+from member_day import get_member_day
 from datetime import datetime, timedelta
 
 dashboard_bp = Blueprint('dashboard', __name__)
@@ -26,6 +29,9 @@ def calculate_member_status(last_heartbeat_at, last_activity_at=None):
     """
     Calculate real-time member status based on heartbeat
     
+    Callers pass rows that went through apply_live_presence(), so heartbeats
+    not yet flushed to members.last_heartbeat_at are already included.
+    
     Rules:
     - Active: heartbeat within last 120 seconds (2 minutes)
     - Idle: heartbeat between 120-600 seconds (2-10 minutes)
@@ -133,7 +139,8 @@ def get_dashboard_stats():
         with get_db() as conn:
             cur = conn.cursor()
             
-            # Get all members with today's aggregated data
+            # Get all members with today's counters (one member_day_state row each,
+            # kept up to date by the upload path - the tracker sends cumulative values)
             cur.execute(
                 """
                 SELECT 
@@ -144,31 +151,20 @@ def get_dashboard_stats():
                     m.is_punched_in,
                     m.last_heartbeat_at,
                     m.last_activity_at,
-                    
-                    -- FIXED: Use MAX instead of SUM for cumulative tracker data
-                    -- The tracker sends cumulative values, not incremental
-                    COALESCE(MAX(al.total_seconds), 0) as screen_time_seconds,
-                    COALESCE(MAX(al.active_seconds), 0) as active_time_seconds,
-                    COALESCE(MAX(al.idle_seconds), 0) as idle_time_seconds,
-                    
-                    -- Screenshot count today
-                    COUNT(DISTINCT s.id) as screenshot_count
-                    
+                    COALESCE(d.screen_time_seconds, 0) as screen_time_seconds,
+                    COALESCE(d.active_time_seconds, 0) as active_time_seconds,
+                    COALESCE(d.idle_time_seconds, 0) as idle_time_seconds,
+                    COALESCE(d.screenshot_count, 0) as screenshot_count
                 FROM members m
-                LEFT JOIN activity_log al 
-                    ON al.member_id = m.id 
-                    AND DATE(al.timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Kolkata') = %s
-                LEFT JOIN screenshots s 
-                    ON s.member_id = m.id 
-                    AND s.tracking_date = %s
+                LEFT JOIN member_day_state d
+                    ON d.member_id = m.id 
+                    AND d.local_date = %s
                 WHERE m.company_id = %s AND m.is_active = TRUE
-                GROUP BY m.id, m.name, m.email, m.position, m.is_punched_in, 
-                         m.last_heartbeat_at, m.last_activity_at
                 ORDER BY m.name ASC
                 """,
-                (today, today, company_id)
+                (today, company_id)
             )
-            members = cur.fetchall()
+            members = apply_live_presence(cur.fetchall())
             
             print(f"📊 Found {len(members)} members for company {company_id}")
             
@@ -433,22 +429,16 @@ def get_member_live_counters(member_id):
             if not member:
                 return jsonify({'error': 'Member not found'}), 404
             
-            # Get today's aggregated data
-            cur.execute(
-                """
-                SELECT 
-                    COALESCE(MAX(total_seconds), 0) as screen_time_seconds,
-                    COALESCE(MAX(active_seconds), 0) as active_time_seconds,
-                    COALESCE(MAX(idle_seconds), 0) as idle_time_seconds,
-                    MAX(timestamp) as last_data_timestamp
-                FROM activity_log
-                WHERE member_id = %s 
-                  AND company_id = %s 
-                  AND DATE(timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Kolkata') = %s
-                """,
-                (member_id, company_id, today)
-            )
-            data = cur.fetchone()
+            apply_live_presence([member])
+            
+            # Today's counters
+            day = get_member_day(cur, company_id, member_id, today)
+            data = {
+                'screen_time_seconds': day['screen_time_seconds'] if day else 0,
+                'active_time_seconds': day['active_time_seconds'] if day else 0,
+                'idle_time_seconds': day['idle_time_seconds'] if day else 0,
+                'last_data_timestamp': day['last_activity_at'] if day else None
+            }
             
             # Calculate real-time status
             status, seconds_ago = calculate_member_status(
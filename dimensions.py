@@ -0,0 +1,210 @@
+"""
+DIMENSIONS.PY - Interned URL, domain, process and window title dimensions
+=========================================================================
+✅ dim_domains, dim_urls (→ domain), dim_processes and dim_window_titles
+   store each distinct string once under an integer id
+✅ activity_log rows reference them: process_id, window_title_id and
+   url_ids (the sample's browser history)
+✅ Ids are interned before the upload transaction, in one short
+   transaction per dimension with misses, and kept in a bounded in-process
+   LRU cache, so steady-state ingest adds no round trip; the upload uses
+   the ids intern_samples() returns, never a second cache read
+✅ Website analytics group by integer domain ids instead of parsing every
+   URL of every row in Python
+
+Dimension rows are never deleted, so a cached id stays valid. Interning
+commits on its own: an upload that rolls back can't leave the cache holding
+an id that doesn't exist. Requires scripts/add_dimensions.py.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from db import get_db
+from window_activity import WINDOW_TITLE_MAX_LENGTH
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+DIMENSION_CACHE_SIZE = int(os.getenv('DIMENSION_CACHE_SIZE', '100000'))
+
+URL_MAX_LENGTH = 2048
+NAME_MAX_LENGTH = 255
+
+# dimension -> (table, value column, unique key expression)
+DIMENSIONS = {
+    'domain': ('dim_domains', 'domain', 'domain'),
+    'url': ('dim_urls', 'url', 'md5(url)'),
+    'process': ('dim_processes', 'name', 'name'),
+    'window_title': ('dim_window_titles', 'title', 'md5(title)'),
+}
+
+_lock = threading.Lock()
+_cache = OrderedDict()   # (dimension, value) -> id, least recently used first
+_stats = {'hits': 0, 'misses': 0}
+
+
+# ============================================================================
+# NORMALIZATION
+# ============================================================================
+
+def normalize_process(value):
+    value = (value or '').strip() if isinstance(value, str) else ''
+    return value[:NAME_MAX_LENGTH] or None
+
+
+def normalize_window_title(value):
+    value = value if isinstance(value, str) else ''
+    return value[:WINDOW_TITLE_MAX_LENGTH] or None
+
+
+def sample_urls(sample):
+    """The sample's browser history URLs, truncated, in order (unusable entries dropped)"""
+    history = sample.get('browserhistory') or []
+    if not isinstance(history, list):
+        return []
+    return [url[:URL_MAX_LENGTH] for url in history if isinstance(url, str) and url and url != 'N/A']
+
+
+def url_domain(url):
+    parsed = urlparse(url)
+    return (parsed.netloc or parsed.path.split('/')[0])[:NAME_MAX_LENGTH]
+
+
+# ============================================================================
+# INTERNING
+# ============================================================================
+
+def _cached(dimension, values):
+    """{value: id} for the cached values; the rest are returned as misses"""
+    found, missing = {}, []
+    with _lock:
+        for value in values:
+            key = (dimension, value)
+            if key in _cache:
+                _cache.move_to_end(key)
+                found[value] = _cache[key]
+            else:
+                missing.append(value)
+    return found, missing
+
+
+def _remember(dimension, ids):
+    with _lock:
+        for value, dim_id in ids.items():
+            _cache[(dimension, value)] = dim_id
+            _cache.move_to_end((dimension, value))
+        while len(_cache) > DIMENSION_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def intern(dimension, values, extra=None):
+    """
+    Ids for normalized `values` of a dimension, creating missing rows.
+    `extra` maps a value to additional column values (dim_urls.domain_id).
+    Returns {value: id}.
+    """
+    values = sorted(set(v for v in values if v))
+    ids, missing = _cached(dimension, values)
+    with _lock:
+        _stats['hits'] += len(ids)
+        _stats['misses'] += len(missing)
+    if not missing:
+        return ids
+
+    table, column, key = DIMENSIONS[dimension]
+    with get_db() as conn:
+        cur = conn.cursor()
+        if dimension == 'url':
+            cur.execute(f"""
+                INSERT INTO {table} ({column}, domain_id)
+                SELECT * FROM unnest(%s::text[], %s::int[]) AS v({column}, domain_id)
+                ORDER BY 1
+                ON CONFLICT DO NOTHING
+            """, (missing, [extra[value] for value in missing]))
+        else:
+            cur.execute(f"""
+                INSERT INTO {table} ({column})
+                SELECT {column} FROM unnest(%s::text[]) AS v({column})
+                ORDER BY 1
+                ON CONFLICT DO NOTHING
+            """, (missing,))
+        cur.execute(f"""
+            SELECT id, {column} AS value FROM {table}
+            WHERE {key} IN (SELECT {key} FROM unnest(%s::text[]) AS v({column}))
+        """, (missing,))
+        created = {row['value']: row['id'] for row in cur.fetchall()}
+
+    _remember(dimension, created)
+    ids.update(created)
+    return ids
+
+
+def intern_samples(samples):
+    """
+    Intern every process, window title, URL and domain of `samples` (call
+    before the transaction that writes them). Returns {dimension: {value:
+    id}} for sample_dimension_ids(); the shared cache may evict entries at
+    any time, so rows are built from this mapping rather than the cache.
+    """
+    processes, titles, urls = set(), set(), set()
+    for sample in samples:
+        if not isinstance(sample, dict):
+            continue
+        processes.add(normalize_process(sample.get('currentprocess')))
+        titles.add(normalize_window_title(sample.get('currentwindow')))
+        urls.update(sample_urls(sample))
+
+    ids = {
+        'process': intern('process', processes),
+        'window_title': intern('window_title', titles),
+        'url': {}
+    }
+    if urls:
+        url_domains = {url: url_domain(url) for url in urls}
+        domain_ids = intern('domain', url_domains.values())
+        url_domain_ids = {url: domain_ids.get(domain) for url, domain in url_domains.items()}
+        ids['url'] = intern('url', [url for url in urls if url_domain_ids[url]], url_domain_ids)
+    return ids
+
+
+def sample_dimension_ids(sample, ids):
+    """(process_id, window_title_id, url_ids) for a sample, from the intern_samples() mapping"""
+    process = normalize_process(sample.get('currentprocess'))
+    title = normalize_window_title(sample.get('currentwindow'))
+    urls = sample_urls(sample)
+    return (
+        ids['process'].get(process),
+        ids['window_title'].get(title),
+        [ids['url'][url] for url in urls if url in ids['url']] or None
+    )
+
+
+def get_dimension_stats():
+    with _lock:
+        return {
+            'entries': len(_cache),
+            'capacity': DIMENSION_CACHE_SIZE,
+            'hits': _stats['hits'],
+            'misses': _stats['misses']
+        }
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'DIMENSIONS',
+    'normalize_process',
+    'normalize_window_title',
+    'sample_urls',
+    'url_domain',
+    'intern',
+    'intern_samples',
+    'sample_dimension_ids',
+    'get_dimension_stats'
+]
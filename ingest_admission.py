@@ -0,0 +1,82 @@
+"""
+INGEST_ADMISSION.PY - Per-company admission control for tracker uploads
+=======================================================================
+✅ Token bucket per company (shared by all workers via the presence store)
+✅ Limits per company from company_configurations, env defaults otherwise
+✅ Over the limit → 429 with Retry-After before any DB connection is taken
+✅ Batch uploads cost one token per sample
+
+Keeps one tenant's misconfigured trackers from draining the db.py pool.
+A rate of 0 disables the limit.
+"""
+
+import os
+import math
+import threading
+
+from flask import jsonify
+
+from presence import take_ingest_tokens
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+INGEST_RATE_PER_MINUTE = int(os.getenv('INGEST_RATE_PER_MINUTE', '1200'))
+INGEST_BURST = int(os.getenv('INGEST_BURST', '300'))
+
+_stats_lock = threading.Lock()
+_stats = {'admitted': 0, 'rejected': 0}
+
+
+def ingest_limits(company):
+    """(rate_per_minute, burst) for a company dict from load_tracker_company()"""
+    rate = company.get('ingest_rate_per_minute') if company else None
+    burst = company.get('ingest_burst') if company else None
+    rate = INGEST_RATE_PER_MINUTE if rate is None else rate
+    burst = INGEST_BURST if burst is None else burst
+    return rate, max(1, burst)
+
+
+def ingest_rejection(company_id, company, cost=1):
+    """
+    Charge `cost` against the company's bucket.
+    Returns None when admitted, otherwise a Flask (response, 429) tuple.
+    """
+    rate, burst = ingest_limits(company)
+    if rate <= 0:
+        return None
+
+    allowed, retry_after = take_ingest_tokens(company_id, rate, burst, cost)
+    with _stats_lock:
+        _stats['admitted' if allowed else 'rejected'] += 1
+    if allowed:
+        return None
+
+    retry_after = max(1, math.ceil(retry_after))
+    print(f"🚦 Ingest limit hit for company {company_id} ({rate}/min, burst {burst}), retry in {retry_after}s")
+    response = jsonify({
+        "success": False,
+        "error": "Upload rate limit exceeded",
+        "code": "RATE_LIMITED",
+        "retryafter": retry_after
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+
+def get_admission_stats():
+    """Admission counters (this worker) for the health endpoint"""
+    with _stats_lock:
+        return dict(_stats, default_rate_per_minute=INGEST_RATE_PER_MINUTE, default_burst=INGEST_BURST)
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'ingest_limits',
+    'ingest_rejection',
+    'get_admission_stats'
+]
@@ -0,0 +1,632 @@
+"""
+INGEST_SPOOL.PY - Durable local spool for tracker ingest
+========================================================
+✅ Accepted uploads are appended to a local segment file and fsynced before
+   the request returns (202), so a slow or down Postgres loses no samples
+✅ Group commit: concurrent appends share one write + fsync
+   (INGEST_SPOOL_FSYNC_WINDOW_MS)
+✅ One ordered stream per host: every worker appends to the same active
+   segment under a file lock, so per-device order (delta protocol) holds
+✅ A single drainer replays sealed segments into Postgres in batches, with a
+   persisted offset and exponential backoff while the database is unhealthy
+✅ Records that fail for any other reason are moved to a dead-letter file,
+   so one bad sample can't block every company's backlog
+✅ Spool depth and lag for the health endpoint
+
+Modes (INGEST_SPOOL_MODE):
+    off        never spool; database errors fail the request
+    fallback   write to Postgres directly, spool when the database is
+               unavailable and until the drainer has caught up with the
+               sealed segments again (default)
+    always     every upload goes through the spool
+
+Layout (under INGEST_SPOOL_PATH):
+    segments/active.log       segment being appended to (JSON lines)
+    segments/<ns>.seg         sealed segments, drained oldest first
+    blobs/<id>.bin            binary screenshot parts referenced by records
+    drain.progress            {"segment", "offset", "caught_up"} of the drainer
+    dead_letter.log           records that failed to replay (JSON lines with
+                              the error); their blobs are kept
+    spool.lock, drain.lock    cross-process locks
+
+Progress is recorded after every committed transaction, so a crash or an
+outage mid-chunk replays nothing that was already committed; client seq
+idempotency covers the one transaction that may have committed just
+before a crash. Only the errors the
+caller passes as retryable (database unavailable) stop the drain; any other
+failure replays the group record by record and dead-letters the records
+that still fail.
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from screenshot_pipeline import write_durable
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+INGEST_SPOOL_MODE = os.getenv('INGEST_SPOOL_MODE', 'fallback').lower()
+INGEST_SPOOL_PATH = os.getenv('INGEST_SPOOL_PATH', os.path.join(os.getcwd(), 'ingest_spool'))
+INGEST_SPOOL_SEGMENT_BYTES = int(os.getenv('INGEST_SPOOL_SEGMENT_BYTES', str(16 * 1024 * 1024)))
+INGEST_SPOOL_MAX_BYTES = int(os.getenv('INGEST_SPOOL_MAX_BYTES', str(1024 * 1024 * 1024)))
+INGEST_SPOOL_FSYNC_WINDOW_MS = float(os.getenv('INGEST_SPOOL_FSYNC_WINDOW_MS', '2'))
+INGEST_SPOOL_DRAIN_BATCH = int(os.getenv('INGEST_SPOOL_DRAIN_BATCH', '200'))
+INGEST_SPOOL_POLL_SECONDS = float(os.getenv('INGEST_SPOOL_POLL_SECONDS', '1.0'))
+INGEST_SPOOL_MAX_BACKOFF = float(os.getenv('INGEST_SPOOL_MAX_BACKOFF', '30'))
+
+SEGMENTS_DIR = os.path.join(INGEST_SPOOL_PATH, 'segments')
+BLOBS_DIR = os.path.join(INGEST_SPOOL_PATH, 'blobs')
+ACTIVE_SEGMENT = os.path.join(SEGMENTS_DIR, 'active.log')
+PROGRESS_PATH = os.path.join(INGEST_SPOOL_PATH, 'drain.progress')
+DEAD_LETTER_PATH = os.path.join(INGEST_SPOOL_PATH, 'dead_letter.log')
+SPOOL_LOCK_PATH = os.path.join(INGEST_SPOOL_PATH, 'spool.lock')
+DRAIN_LOCK_PATH = os.path.join(INGEST_SPOOL_PATH, 'drain.lock')
+
+
+class SpoolFullError(Exception):
+    """Raised when the spool holds more than INGEST_SPOOL_MAX_BYTES"""
+
+
+_stats_lock = threading.Lock()
+_stats = {
+    'spooled_records': 0,
+    'spooled_samples': 0,
+    'fsyncs': 0,
+    'drained_records': 0,
+    'drained_samples': 0,
+    'drain_rejected_samples': 0,
+    'drain_not_punched_in_samples': 0,
+    'drain_errors': 0,
+    'dead_letter_records': 0,
+    'dead_letter_samples': 0,
+    'corrupt_records': 0,
+    'rejected_spool_full': 0
+}
+_drain_state = {'last_error': None}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def spool_enabled():
+    return INGEST_SPOOL_MODE in ('fallback', 'always')
+
+
+def _ensure_dirs():
+    os.makedirs(SEGMENTS_DIR, exist_ok=True)
+    os.makedirs(BLOBS_DIR, exist_ok=True)
+
+
+# ============================================================================
+# CROSS-PROCESS LOCKS
+# ============================================================================
+
+_thread_locks = {SPOOL_LOCK_PATH: threading.Lock(), DRAIN_LOCK_PATH: threading.Lock()}
+
+
+class _file_lock:
+    """flock() on a lock file (plus a thread lock); non-blocking locks report via .acquired"""
+
+    def __init__(self, path, blocking=True):
+        self.path = path
+        self.blocking = blocking
+        self.acquired = False
+        self.fd = None
+
+    def __enter__(self):
+        if not _thread_locks[self.path].acquire(blocking=self.blocking):
+            return self
+        if fcntl is not None:
+            self.fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(self.fd)
+                self.fd = None
+                _thread_locks[self.path].release()
+                return self
+        self.acquired = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.acquired:
+            if self.fd is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+                os.close(self.fd)
+            _thread_locks[self.path].release()
+        return False
+
+
+# ============================================================================
+# APPEND (GROUP COMMIT)
+# ============================================================================
+
+_append_cond = threading.Condition()
+_append_queue = []
+_active = {'fd': None, 'ino': None}
+_writer_started = False
+
+
+def _open_active_locked():
+    """fd for the current active segment (reopened if another process sealed it)"""
+    try:
+        ino = os.stat(ACTIVE_SEGMENT).st_ino
+    except FileNotFoundError:
+        ino = None
+    if _active['fd'] is None or ino != _active['ino']:
+        if _active['fd'] is not None:
+            os.close(_active['fd'])
+        fd = os.open(ACTIVE_SEGMENT, os.O_CREAT | os.O_RDWR | os.O_APPEND, 0o644)
+        size = os.fstat(fd).st_size
+        os.lseek(fd, max(0, size - 1), os.SEEK_SET)
+        if size and os.read(fd, 1) != b'\n':
+            # A crash left a torn record: terminate it so the next record stays intact
+            os.write(fd, b'\n')
+        _active['fd'] = fd
+        _active['ino'] = os.fstat(fd).st_ino
+    return _active['fd']
+
+
+def _seal_active_locked():
+    """Rename a non-empty active segment to <ns>.seg (caller holds the spool lock)"""
+    try:
+        if os.path.getsize(ACTIVE_SEGMENT) == 0:
+            return False
+    except FileNotFoundError:
+        return False
+    os.replace(ACTIVE_SEGMENT, os.path.join(SEGMENTS_DIR, f"{time.time_ns()}.seg"))
+    return True
+
+
+def _writer_loop():
+    while True:
+        with _append_cond:
+            while not _append_queue:
+                _append_cond.wait()
+        time.sleep(INGEST_SPOOL_FSYNC_WINDOW_MS / 1000.0)
+        with _append_cond:
+            batch = list(_append_queue)
+            _append_queue.clear()
+
+        error = None
+        try:
+            data = b''.join(entry['data'] for entry in batch)
+            with _file_lock(SPOOL_LOCK_PATH):
+                fd = _open_active_locked()
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                os.fsync(fd)
+                if os.fstat(fd).st_size >= INGEST_SPOOL_SEGMENT_BYTES:
+                    _seal_active_locked()
+            _bump('fsyncs')
+        except Exception as e:
+            error = e
+            print(f"❌ Ingest spool write failed: {e}")
+        for entry in batch:
+            entry['error'] = error
+            entry['done'].set()
+
+
+def _start_writer():
+    global _writer_started
+    if _writer_started:
+        return
+    with _append_cond:
+        if _writer_started:
+            return
+        threading.Thread(target=_writer_loop, name='ingest-spool-writer', daemon=True).start()
+        _writer_started = True
+
+
+def _append_record(record):
+    """Append one record and wait until it is fsynced"""
+    entry = {
+        'data': json.dumps(record, separators=(',', ':'), default=str).encode('utf-8') + b'\n',
+        'done': threading.Event(),
+        'error': None
+    }
+    _start_writer()
+    with _append_cond:
+        _append_queue.append(entry)
+        _append_cond.notify()
+    entry['done'].wait()
+    if entry['error'] is not None:
+        raise entry['error']
+
+
+def spool_samples(company_id, samples, screenshots=None, punched_in=None):
+    """
+    Durably spool a batch of samples for later ingest.
+
+    screenshots maps sample index -> binary file part (multipart uploads);
+    base64 screenshots simply stay inside the sample JSON. punched_in lists
+    each sample's punched-in flag at receipt (None where unknown); replay
+    checks it instead of the member's state at drain time. Returns the
+    number of samples spooled. Raises SpoolFullError past INGEST_SPOOL_MAX_BYTES.
+    """
+    _ensure_dirs()
+    if _pending_bytes() >= INGEST_SPOOL_MAX_BYTES:
+        _bump('rejected_spool_full')
+        raise SpoolFullError(f"Ingest spool is full ({INGEST_SPOOL_MAX_BYTES} bytes)")
+
+    blob_names = {}
+    for index, part in (screenshots or {}).items():
+        name = f"{time.time_ns()}_{uuid.uuid4().hex[:12]}.bin"
+        stream = getattr(part, 'stream', part)
+        if hasattr(stream, 'seek'):
+            stream.seek(0)
+        write_durable(os.path.join(BLOBS_DIR, name), stream)
+        blob_names[str(index)] = name
+
+    _append_record({
+        'company_id': company_id,
+        'received_at': time.time(),
+        'samples': samples,
+        'screenshots': blob_names,
+        'punched_in': punched_in
+    })
+    _bump('spooled_records')
+    _bump('spooled_samples', len(samples))
+    _drain_wakeup.set()
+    return len(samples)
+
+
+# ============================================================================
+# BACKLOG
+# ============================================================================
+
+def _sealed_segments():
+    try:
+        return sorted(n for n in os.listdir(SEGMENTS_DIR) if n.endswith('.seg'))
+    except FileNotFoundError:
+        return []
+
+
+def has_backlog():
+    """
+    True while the drainer is behind on sealed segments (new uploads must
+    queue behind them). Once it has drained every segment sealed before it
+    caught up, the records still arriving in the active segment are a short
+    tail the drainer seals and replays on its next poll, so direct writes
+    resume without waiting for the active segment to empty.
+    """
+    return bool(_sealed_segments()) and not _read_progress().get('caught_up', False)
+
+
+def should_spool():
+    """Route this upload through the spool instead of writing to Postgres now?"""
+    return INGEST_SPOOL_MODE == 'always' or (INGEST_SPOOL_MODE == 'fallback' and has_backlog())
+
+
+def _read_progress():
+    try:
+        with open(PROGRESS_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'segment': None, 'offset': 0, 'caught_up': False}
+
+
+def _pending_bytes():
+    total = 0
+    for name in _sealed_segments():
+        try:
+            total += os.path.getsize(os.path.join(SEGMENTS_DIR, name))
+        except FileNotFoundError:
+            pass
+    try:
+        total += os.path.getsize(ACTIVE_SEGMENT)
+    except FileNotFoundError:
+        pass
+    return max(0, total - _read_progress().get('offset', 0))
+
+
+# ============================================================================
+# DRAINER
+# ============================================================================
+
+class SpooledScreenshot:
+    """Stand-in for a multipart file part during replay (screenshot_source() reads .stream)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.stream = open(path, 'rb')
+
+    def close(self):
+        self.stream.close()
+
+
+def _write_progress(segment, offset, caught_up):
+    write_durable(PROGRESS_PATH, json.dumps({
+        'segment': segment,
+        'offset': offset,
+        'caught_up': caught_up
+    }).encode('utf-8'))
+
+
+def _read_records(path, offset, max_samples):
+    """
+    Read whole records from offset until max_samples.
+    Returns ([(record, end offset)], new_offset).
+    """
+    records = []
+    samples = 0
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while samples < max_samples:
+            line = f.readline()
+            if not line:
+                break
+            if not line.endswith(b'\n'):
+                # Torn write from a crash: the writer never acknowledged it
+                _bump('corrupt_records')
+                offset = f.tell()
+                break
+            offset = f.tell()
+            try:
+                record = json.loads(line)
+            except ValueError:
+                _bump('corrupt_records')
+                continue
+            records.append((record, offset))
+            samples += len(record.get('samples') or [])
+    return records, offset
+
+
+def _replay_group(company_id, group, replay_batch):
+    """Replay same-company records in one transaction. Returns the per-sample results."""
+    samples = []
+    punched_in = []
+    files = {}
+    opened = []
+    try:
+        for record in group:
+            base = len(samples)
+            samples.extend(record.get('samples') or [])
+            states = record.get('punched_in') or []
+            punched_in.extend(states[i] if i < len(states) else None for i in range(len(samples) - base))
+            for index, name in (record.get('screenshots') or {}).items():
+                path = os.path.join(BLOBS_DIR, name)
+                if os.path.exists(path):
+                    part = SpooledScreenshot(path)
+                    opened.append(part)
+                    files[f"screenshot_{base + int(index)}"] = part
+        return replay_batch(company_id, samples, files, punched_in)
+    finally:
+        for part in opened:
+            part.close()
+
+
+def _dead_letter(record, error):
+    """Append a record that can't be replayed to the dead-letter file (fsynced)"""
+    line = json.dumps({
+        'failed_at': time.time(),
+        'error': f"{type(error).__name__}: {error}",
+        'record': record
+    }, separators=(',', ':'), default=str).encode('utf-8') + b'\n'
+    with open(DEAD_LETTER_PATH, 'ab') as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    _bump('dead_letter_records')
+    _bump('dead_letter_samples', len(record.get('samples') or []))
+    print(f"❌ Ingest spool: dead-lettered a record of company {record.get('company_id')}: {error}")
+
+
+def _count_replayed(records, results):
+    accepted = sum(1 for r in results if r['accepted'])
+    not_punched_in = sum(1 for r in results if r.get('code') == 'NOT_PUNCHED_IN')
+    _bump('drained_records', len(records))
+    _bump('drained_samples', accepted)
+    _bump('drain_not_punched_in_samples', not_punched_in)
+    _bump('drain_rejected_samples', len(results) - accepted - not_punched_in)
+
+
+def _replay(entries, replay_batch, committed, retry_errors=()):
+    """
+    Replay (record, end offset) entries in order, one transaction per run of
+    same-company records. committed(records, end, dead) is called after
+    each transaction (and each dead-lettered record) with the end offset of
+    its last record, so progress never trails a committed group.
+    retry_errors propagate (the segment is retried); a group failing with
+    anything else is replayed record by record and the records that still
+    fail are dead-lettered.
+    """
+    groups = []
+    for record, end in entries:
+        if groups and groups[-1][0] == record['company_id'] and len(groups[-1][1]) < INGEST_SPOOL_DRAIN_BATCH:
+            groups[-1][1].append((record, end))
+        else:
+            groups.append((record['company_id'], [(record, end)]))
+
+    for company_id, group in groups:
+        records = [record for record, _ in group]
+        try:
+            results = _replay_group(company_id, records, replay_batch)
+        except retry_errors:
+            raise
+        except Exception as e:
+            print(f"⚠️ Ingest spool: replay of {len(group)} records failed ({e}); retrying one by one")
+            for record, end in group:
+                try:
+                    results = _replay_group(company_id, [record], replay_batch)
+                except retry_errors:
+                    raise
+                except Exception as record_error:
+                    _dead_letter(record, record_error)
+                    committed([record], end, [record])
+                    continue
+                _count_replayed([record], results)
+                committed([record], end, [])
+            continue
+        _count_replayed(records, results)
+        committed(records, group[-1][1], [])
+
+
+def _remove_blobs(records, keep=()):
+    for record in records:
+        if any(record is kept for kept in keep):
+            continue
+        for name in (record.get('screenshots') or {}).values():
+            try:
+                os.remove(os.path.join(BLOBS_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+def drain_once(replay_batch, retry_errors=()):
+    """
+    Drain the oldest sealed segment (sealing the active one when nothing else
+    is waiting). replay_batch(company_id, samples, files, punched_in) must
+    ingest the samples in one transaction and return the per-sample results
+    ({'accepted', 'code'}); punched_in holds each sample's punched-in flag
+    at receipt (None where unknown). Errors in
+    retry_errors leave the segment to be retried and put fallback mode back
+    into spooling; records failing otherwise are dead-lettered. Returns True
+    if anything was drained.
+    """
+    with _file_lock(DRAIN_LOCK_PATH, blocking=False) as lock:
+        if not lock.acquired:
+            return False
+
+        segments = _sealed_segments()
+        if not segments:
+            with _file_lock(SPOOL_LOCK_PATH):
+                _seal_active_locked()
+            segments = _sealed_segments()
+            if not segments:
+                return False
+
+        segment = segments[0]
+        path = os.path.join(SEGMENTS_DIR, segment)
+        progress = _read_progress()
+        offset = progress['offset'] if progress.get('segment') == segment else 0
+        caught_up = progress.get('caught_up', False)
+
+        def committed(records, end, dead):
+            nonlocal offset
+            _write_progress(segment, end, caught_up)
+            _remove_blobs(records, keep=dead)
+            offset = end
+
+        while True:
+            entries, new_offset = _read_records(path, offset, INGEST_SPOOL_DRAIN_BATCH)
+            if not entries and new_offset == offset:
+                break
+            try:
+                _replay(entries, replay_batch, committed, retry_errors)
+            except retry_errors:
+                if caught_up:
+                    _write_progress(segment, offset, False)
+                raise
+            if new_offset != offset:
+                # Skipped corrupt lines after the last record
+                _write_progress(segment, new_offset, caught_up)
+                offset = new_offset
+
+        os.remove(path)
+        _write_progress(None, 0, caught_up or not _sealed_segments())
+        print(f"✅ Ingest spool: drained segment {segment}")
+        return True
+
+
+_drain_wakeup = threading.Event()
+_drainer_lock = threading.Lock()
+_drainer_started = False
+
+
+def _drain_loop():
+    from tracker_routes import replay_spooled_batch, DB_UNAVAILABLE_ERRORS
+
+    backoff = 1.0
+    while True:
+        try:
+            drained = drain_once(replay_spooled_batch, DB_UNAVAILABLE_ERRORS)
+            backoff = 1.0
+            _drain_state['last_error'] = None
+        except Exception as e:
+            drained = False
+            _bump('drain_errors')
+            _drain_state['last_error'] = str(e)
+            print(f"⚠️ Ingest spool drain failed (retry in {backoff:.0f}s): {e}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, INGEST_SPOOL_MAX_BACKOFF)
+            continue
+        if not drained:
+            _drain_wakeup.wait(INGEST_SPOOL_POLL_SECONDS)
+            _drain_wakeup.clear()
+
+
+def start_ingest_spool():
+    """Start the drainer thread for this process (idempotent; one process drains at a time)"""
+    global _drainer_started
+    if not spool_enabled() or _drainer_started:
+        return
+    with _drainer_lock:
+        if _drainer_started:
+            return
+        _ensure_dirs()
+        threading.Thread(target=_drain_loop, name='ingest-spool-drainer', daemon=True).start()
+        _drainer_started = True
+        print(f"📼 Ingest spool drainer started (mode={INGEST_SPOOL_MODE}, path={INGEST_SPOOL_PATH})")
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+def _oldest_pending_received_at():
+    segments = _sealed_segments()
+    path = os.path.join(SEGMENTS_DIR, segments[0]) if segments else ACTIVE_SEGMENT
+    progress = _read_progress()
+    offset = progress['offset'] if segments and progress.get('segment') == segments[0] else 0
+    try:
+        records, _ = _read_records(path, offset, 1)
+    except FileNotFoundError:
+        return None
+    return records[0][0].get('received_at') if records else None
+
+
+def get_spool_stats():
+    """Spool depth/lag and counters (this worker) for the health endpoint"""
+    with _stats_lock:
+        stats = dict(_stats)
+    oldest = _oldest_pending_received_at() if spool_enabled() else None
+    stats.update({
+        'mode': INGEST_SPOOL_MODE,
+        'pending_segments': len(_sealed_segments()),
+        'pending_bytes': _pending_bytes(),
+        'max_bytes': INGEST_SPOOL_MAX_BYTES,
+        'lag_seconds': round(time.time() - oldest, 1) if oldest else 0,
+        'last_drain_error': _drain_state['last_error']
+    })
+    return stats
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'SpoolFullError',
+    'spool_enabled',
+    'should_spool',
+    'has_backlog',
+    'spool_samples',
+    'drain_once',
+    'start_ingest_spool',
+    'get_spool_stats',
+    'INGEST_SPOOL_MODE'
+]
@@ -5,6 +5,7 @@ from psycopg2.extras import RealDictCursor
 import os
 from datetime import datetime, timedelta
 import secrets
+from tracker_cache import invalidate_company
 
 license_bp = Blueprint('license', __name__)
 
@@ -195,6 +196,9 @@ def deactivate_company(company_id):
         cur.close()
         conn.close()
         
+        # Trackers of every worker must stop authenticating with the old verdict
+        invalidate_company(company_id)
+        
         return jsonify({
             'message': f'Company {result["company_name"]} deactivated successfully'
         }), 200
@@ -0,0 +1,96 @@
+"""
+MEMBER_DAY.PY - Per member, per local day counters maintained at ingest
+======================================================================
+✅ member_day_state holds one row per (member, local date): the day's
+   screen/active/idle counters, first and last sample, sample and
+   screenshot counts
+✅ Upserted in the same statement that writes activity_log (a CTE over the
+   inserted rows) and by the screenshot pipeline, so it never drifts from
+   what was committed
+✅ Dashboards read one row per member instead of aggregating the day's
+   activity_log and screenshots rows
+
+Counters keep the day's maximum, matching the cumulative values trackers
+send (what MAX(total_seconds) over the day returned). Local dates are
+Asia/Kolkata, like the dashboard. Requires scripts/add_member_day_state.py.
+"""
+
+# Same zone as db.IST; not imported from db so the screenshot pipeline's
+# transcode workers can import this module without a database
+LOCAL_TIMEZONE = 'Asia/Kolkata'
+
+# Local date of a UTC (naive) timestamp expression
+LOCAL_DATE_SQL = "(({expr}) AT TIME ZONE 'UTC' AT TIME ZONE '" + LOCAL_TIMEZONE + "')::date"
+
+# Columns an activity_log insert must RETURN for MEMBER_DAY_FROM_INSERT
+ACTIVITY_RETURNING = "company_id, member_id, timestamp, total_seconds, active_seconds, idle_seconds"
+
+# CTE folding the rows of a preceding `ins` CTE (an activity_log insert
+# returning ACTIVITY_RETURNING) into member_day_state. Members are upserted
+# in id order so concurrent batches lock rows in the same order.
+MEMBER_DAY_FROM_INSERT = f"""
+    day AS (
+        INSERT INTO member_day_state (
+            company_id, member_id, local_date, screen_time_seconds, active_time_seconds,
+            idle_time_seconds, first_activity_at, last_activity_at, sample_count
+        )
+        SELECT company_id, member_id, {LOCAL_DATE_SQL.format(expr='timestamp')},
+               MAX(total_seconds), MAX(active_seconds), MAX(idle_seconds),
+               MIN(timestamp), MAX(timestamp), COUNT(*)
+        FROM ins
+        WHERE member_id IS NOT NULL
+        GROUP BY 1, 2, 3
+        ORDER BY 2, 3
+        ON CONFLICT (member_id, local_date) DO UPDATE
+        SET screen_time_seconds = GREATEST(member_day_state.screen_time_seconds, EXCLUDED.screen_time_seconds),
+            active_time_seconds = GREATEST(member_day_state.active_time_seconds, EXCLUDED.active_time_seconds),
+            idle_time_seconds = GREATEST(member_day_state.idle_time_seconds, EXCLUDED.idle_time_seconds),
+            first_activity_at = LEAST(member_day_state.first_activity_at, EXCLUDED.first_activity_at),
+            last_activity_at = GREATEST(member_day_state.last_activity_at, EXCLUDED.last_activity_at),
+            sample_count = member_day_state.sample_count + EXCLUDED.sample_count,
+            updated_at = CURRENT_TIMESTAMP
+    )
+"""
+
+MEMBER_DAY_COLUMNS = """
+    screen_time_seconds, active_time_seconds, idle_time_seconds,
+    first_activity_at, last_activity_at, sample_count, screenshot_count
+"""
+
+
+def record_screenshot(cur, company_id, member_id, timestamp):
+    """Count a stored screenshot on its member's local day"""
+    if member_id is None or timestamp is None:
+        return
+    cur.execute(f"""
+        INSERT INTO member_day_state (company_id, member_id, local_date, screenshot_count)
+        VALUES (%s, %s, {LOCAL_DATE_SQL.format(expr='%s::timestamp')}, 1)
+        ON CONFLICT (member_id, local_date) DO UPDATE
+        SET screenshot_count = member_day_state.screenshot_count + 1,
+            updated_at = CURRENT_TIMESTAMP
+    """, (company_id, member_id, timestamp))
+
+
+def get_member_day(cur, company_id, member_id, local_date):
+    """The member's member_day_state row for a local date, or None"""
+    cur.execute(f"""
+        SELECT {MEMBER_DAY_COLUMNS}
+        FROM member_day_state
+        WHERE member_id = %s AND local_date = %s AND company_id = %s
+    """, (member_id, local_date, company_id))
+    return cur.fetchone()
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'LOCAL_TIMEZONE',
+    'LOCAL_DATE_SQL',
+    'ACTIVITY_RETURNING',
+    'MEMBER_DAY_FROM_INSERT',
+    'MEMBER_DAY_COLUMNS',
+    'record_screenshot',
+    'get_member_day'
+]
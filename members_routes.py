@@ -10,6 +10,9 @@ MEMBERS_ROUTES.PY - SAFE VERSION (Handles both name and full_name)
 from flask import Blueprint, request, jsonify
 from admin_auth_routes import require_admin_auth
 from db import get_db
+from tracker_cache import invalidate_identities
+from presence import forget_member
+from screenshot_pipeline import NEAR_DUP_POLICIES
 
 members_bp = Blueprint('members', __name__)
 
@@ -88,6 +91,8 @@ def create_member():
             
             cur.execute(query, (company_id, email, name, position, department, admin_id))
             member = cur.fetchone()
+            conn.commit()
+            invalidate_identities(company_id)
             
             return jsonify({
                 'success': True,
@@ -223,6 +228,7 @@ def get_member(member_id):
                     m.position,
                     m.department,
                     m.is_active,
+                    m.screenshot_near_dup_policy,
                     m.last_activity_at,
                     m.created_at
                 FROM members m
@@ -311,6 +317,13 @@ def update_member(member_id):
             if 'is_active' in data:
                 update_fields.append("is_active = %s")
                 params.append(data['is_active'])
+            if 'screenshot_near_dup_policy' in data:
+                # null = company default (SCREENSHOT_NEAR_DUP_POLICY)
+                policy = data['screenshot_near_dup_policy']
+                if policy is not None and policy not in NEAR_DUP_POLICIES:
+                    return jsonify({'error': f"screenshot_near_dup_policy must be one of: {', '.join(NEAR_DUP_POLICIES)}"}), 400
+                update_fields.append("screenshot_near_dup_policy = %s")
+                params.append(policy)
             
             if not update_fields:
                 return jsonify({'error': 'No fields to update'}), 400
@@ -322,7 +335,8 @@ def update_member(member_id):
                 UPDATE members
                 SET {', '.join(update_fields)}
                 WHERE company_id = %s AND id = %s
-                RETURNING id, email, {name_column} as name, position, department, is_active
+                RETURNING id, email, {name_column} as name, position, department, is_active,
+                          screenshot_near_dup_policy
             """
             
             cur.execute(query, params)
@@ -331,6 +345,9 @@ def update_member(member_id):
             if not member:
                 return jsonify({'error': 'Member not found'}), 404
             
+            conn.commit()
+            invalidate_identities(company_id)
+            
             return jsonify({
                 'success': True,
                 'member': member
@@ -375,6 +392,10 @@ def delete_member(member_id):
             if cur.rowcount == 0:
                 return jsonify({'error': 'Member not found'}), 404
             
+            conn.commit()
+            invalidate_identities(company_id)
+            forget_member(member_id)
+            
             return jsonify({
                 'success': True,
                 'message': 'Member deleted successfully'
@@ -0,0 +1,326 @@
+"""
+PARTITIONS.PY - Time partitioning for activity_log and screenshots
+==================================================================
+✅ activity_log is range-partitioned on `timestamp`, screenshots on
+   `tracking_date` (the columns route queries filter on), so time-bounded
+   queries only touch the partitions in range
+✅ Monthly or weekly partitions (TIME_PARTITION_INTERVAL), created
+   TIME_PARTITION_PREMAKE periods ahead by a background thread; one worker
+   per run does the DDL (advisory lock), the others skip
+✅ A DEFAULT partition catches rows outside every range (clock-skewed
+   tracker timestamps) instead of failing the insert; when a range that
+   holds some of them becomes due, they are moved into the new partition
+✅ Retention drops whole partitions (drop_partitions_before) instead of
+   running DELETEs
+
+Partitions are named <table>_p<YYYYMMDD> after the first day they hold.
+Tables that are not partitioned yet (scripts/partition_time_tables.py
+converts them) are left alone.
+"""
+
+import os
+import re
+import time
+import threading
+from datetime import date, datetime, timedelta
+
+from db import get_db
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+PARTITION_INTERVAL = os.getenv('TIME_PARTITION_INTERVAL', 'month').lower()
+PARTITION_PREMAKE = int(os.getenv('TIME_PARTITION_PREMAKE', '2'))
+PARTITION_MAINTENANCE_SECONDS = float(os.getenv('TIME_PARTITION_MAINTENANCE_SECONDS', '21600'))
+
+# table -> partition key
+PARTITIONED_TABLES = {
+    'activity_log': 'timestamp',
+    'screenshots': 'tracking_date',
+}
+
+PARTITION_INTERVALS = ('month', 'week')
+
+# pg_advisory_xact_lock key for partition DDL
+PARTITION_LOCK_KEY = 0x70617274
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+# ============================================================================
+# PERIODS
+# ============================================================================
+
+def period_start(day, interval=None):
+    """First day of the month / ISO week containing `day`"""
+    interval = interval or PARTITION_INTERVAL
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period(start, interval=None):
+    interval = interval or PARTITION_INTERVAL
+    if interval == 'week':
+        return start + timedelta(days=7)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(table, start):
+    return f"{table}_p{start.strftime('%Y%m%d')}"
+
+
+# ============================================================================
+# CATALOG
+# ============================================================================
+
+def is_partitioned(cur, table):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return bool(row) and row['relkind'] == 'p'
+
+
+def _relation_exists(cur, name):
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL AS present", (name,))
+    return cur.fetchone()['present']
+
+
+def list_partitions(cur, table):
+    """
+    Range partitions of `table` as dicts (name, start, end) ordered by
+    start; the default partition is returned with start/end None.
+    """
+    cur.execute("""
+        SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (table,))
+    partitions = []
+    for row in cur.fetchall():
+        match = _BOUND_RE.search(row['bound'] or '')
+        if match:
+            start, end = (datetime.strptime(v[:10], '%Y-%m-%d').date() for v in match.groups())
+        else:
+            start = end = None
+        partitions.append({'name': row['name'], 'start': start, 'end': end})
+    return sorted(partitions, key=lambda p: (p['start'] is not None, p['start'] or date.min))
+
+
+def create_partition(cur, table, start, end, prefix=None):
+    """
+    Range partition [start, end); named after `prefix` (default: the table).
+    Rows of the default partition that fall in the range would make the
+    CREATE fail, so the default partition is detached, those rows are moved
+    into the new partition and it is attached again.
+    """
+    name = partition_name(prefix or table, start)
+    key = PARTITIONED_TABLES.get(prefix or table)
+    default = next((p['name'] for p in list_partitions(cur, table) if p['start'] is None), None)
+    stranded = False
+    if key and default and not _relation_exists(cur, name):
+        cur.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {key} >= %s AND {key} < %s) AS stranded",
+            (start, end)
+        )
+        stranded = cur.fetchone()['stranded']
+
+    if stranded:
+        cur.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+    cur.execute(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+        (start.isoformat(), end.isoformat())
+    )
+    if stranded:
+        cur.execute("""
+            SELECT string_agg(quote_ident(column_name), ', ' ORDER BY ordinal_position) AS columns
+            FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s
+        """, (default,))
+        columns = cur.fetchone()['columns']
+        cur.execute(
+            f"INSERT INTO {name} ({columns}) SELECT {columns} FROM {default} WHERE {key} >= %s AND {key} < %s",
+            (start, end)
+        )
+        moved = cur.rowcount
+        cur.execute(f"DELETE FROM {default} WHERE {key} >= %s AND {key} < %s", (start, end))
+        cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+        print(f"🗂️ Moved {moved} rows from {default} into {name}")
+    return name
+
+
+def create_default_partition(cur, table, prefix=None):
+    name = f"{prefix or table}_default"
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} DEFAULT")
+    return name
+
+
+# ============================================================================
+# MAINTENANCE
+# ============================================================================
+
+def ensure_partitions(cur, table, ahead=None, today=None, prefix=None):
+    """
+    Create the missing partitions of `table` from the current period up to
+    `ahead` periods past it. Existing ranges are skipped and never
+    overlapped, so ranges left by an earlier TIME_PARTITION_INTERVAL or by
+    skewed data are fine. Returns the names created.
+    """
+    ahead = PARTITION_PREMAKE if ahead is None else ahead
+    today = today or datetime.utcnow().date()
+    ranges = [p for p in list_partitions(cur, table) if p['start'] is not None]
+
+    target = period_start(today)
+    for _ in range(ahead + 1):
+        target = next_period(target)
+
+    start = period_start(today)
+    created = []
+    while start < target:
+        covering = next((p for p in ranges if p['start'] <= start < p['end']), None)
+        if covering:
+            start = covering['end']
+            continue
+        end = next_period(period_start(start))
+        following = [p['start'] for p in ranges if start < p['start'] < end]
+        end = min(following) if following else end
+        created.append(create_partition(cur, table, start, end, prefix))
+        start = end
+    return created
+
+
+def drop_partitions_before(cur, table, cutoff, before_drop=None):
+    """
+    Detach and drop every range partition of `table` that ends on or before
+    `cutoff` (a date). before_drop(cur, name) runs first for each partition
+    (e.g. to release what its rows reference). Returns [(name, bytes)] of
+    what was dropped.
+    """
+    dropped = []
+    for partition in list_partitions(cur, table):
+        if partition['end'] is None or partition['end'] > cutoff:
+            continue
+        if before_drop is not None:
+            before_drop(cur, partition['name'])
+        cur.execute("SELECT pg_total_relation_size(%s) AS bytes", (partition['name'],))
+        size = cur.fetchone()['bytes']
+        cur.execute(f"ALTER TABLE {table} DETACH PARTITION {partition['name']}")
+        cur.execute(f"DROP TABLE {partition['name']}")
+        dropped.append((partition['name'], size))
+    return dropped
+
+
+_maintenance_lock = threading.Lock()
+_maintenance_thread = None
+_maintenance_stats = {
+    'runs': 0,
+    'partitions_created': 0,
+    'errors': 0,
+    'last_run_at': None,
+    'last_error': None,
+    'default_partition_rows': {}
+}
+
+
+def run_partition_maintenance():
+    """
+    Create upcoming partitions for every partitioned table, each under its
+    own savepoint so one table's failure doesn't roll back the others.
+    Returns the names created.
+    """
+    created = []
+    errors = []
+    default_rows = {}
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (PARTITION_LOCK_KEY,))
+        if not cur.fetchone()['locked']:
+            return created
+        # Partition DDL briefly locks the parent; give up rather than queue behind long queries
+        cur.execute("SET LOCAL lock_timeout = '5s'")
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(cur, table):
+                continue
+            cur.execute("SAVEPOINT partition_table")
+            try:
+                created.extend(ensure_partitions(cur, table))
+                cur.execute("RELEASE SAVEPOINT partition_table")
+            except Exception as e:
+                cur.execute("ROLLBACK TO SAVEPOINT partition_table")
+                print(f"⚠️ Partition maintenance of {table} failed: {e}")
+                errors.append(f"{table}: {e}")
+            default_name = f"{table}_default"
+            if _relation_exists(cur, default_name):
+                cur.execute(f"SELECT COUNT(*) AS n FROM (SELECT 1 FROM {default_name} LIMIT 1000) d")
+                default_rows[table] = cur.fetchone()['n']
+
+    for table, rows in default_rows.items():
+        if rows:
+            print(f"⚠️ {table}_default holds {rows}{'+' if rows >= 1000 else ''} rows outside every partition range")
+    if created:
+        print(f"🗂️ Created partitions: {', '.join(created)}")
+
+    with _maintenance_lock:
+        _maintenance_stats['runs'] += 1
+        _maintenance_stats['partitions_created'] += len(created)
+        _maintenance_stats['errors'] += len(errors)
+        _maintenance_stats['last_error'] = '; '.join(errors) or None
+        _maintenance_stats['last_run_at'] = datetime.utcnow().isoformat()
+        _maintenance_stats['default_partition_rows'] = default_rows
+    return created
+
+
+def _maintenance_loop():
+    while True:
+        try:
+            run_partition_maintenance()
+        except Exception as e:
+            print(f"⚠️ Partition maintenance error: {e}")
+            with _maintenance_lock:
+                _maintenance_stats['errors'] += 1
+                _maintenance_stats['last_error'] = str(e)
+        time.sleep(PARTITION_MAINTENANCE_SECONDS)
+
+
+def start_partition_maintenance():
+    """Start this worker's partition maintenance thread (idempotent)"""
+    global _maintenance_thread
+    if PARTITION_INTERVAL not in PARTITION_INTERVALS:
+        print(f"⚠️ TIME_PARTITION_INTERVAL must be one of {', '.join(PARTITION_INTERVALS)}; partition maintenance disabled")
+        return
+    with _maintenance_lock:
+        if _maintenance_thread is not None and _maintenance_thread.is_alive():
+            return
+        _maintenance_thread = threading.Thread(target=_maintenance_loop, name='partition-maintenance', daemon=True)
+        _maintenance_thread.start()
+    print(f"🗂️ Partition maintenance started ({PARTITION_INTERVAL}ly, {PARTITION_PREMAKE} ahead)")
+
+
+def get_partition_stats():
+    with _maintenance_lock:
+        stats = dict(_maintenance_stats)
+    stats.update({'interval': PARTITION_INTERVAL, 'premake': PARTITION_PREMAKE})
+    return stats
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'PARTITION_INTERVAL',
+    'PARTITIONED_TABLES',
+    'period_start',
+    'next_period',
+    'partition_name',
+    'is_partitioned',
+    'list_partitions',
+    'create_partition',
+    'create_default_partition',
+    'ensure_partitions',
+    'drop_partitions_before',
+    'run_partition_maintenance',
+    'start_partition_maintenance',
+    'get_partition_stats'
+]
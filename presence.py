@@ -0,0 +1,574 @@
+"""
+PRESENCE.PY - Shared Member Presence Store
+==========================================
+✅ Punched-in flag per member, shared by every gunicorn worker on the host
+✅ Backed by SQLite on tmpfs (/dev/shm) - no Postgres round trip on the hot path
+✅ Read-through: a miss (or an entry older than PRESENCE_PUNCH_TTL) falls back to
+   members.is_punched_in and seeds the store without overwriting newer punches
+✅ Per-company identity generations so member/device edits invalidate the
+   identity caches of all workers
+✅ Per-company auth generations so token, status and ingest limit changes
+   invalidate the tracker auth caches of all workers
+✅ Per-company ingest token buckets shared by every worker (admission control)
+✅ Write-behind presence: member last activity/heartbeat/status and device
+   last_seen_at live here and are flushed to Postgres in batched
+   UPDATE ... FROM (VALUES ...) every PRESENCE_FLUSH_INTERVAL seconds,
+   or immediately when a member's status changes
+
+Postgres stays the source of truth for punches: every punch path commits
+first and then records the new state here. Presence timestamps are at most
+one flush interval behind in Postgres (and lost if the host reboots before
+a flush), so readers that need them live should use get_member_presence().
+"""
+
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+_default_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+PRESENCE_DB_PATH = os.getenv('PRESENCE_DB_PATH', os.path.join(_default_dir, 'workeye_presence.sqlite3'))
+PRESENCE_PUNCH_TTL = int(os.getenv('PRESENCE_PUNCH_TTL', '300'))
+PRESENCE_FLUSH_INTERVAL = float(os.getenv('PRESENCE_FLUSH_INTERVAL', '5'))
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_paths = set()
+_flusher_lock = threading.Lock()
+_flusher_thread = None
+_flush_stats = {
+    'flushes': 0,
+    'members_flushed': 0,
+    'devices_flushed': 0,
+    'flush_errors': 0,
+    'last_flush_ms': None
+}
+
+
+# ============================================================================
+# CONNECTION
+# ============================================================================
+
+def _connect():
+    """Per-thread SQLite connection to the shared presence file"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and getattr(_local, 'path', None) == PRESENCE_DB_PATH:
+        return conn
+
+    conn = sqlite3.connect(PRESENCE_DB_PATH, timeout=5, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    with _init_lock:
+        if PRESENCE_DB_PATH not in _initialized_paths:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS punch_state (
+                    member_id INTEGER PRIMARY KEY,
+                    company_id INTEGER NOT NULL,
+                    is_punched_in INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS member_presence (
+                    member_id INTEGER PRIMARY KEY,
+                    company_id INTEGER NOT NULL,
+                    status TEXT,
+                    last_activity_at REAL,
+                    last_heartbeat_at REAL,
+                    dirty INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS device_presence (
+                    device_db_id INTEGER PRIMARY KEY,
+                    company_id INTEGER NOT NULL,
+                    last_seen_at REAL NOT NULL,
+                    dirty INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS identity_generation (
+                    company_id INTEGER PRIMARY KEY,
+                    generation INTEGER NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS auth_generation (
+                    company_id INTEGER PRIMARY KEY,
+                    generation INTEGER NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_bucket (
+                    company_id INTEGER PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            _initialized_paths.add(PRESENCE_DB_PATH)
+
+    _local.conn = conn
+    _local.path = PRESENCE_DB_PATH
+    return conn
+
+
+class _transaction:
+    """BEGIN IMMEDIATE ... COMMIT on an autocommit SQLite connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def _to_epoch(ts):
+    """datetime (naive = UTC) or epoch seconds → epoch seconds"""
+    if ts is None:
+        return time.time()
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def _to_utc_naive(epoch):
+    """epoch seconds → naive UTC datetime (how members/devices timestamps are stored)"""
+    if epoch is None:
+        return None
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).replace(tzinfo=None)
+
+
+# ============================================================================
+# PUNCH STATE
+# ============================================================================
+
+def get_punched_in(member_id):
+    """
+    Punched-in flag from the shared store.
+    Returns True/False, or None when unknown or older than PRESENCE_PUNCH_TTL.
+    """
+    try:
+        row = _connect().execute(
+            "SELECT is_punched_in, updated_at FROM punch_state WHERE member_id = ?",
+            (member_id,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"⚠️ Presence read failed for member {member_id}: {e}")
+        return None
+
+    if not row or row[1] < time.time() - PRESENCE_PUNCH_TTL:
+        return None
+    return bool(row[0])
+
+
+def set_punched_in(company_id, member_id, is_punched_in):
+    """
+    Record a committed punch-in/punch-out (always wins over older entries).
+    The member's presence status follows the punch ('active' / 'offline'),
+    matching what the punch transaction wrote to members.status.
+    """
+    status = 'active' if is_punched_in else 'offline'
+    try:
+        conn = _connect()
+        with _transaction(conn):
+            conn.execute("""
+                INSERT INTO punch_state (member_id, company_id, is_punched_in, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(member_id) DO UPDATE
+                SET company_id = excluded.company_id,
+                    is_punched_in = excluded.is_punched_in,
+                    updated_at = excluded.updated_at
+            """, (member_id, company_id, int(bool(is_punched_in)), time.time()))
+            conn.execute("""
+                INSERT INTO member_presence (member_id, company_id, status)
+                VALUES (?, ?, ?)
+                ON CONFLICT(member_id) DO UPDATE SET status = excluded.status
+            """, (member_id, company_id, status))
+    except sqlite3.Error as e:
+        print(f"⚠️ Presence write failed for member {member_id}: {e}")
+
+
+def seed_punched_in(company_id, member_id, is_punched_in, read_started_at):
+    """
+    Store a value read from members.is_punched_in. read_started_at is the
+    time.time() taken before the SELECT, so a punch recorded while the read
+    was in flight is never overwritten by the older value.
+    """
+    try:
+        _connect().execute("""
+            INSERT INTO punch_state (member_id, company_id, is_punched_in, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(member_id) DO UPDATE
+            SET is_punched_in = excluded.is_punched_in,
+                updated_at = excluded.updated_at
+            WHERE punch_state.updated_at < ?
+        """, (member_id, company_id, int(bool(is_punched_in)), read_started_at, read_started_at))
+    except sqlite3.Error as e:
+        print(f"⚠️ Presence seed failed for member {member_id}: {e}")
+
+
+def forget_member(member_id):
+    """Drop presence for a deleted member"""
+    try:
+        conn = _connect()
+        with _transaction(conn):
+            conn.execute("DELETE FROM punch_state WHERE member_id = ?", (member_id,))
+            conn.execute("DELETE FROM member_presence WHERE member_id = ?", (member_id,))
+    except sqlite3.Error as e:
+        print(f"⚠️ Presence delete failed for member {member_id}: {e}")
+
+
+# ============================================================================
+# MEMBER / DEVICE PRESENCE (WRITE-BEHIND)
+# ============================================================================
+
+def record_member_activity(company_id, member_id, status, ts=None):
+    """
+    Record an upload's activity/heartbeat time and status.
+    Returns True when the status differs from the last known one (the caller
+    should flush_presence() that member right away), False otherwise.
+    """
+    epoch = _to_epoch(ts)
+    try:
+        conn = _connect()
+        with _transaction(conn):
+            row = conn.execute(
+                "SELECT status FROM member_presence WHERE member_id = ?", (member_id,)
+            ).fetchone()
+            conn.execute("""
+                INSERT INTO member_presence (member_id, company_id, status, last_activity_at, last_heartbeat_at, dirty)
+                VALUES (?, ?, ?, ?, ?, 1)
+                ON CONFLICT(member_id) DO UPDATE
+                SET status = excluded.status,
+                    last_activity_at = MAX(COALESCE(member_presence.last_activity_at, 0), excluded.last_activity_at),
+                    last_heartbeat_at = MAX(COALESCE(member_presence.last_heartbeat_at, 0), excluded.last_heartbeat_at),
+                    dirty = 1
+            """, (member_id, company_id, status, epoch, epoch))
+    except sqlite3.Error as e:
+        print(f"⚠️ Presence activity write failed for member {member_id}: {e}")
+        return True
+    return not row or row[0] != status
+
+
+def record_device_seen(company_id, device_db_id, ts=None):
+    """Record a heartbeat for a device (flushed to devices.last_seen_at later)"""
+    try:
+        _connect().execute("""
+            INSERT INTO device_presence (device_db_id, company_id, last_seen_at, dirty)
+            VALUES (?, ?, ?, 1)
+            ON CONFLICT(device_db_id) DO UPDATE
+            SET last_seen_at = MAX(device_presence.last_seen_at, excluded.last_seen_at),
+                dirty = 1
+        """, (device_db_id, company_id, _to_epoch(ts)))
+        return True
+    except sqlite3.Error as e:
+        print(f"⚠️ Presence device write failed for device {device_db_id}: {e}")
+        return False
+
+
+def get_member_presence(member_ids):
+    """
+    Live presence for members: {member_id: {'status', 'last_activity_at',
+    'last_heartbeat_at'}} with naive UTC datetimes. Unknown members are omitted.
+    """
+    member_ids = [int(m) for m in member_ids]
+    if not member_ids:
+        return {}
+    try:
+        rows = _connect().execute(
+            f"""
+            SELECT member_id, status, last_activity_at, last_heartbeat_at
+            FROM member_presence
+            WHERE member_id IN ({', '.join('?' * len(member_ids))})
+            """,
+            member_ids
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"⚠️ Presence read failed: {e}")
+        return {}
+    return {
+        row[0]: {
+            'status': row[1],
+            'last_activity_at': _to_utc_naive(row[2]),
+            'last_heartbeat_at': _to_utc_naive(row[3])
+        }
+        for row in rows
+    }
+
+
+def apply_live_presence(rows):
+    """
+    Overlay live presence onto member rows read from Postgres (dicts with
+    'id' and any of 'status', 'last_activity_at', 'last_heartbeat_at').
+    Newer presence timestamps replace the flushed ones. Returns rows.
+    """
+    presence = get_member_presence([row['id'] for row in rows])
+    for row in rows:
+        live = presence.get(row['id'])
+        if not live:
+            continue
+        for col in ('last_activity_at', 'last_heartbeat_at'):
+            if col in row and live[col] and (row[col] is None or _to_epoch(live[col]) > _to_epoch(row[col])):
+                row[col] = live[col]
+        if 'status' in row and live['status']:
+            row['status'] = live['status']
+    return rows
+
+
+def _claim_dirty(conn, table, key_col, columns, keys=None):
+    """Read dirty rows (optionally limited to keys) and mark them clean, atomically"""
+    with _transaction(conn):
+        query = f"SELECT {key_col}, {', '.join(columns)} FROM {table} WHERE dirty = 1"
+        params = []
+        if keys is not None:
+            query += f" AND {key_col} IN ({', '.join('?' * len(keys))})"
+            params = list(keys)
+        rows = conn.execute(query, params).fetchall()
+        if rows:
+            conn.execute(
+                f"UPDATE {table} SET dirty = 0 WHERE {key_col} IN ({', '.join('?' * len(rows))})",
+                [r[0] for r in rows]
+            )
+    return rows
+
+
+def _mark_dirty(conn, table, key_col, keys):
+    if keys:
+        conn.execute(
+            f"UPDATE {table} SET dirty = 1 WHERE {key_col} IN ({', '.join('?' * len(keys))})",
+            list(keys)
+        )
+
+
+def flush_presence(member_ids=None):
+    """
+    Write dirty presence to Postgres with one UPDATE ... FROM (VALUES ...) per
+    table. member_ids limits the flush to those members (status transitions)
+    and skips devices. Rows are re-marked dirty if the write fails.
+    Returns (members_flushed, devices_flushed).
+    """
+    from db import get_db
+    from psycopg2.extras import execute_values
+
+    if member_ids is not None and not member_ids:
+        return 0, 0
+
+    conn = _connect()
+    started = time.perf_counter()
+    member_rows = _claim_dirty(
+        conn, 'member_presence', 'member_id',
+        ('status', 'last_activity_at', 'last_heartbeat_at'), member_ids
+    )
+    device_rows = [] if member_ids is not None else _claim_dirty(
+        conn, 'device_presence', 'device_db_id', ('last_seen_at',)
+    )
+    if not member_rows and not device_rows:
+        return 0, 0
+
+    try:
+        with get_db() as pg:
+            cur = pg.cursor()
+            if member_rows:
+                # Punched-out members keep the 'offline' written by punch-out
+                execute_values(
+                    cur,
+                    """
+                    UPDATE members AS m
+                    SET status = v.status,
+                        last_activity_at = GREATEST(m.last_activity_at, v.activity_ts),
+                        last_heartbeat_at = GREATEST(m.last_heartbeat_at, v.heartbeat_ts)
+                    FROM (VALUES %s) AS v(id, status, activity_ts, heartbeat_ts)
+                    WHERE m.id = v.id AND m.is_punched_in = TRUE
+                    """,
+                    [(r[0], r[1], _to_utc_naive(r[2]), _to_utc_naive(r[3])) for r in member_rows],
+                    template="(%s, %s, %s::timestamp, %s::timestamp)",
+                    page_size=len(member_rows)
+                )
+            if device_rows:
+                execute_values(
+                    cur,
+                    """
+                    UPDATE devices AS d
+                    SET last_seen_at = GREATEST(d.last_seen_at, v.ts), status = 'online'
+                    FROM (VALUES %s) AS v(id, ts)
+                    WHERE d.id = v.id
+                    """,
+                    [(r[0], _to_utc_naive(r[1])) for r in device_rows],
+                    template="(%s, %s::timestamp)",
+                    page_size=len(device_rows)
+                )
+    except Exception as e:
+        print(f"⚠️ Presence flush failed ({len(member_rows)} members, {len(device_rows)} devices): {e}")
+        try:
+            _mark_dirty(conn, 'member_presence', 'member_id', [r[0] for r in member_rows])
+            _mark_dirty(conn, 'device_presence', 'device_db_id', [r[0] for r in device_rows])
+        except sqlite3.Error as mark_error:
+            print(f"⚠️ Could not re-mark presence rows dirty: {mark_error}")
+        with _flusher_lock:
+            _flush_stats['flush_errors'] += 1
+        return 0, 0
+
+    with _flusher_lock:
+        _flush_stats['flushes'] += 1
+        _flush_stats['members_flushed'] += len(member_rows)
+        _flush_stats['devices_flushed'] += len(device_rows)
+        _flush_stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000.0, 1)
+    return len(member_rows), len(device_rows)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(PRESENCE_FLUSH_INTERVAL)
+        try:
+            flush_presence()
+        except Exception as e:
+            print(f"⚠️ Presence flusher error: {e}")
+
+
+def start_presence_flusher():
+    """Start this worker's background flusher (idempotent)"""
+    global _flusher_thread
+    with _flusher_lock:
+        if _flusher_thread is not None and _flusher_thread.is_alive():
+            return
+        _flusher_thread = threading.Thread(target=_flush_loop, name='presence-flusher', daemon=True)
+        _flusher_thread.start()
+    print(f"🫀 Presence flusher started (every {PRESENCE_FLUSH_INTERVAL}s, store={PRESENCE_DB_PATH})")
+
+
+def get_presence_stats():
+    """Pending write-behind rows and flush counters for the health endpoint"""
+    try:
+        conn = _connect()
+        pending_members = conn.execute("SELECT COUNT(*) FROM member_presence WHERE dirty = 1").fetchone()[0]
+        pending_devices = conn.execute("SELECT COUNT(*) FROM device_presence WHERE dirty = 1").fetchone()[0]
+    except sqlite3.Error:
+        pending_members = pending_devices = None
+    with _flusher_lock:
+        stats = dict(_flush_stats)
+    stats.update({
+        'pending_members': pending_members,
+        'pending_devices': pending_devices,
+        'flush_interval_seconds': PRESENCE_FLUSH_INTERVAL
+    })
+    return stats
+
+
+# ============================================================================
+# CACHE GENERATIONS
+# ============================================================================
+
+def _get_generation(table, company_id):
+    try:
+        row = _connect().execute(
+            f"SELECT generation FROM {table} WHERE company_id = ?",
+            (company_id,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"⚠️ Presence generation read failed for company {company_id}: {e}")
+        return -1
+    return row[0] if row else 0
+
+
+def _bump_generation(table, company_id):
+    try:
+        _connect().execute(f"""
+            INSERT INTO {table} (company_id, generation) VALUES (?, 1)
+            ON CONFLICT(company_id) DO UPDATE SET generation = generation + 1
+        """, (company_id,))
+    except sqlite3.Error as e:
+        print(f"⚠️ Presence generation bump failed for company {company_id}: {e}")
+
+
+def get_identity_generation(company_id):
+    """Current identity-cache generation for a company (0 if never bumped, -1 if unreadable)"""
+    return _get_generation('identity_generation', company_id)
+
+
+def bump_identity_generation(company_id):
+    """Invalidate every worker's cached member/device identities for a company"""
+    _bump_generation('identity_generation', company_id)
+
+
+def get_auth_generation(company_id):
+    """Current tracker auth cache generation for a company (0 if never bumped, -1 if unreadable)"""
+    return _get_generation('auth_generation', company_id)
+
+
+def bump_auth_generation(company_id):
+    """Invalidate every worker's cached tracker token verdicts for a company"""
+    _bump_generation('auth_generation', company_id)
+
+
+# ============================================================================
+# INGEST TOKEN BUCKETS
+# ============================================================================
+
+def take_ingest_tokens(company_id, rate_per_minute, burst, cost=1):
+    """
+    Take `cost` tokens from a company's bucket (refilled at rate_per_minute,
+    holding at most `burst`). Returns (allowed, retry_after_seconds).
+    Fails open if the store is unavailable.
+    """
+    now = time.time()
+    cost = min(cost, burst)
+    rate_per_second = rate_per_minute / 60.0
+    try:
+        with _transaction(_connect()) as conn:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM ingest_bucket WHERE company_id = ?",
+                (company_id,)
+            ).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute("""
+                INSERT INTO ingest_bucket (company_id, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(company_id) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+            """, (company_id, tokens, now))
+    except sqlite3.Error as e:
+        print(f"⚠️ Ingest bucket unavailable for company {company_id}: {e}")
+        return True, 0
+
+    if allowed:
+        return True, 0
+    return False, (cost - tokens) / rate_per_second
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'get_punched_in',
+    'set_punched_in',
+    'seed_punched_in',
+    'forget_member',
+    'record_member_activity',
+    'record_device_seen',
+    'get_member_presence',
+    'apply_live_presence',
+    'flush_presence',
+    'start_presence_flusher',
+    'get_presence_stats',
+    'get_identity_generation',
+    'bump_identity_generation',
+    'get_auth_generation',
+    'bump_auth_generation',
+    'take_ingest_tokens'
+]
@@ -0,0 +1,200 @@
+"""
+REQUEST_COMPRESSION.PY - Compressed request bodies for tracker traffic
+======================================================================
+✅ Accepts Content-Encoding gzip / x-gzip / deflate / zstd on tracker paths
+✅ Streaming decompression with a hard cap on the decompressed size (413)
+✅ Corrupt bodies rejected with 400, unsupported encodings with 415
+✅ Decompressed body spooled to disk past TRACKER_DECOMPRESS_SPOOL_BYTES
+
+Runs as WSGI middleware so Flask/Werkzeug only ever see the plain body:
+request.get_json(), request.form and request.files work unchanged.
+zstd needs the optional `zstandard` package; without it zstd bodies get 415
+and the trackers keep using gzip.
+"""
+
+import os
+import json
+import zlib
+import tempfile
+
+from werkzeug.wsgi import get_input_stream
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+TRACKER_MAX_DECOMPRESSED_BYTES = int(os.getenv('TRACKER_MAX_DECOMPRESSED_BYTES', str(32 * 1024 * 1024)))
+TRACKER_DECOMPRESS_SPOOL_BYTES = int(os.getenv('TRACKER_DECOMPRESS_SPOOL_BYTES', str(1024 * 1024)))
+
+CHUNK_SIZE = 64 * 1024
+
+_GZIP_ENCODINGS = ('gzip', 'x-gzip')
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+# ============================================================================
+# DECODERS
+# ============================================================================
+
+def _inflate(stream, out, wbits, limit):
+    """zlib/gzip: never let a single call produce more than CHUNK_SIZE bytes"""
+    decoder = zlib.decompressobj(wbits)
+    total = 0
+
+    def _emit(data):
+        nonlocal total
+        total += len(data)
+        if total > limit:
+            raise BodyTooLarge()
+        out.write(data)
+
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        data = decoder.decompress(chunk, CHUNK_SIZE)
+        _emit(data)
+        while decoder.unconsumed_tail:
+            _emit(decoder.decompress(decoder.unconsumed_tail, CHUNK_SIZE))
+
+    _emit(decoder.flush())
+    if not decoder.eof:
+        raise zlib.error('truncated compressed body')
+    return total
+
+
+def _unzstd(stream, out, limit):
+    reader = zstandard.ZstdDecompressor().stream_reader(stream)
+    total = 0
+    while True:
+        data = reader.read(CHUNK_SIZE)
+        if not data:
+            break
+        total += len(data)
+        if total > limit:
+            raise BodyTooLarge()
+        out.write(data)
+    return total
+
+
+def decompress_body(stream, encoding, limit=TRACKER_MAX_DECOMPRESSED_BYTES):
+    """
+    Decompress `stream` into a spooled temp file positioned at 0.
+    Returns (file, decompressed_size). Raises BodyTooLarge past `limit`.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=TRACKER_DECOMPRESS_SPOOL_BYTES)
+    try:
+        if encoding in _GZIP_ENCODINGS:
+            size = _inflate(stream, out, 16 + zlib.MAX_WBITS, limit)
+        elif encoding == 'deflate':
+            size = _inflate(stream, out, zlib.MAX_WBITS, limit)
+        else:
+            size = _unzstd(stream, out, limit)
+    except Exception:
+        out.close()
+        raise
+    out.seek(0)
+    return out, size
+
+
+def supported_encodings():
+    encodings = list(_GZIP_ENCODINGS) + ['deflate']
+    if zstandard is not None:
+        encodings.append('zstd')
+    return encodings
+
+
+# ============================================================================
+# WSGI MIDDLEWARE
+# ============================================================================
+
+class DecompressionMiddleware:
+    """
+    Replace a compressed wsgi.input with its decompressed body for requests
+    under `path_prefixes`. Other paths pass through untouched.
+    """
+
+    def __init__(self, app, path_prefixes=('/tracker/',), limit=TRACKER_MAX_DECOMPRESSED_BYTES):
+        self.app = app
+        self.path_prefixes = tuple(path_prefixes)
+        self.limit = limit
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if not encoding or encoding == 'identity' or not environ.get('PATH_INFO', '').startswith(self.path_prefixes):
+            return self.app(environ, start_response)
+
+        if encoding not in supported_encodings():
+            return self._error(start_response, '415 Unsupported Media Type',
+                               f'Unsupported Content-Encoding: {encoding}',
+                               [('Accept-Encoding', ', '.join(supported_encodings()))])
+
+        try:
+            body, size = decompress_body(get_input_stream(environ), encoding, self.limit)
+        except BodyTooLarge:
+            print(f"⚠️ Rejected {encoding} body over {self.limit} bytes on {environ.get('PATH_INFO')}")
+            return self._error(start_response, '413 Request Entity Too Large',
+                               'Decompressed body too large')
+        except Exception as e:
+            print(f"⚠️ Corrupt {encoding} body on {environ.get('PATH_INFO')}: {e}")
+            return self._error(start_response, '400 Bad Request', 'Invalid compressed body')
+
+        environ['workeye.compressed_length'] = environ.get('CONTENT_LENGTH', '')
+        environ['wsgi.input'] = body
+        environ['wsgi.input_terminated'] = False
+        environ['CONTENT_LENGTH'] = str(size)
+        environ.pop('HTTP_CONTENT_ENCODING', None)
+        environ.pop('HTTP_TRANSFER_ENCODING', None)
+
+        try:
+            response = self.app(environ, start_response)
+        except Exception:
+            body.close()
+            raise
+        return _ClosingIterator(response, body)
+
+    @staticmethod
+    def _error(start_response, status, message, extra_headers=()):
+        payload = json.dumps({'success': False, 'error': message}).encode()
+        start_response(status, [('Content-Type', 'application/json'),
+                                ('Content-Length', str(len(payload)))] + list(extra_headers))
+        return [payload]
+
+
+class _ClosingIterator:
+    """Close the spooled body once the server is done with the response"""
+
+    def __init__(self, response, body):
+        self._response = response
+        self._body = body
+
+    def __iter__(self):
+        return iter(self._response)
+
+    def close(self):
+        try:
+            if hasattr(self._response, 'close'):
+                self._response.close()
+        finally:
+            self._body.close()
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'DecompressionMiddleware',
+    'decompress_body',
+    'supported_encodings',
+    'BodyTooLarge',
+    'TRACKER_MAX_DECOMPRESSED_BYTES'
+]
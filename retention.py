@@ -0,0 +1,576 @@
+"""
+RETENTION.PY - Per-company retention for activity data and screenshots
+======================================================================
+✅ Policy per company in company_configurations (activity_retention_days,
+   screenshot_retention_days); NULL = server default, 0 = keep forever
+✅ Partitions older than every company's cutoff are dropped whole
+   (partitions.py); the rest is deleted per company in bounded batches,
+   one short transaction each
+✅ Deleted screenshots release their blob references; blobs left without
+   references go with their renditions, loose mirror files are removed and
+   pack files holding them are compacted
+✅ One worker runs a pass every RETENTION_INTERVAL_SECONDS (advisory lock,
+   last completed run in retention_runs); progress shows in /health and
+   each run is logged with rows and bytes reclaimed
+
+Activity data is activity_log plus window_activity; attendance (punch_logs)
+and daily summaries are kept. Requires scripts/add_retention_policy.py.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+from db import get_db, get_db_connection, return_connection
+from partitions import list_partitions, drop_partitions_before
+from screenshot_packs import compact_pack_dir, pack_dir
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+RETENTION_ENABLED = os.getenv('RETENTION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Server defaults for companies without a policy (0 = keep forever)
+RETENTION_ACTIVITY_DAYS = int(os.getenv('RETENTION_ACTIVITY_DAYS', '0'))
+RETENTION_SCREENSHOT_DAYS = int(os.getenv('RETENTION_SCREENSHOT_DAYS', '0'))
+RETENTION_INTERVAL_SECONDS = float(os.getenv('RETENTION_INTERVAL_SECONDS', '86400'))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '2000'))
+# Pause between delete batches so retention never hogs the database
+RETENTION_BATCH_PAUSE_MS = float(os.getenv('RETENTION_BATCH_PAUSE_MS', '50'))
+RETENTION_COMPACT_MIN_DEAD = float(os.getenv('RETENTION_COMPACT_MIN_DEAD', '0.3'))
+
+# pg_advisory_lock key for retention passes
+RETENTION_LOCK_KEY = 0x72657465
+
+_PACKS_MARKER = os.sep + 'packs' + os.sep
+_BLOBS_MARKER = os.sep + 'blobs' + os.sep
+
+
+# ============================================================================
+# POLICY
+# ============================================================================
+
+def retention_policies(cur):
+    """{company_id: {'activity': days, 'screenshots': days}} for every company (0 = keep forever)"""
+    cur.execute("""
+        SELECT c.id AS company_id, cc.activity_retention_days, cc.screenshot_retention_days
+        FROM companies c
+        LEFT JOIN company_configurations cc ON cc.company_id = c.id
+        ORDER BY c.id
+    """)
+    policies = {}
+    for row in cur.fetchall():
+        activity = row['activity_retention_days']
+        screenshots = row['screenshot_retention_days']
+        policies[row['company_id']] = {
+            'activity': RETENTION_ACTIVITY_DAYS if activity is None else activity,
+            'screenshots': RETENTION_SCREENSHOT_DAYS if screenshots is None else screenshots
+        }
+    return policies
+
+
+def _cutoffs(policies, target, now):
+    """{company_id: first kept day} for the companies whose `target` data expires"""
+    return {
+        company_id: (now - timedelta(days=policy[target])).date()
+        for company_id, policy in policies.items()
+        if policy[target] > 0
+    }
+
+
+def _partition_cutoff(policies, cutoffs):
+    """Day before which every company's data has expired, or None"""
+    if not cutoffs or len(cutoffs) < len(policies):
+        return None
+    return min(cutoffs.values())
+
+
+# ============================================================================
+# REPORT
+# ============================================================================
+
+def _new_report(dry_run):
+    return {
+        'dry_run': dry_run,
+        'partitions_dropped': [],
+        'activity_rows': 0,
+        'window_activity_rows': 0,
+        'screenshot_rows': 0,
+        'blobs_deleted': 0,
+        'renditions_deleted': 0,
+        'files_removed': 0,
+        'bytes': {'partitions': 0, 'rows': 0, 'blobs_db': 0, 'files': 0, 'packs': 0},
+        'companies': {}
+    }
+
+
+def _bytes_reclaimed(report):
+    return sum(report['bytes'].values())
+
+
+def _company_report(report, company_id):
+    return report['companies'].setdefault(str(company_id), {'activity_rows': 0, 'screenshot_rows': 0})
+
+
+def _progress(report):
+    with _engine_lock:
+        _engine_stats['current'] = {
+            'activity_rows': report['activity_rows'] + report['window_activity_rows'],
+            'screenshot_rows': report['screenshot_rows'],
+            'bytes_reclaimed': _bytes_reclaimed(report)
+        }
+
+
+# ============================================================================
+# SCREENSHOT REFERENCES
+# ============================================================================
+
+def _new_freed():
+    return {'pack_dirs': set(), 'files': set()}
+
+
+def _is_legacy_file(path):
+    """Per-screenshot file from before blobs (not shared with any other row)"""
+    return bool(path) and _PACKS_MARKER not in path and _BLOBS_MARKER not in path
+
+
+def _free_unreferenced_blobs(cur, company_id, hashes, report, freed):
+    """Delete the company's blobs among `hashes` that nothing references any more"""
+    cur.execute("""
+        SELECT content_hash FROM screenshot_blobs
+        WHERE company_id = %s AND content_hash = ANY(%s) AND ref_count <= 0
+        FOR UPDATE
+    """, (company_id, list(hashes)))
+    dead = [r['content_hash'] for r in cur.fetchall()]
+    if not dead:
+        return
+
+    cur.execute("""
+        DELETE FROM screenshot_renditions
+        WHERE company_id = %s AND content_hash = ANY(%s)
+        RETURNING pack_file, COALESCE(octet_length(data), 0) AS db_bytes
+    """, (company_id, dead))
+    renditions = cur.fetchall()
+    cur.execute("""
+        DELETE FROM screenshot_blobs
+        WHERE company_id = %s AND content_hash = ANY(%s)
+        RETURNING pack_file, saved_filename, COALESCE(octet_length(data), 0) AS db_bytes
+    """, (company_id, dead))
+    blobs = cur.fetchall()
+
+    for row in renditions + blobs:
+        report['bytes']['blobs_db'] += row['db_bytes']
+        if row['pack_file']:
+            freed['pack_dirs'].add((company_id, os.path.dirname(row['pack_file'])))
+    for row in blobs:
+        path = row['saved_filename']
+        if path and _PACKS_MARKER not in path:
+            freed['files'].add(path)
+    report['blobs_deleted'] += len(blobs)
+    report['renditions_deleted'] += len(renditions)
+
+
+def _release_screenshots(cur, company_id, rows, report, freed):
+    """Release what deleted screenshot rows (id, content_hash, saved_filename) referenced"""
+    counts = Counter(r['content_hash'] for r in rows if r['content_hash'])
+    freed['files'].update(r['saved_filename'] for r in rows if _is_legacy_file(r['saved_filename']))
+    if not counts:
+        return
+
+    # Near duplicates of a deleted frame share its content hash; they stand on their own now
+    cur.execute("""
+        UPDATE screenshots SET near_dup_of = NULL
+        WHERE company_id = %s AND content_hash = ANY(%s) AND near_dup_of = ANY(%s)
+    """, (company_id, list(counts), [r['id'] for r in rows]))
+    execute_values(cur, """
+        UPDATE screenshot_blobs AS b
+        SET ref_count = GREATEST(b.ref_count - v.n, 0)
+        FROM (VALUES %s) AS v (company_id, content_hash, n)
+        WHERE b.company_id = v.company_id AND b.content_hash = v.content_hash
+    """, [(company_id, content_hash, n) for content_hash, n in counts.items()])
+    _free_unreferenced_blobs(cur, company_id, counts, report, freed)
+
+
+def _count_partition(report, counter):
+    """before_drop hook for activity_log partitions: count the rows going"""
+    def count(cur, partition):
+        cur.execute(f"SELECT COUNT(*) AS n FROM {partition}")
+        report[counter] += cur.fetchone()['n']
+    return count
+
+
+def _release_partition(report, freed):
+    """before_drop hook for screenshots partitions: release every row's references"""
+    def release(cur, partition):
+        cur.execute(f"""
+            UPDATE screenshots AS s SET near_dup_of = NULL
+            FROM {partition} AS p
+            WHERE s.company_id = p.company_id AND s.content_hash = p.content_hash AND s.near_dup_of = p.id
+        """)
+        cur.execute(f"""
+            UPDATE screenshot_blobs AS b
+            SET ref_count = GREATEST(b.ref_count - p.n, 0)
+            FROM (
+                SELECT company_id, content_hash, COUNT(*) AS n
+                FROM {partition} WHERE content_hash IS NOT NULL
+                GROUP BY company_id, content_hash
+            ) AS p
+            WHERE b.company_id = p.company_id AND b.content_hash = p.content_hash
+            RETURNING b.company_id, b.content_hash, b.ref_count
+        """)
+        released = {}
+        for row in cur.fetchall():
+            if row['ref_count'] <= 0:
+                released.setdefault(row['company_id'], []).append(row['content_hash'])
+        for company_id, hashes in released.items():
+            _free_unreferenced_blobs(cur, company_id, hashes, report, freed)
+
+        cur.execute(f"SELECT COUNT(*) AS n FROM {partition}")
+        report['screenshot_rows'] += cur.fetchone()['n']
+        cur.execute(f"SELECT saved_filename FROM {partition} WHERE saved_filename IS NOT NULL")
+        freed['files'].update(r['saved_filename'] for r in cur.fetchall() if _is_legacy_file(r['saved_filename']))
+    return release
+
+
+def _reclaim_files(freed, report):
+    """
+    Remove freed loose files and compact the packs that held freed images
+    (after commit). Today's packs are skipped like in
+    scripts/compact_screenshot_packs.py: the pipeline appends to them before
+    its rows commit, so a live record could look dead.
+    """
+    for path in freed['files']:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            print(f"⚠️ Retention could not remove {path}: {e}")
+            continue
+        report['files_removed'] += 1
+        report['bytes']['files'] += size
+    today = datetime.utcnow().date()
+    for company_id, rel_dir in sorted(freed['pack_dirs']):
+        if rel_dir == pack_dir(company_id, today):
+            continue
+        try:
+            report['bytes']['packs'] += compact_pack_dir(company_id, rel_dir, RETENTION_COMPACT_MIN_DEAD)
+        except OSError as e:
+            print(f"⚠️ Retention could not compact {rel_dir}: {e}")
+    freed['files'].clear()
+    freed['pack_dirs'].clear()
+
+
+# ============================================================================
+# PARTITIONS
+# ============================================================================
+
+def _drop_partitions(table, cutoff, report, dry_run, before_drop=None):
+    if cutoff is None:
+        return
+    with get_db() as conn:
+        cur = conn.cursor()
+        if dry_run:
+            dropped = []
+            for partition in list_partitions(cur, table):
+                if partition['end'] is not None and partition['end'] <= cutoff:
+                    cur.execute("SELECT pg_total_relation_size(%s) AS bytes", (partition['name'],))
+                    dropped.append((partition['name'], cur.fetchone()['bytes']))
+        else:
+            cur.execute("SET LOCAL lock_timeout = '5s'")
+            dropped = drop_partitions_before(cur, table, cutoff, before_drop)
+    for name, size in dropped:
+        report['partitions_dropped'].append(name)
+        report['bytes']['partitions'] += size
+        print(f"🗑️ Retention: {'would drop' if dry_run else 'dropped'} partition {name} ({size} bytes)")
+
+
+# ============================================================================
+# BATCHED DELETES
+# ============================================================================
+
+def _count_expired(sql, params):
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        return cur.fetchone()
+
+
+def purge_activity(company_id, cutoff, report, dry_run=False):
+    """Delete the company's activity_log / window_activity rows from before `cutoff` (a date)"""
+    company = _company_report(report, company_id)
+    for table, key, counter in (
+        ('activity_log', 'timestamp', 'activity_rows'),
+        ('window_activity', 'date', 'window_activity_rows'),
+    ):
+        if dry_run:
+            row = _count_expired(f"""
+                SELECT COUNT(*) AS n, COALESCE(SUM(pg_column_size(a.*)), 0) AS row_bytes
+                FROM {table} a WHERE company_id = %s AND {key} < %s
+            """, (company_id, cutoff))
+            report[counter] += row['n']
+            report['bytes']['rows'] += row['row_bytes']
+            company['activity_rows'] += row['n']
+            continue
+
+        # The outer key bound lets a partitioned activity_log prune
+        while True:
+            with get_db() as conn:
+                cur = conn.cursor()
+                cur.execute(f"""
+                    DELETE FROM {table} a
+                    WHERE company_id = %s AND {key} < %s
+                      AND id = ANY(ARRAY(
+                          SELECT id FROM {table}
+                          WHERE company_id = %s AND {key} < %s
+                          LIMIT %s
+                      ))
+                    RETURNING pg_column_size(a.*) AS row_bytes
+                """, (company_id, cutoff, company_id, cutoff, RETENTION_BATCH_SIZE))
+                rows = cur.fetchall()
+            report[counter] += len(rows)
+            report['bytes']['rows'] += sum(r['row_bytes'] for r in rows)
+            company['activity_rows'] += len(rows)
+            _progress(report)
+            if len(rows) < RETENTION_BATCH_SIZE:
+                break
+            print(f"🧹 Retention: company {company_id} {table} -{company['activity_rows']} rows so far")
+            time.sleep(RETENTION_BATCH_PAUSE_MS / 1000.0)
+
+
+def purge_screenshots(company_id, cutoff, report, dry_run=False):
+    """Delete the company's screenshots from before `cutoff` (a date) and what only they referenced"""
+    company = _company_report(report, company_id)
+    if dry_run:
+        row = _count_expired("""
+            SELECT COUNT(*) AS n, COALESCE(SUM(pg_column_size(s.*)), 0) AS row_bytes
+            FROM screenshots s WHERE company_id = %s AND tracking_date < %s
+        """, (company_id, cutoff))
+        report['screenshot_rows'] += row['n']
+        report['bytes']['rows'] += row['row_bytes']
+        company['screenshot_rows'] += row['n']
+        return
+
+    freed = _new_freed()
+    while True:
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                DELETE FROM screenshots s
+                WHERE company_id = %s AND tracking_date < %s
+                  AND id = ANY(ARRAY(
+                      SELECT id FROM screenshots
+                      WHERE company_id = %s AND tracking_date < %s
+                      LIMIT %s
+                  ))
+                RETURNING id, content_hash, saved_filename, pg_column_size(s.*) AS row_bytes
+            """, (company_id, cutoff, company_id, cutoff, RETENTION_BATCH_SIZE))
+            rows = cur.fetchall()
+            if rows:
+                _release_screenshots(cur, company_id, rows, report, freed)
+        report['screenshot_rows'] += len(rows)
+        report['bytes']['rows'] += sum(r['row_bytes'] for r in rows)
+        company['screenshot_rows'] += len(rows)
+        _progress(report)
+        if len(rows) < RETENTION_BATCH_SIZE:
+            break
+        print(f"🧹 Retention: company {company_id} screenshots -{company['screenshot_rows']} rows so far")
+        time.sleep(RETENTION_BATCH_PAUSE_MS / 1000.0)
+    _reclaim_files(freed, report)
+
+
+# ============================================================================
+# RUNS
+# ============================================================================
+
+_engine_lock = threading.Lock()
+_engine_thread = None
+_engine_stats = {
+    'runs': 0,
+    'errors': 0,
+    'running': False,
+    'current': None,
+    'last_run_at': None,
+    'last_error': None,
+    'last_report': None
+}
+
+
+def _execute_pass(report, company_id=None):
+    now = datetime.utcnow()
+    with get_db() as conn:
+        policies = retention_policies(conn.cursor())
+    activity_cutoffs = _cutoffs(policies, 'activity', now)
+    screenshot_cutoffs = _cutoffs(policies, 'screenshots', now)
+    dry_run = report['dry_run']
+
+    if company_id is None:
+        _drop_partitions(
+            'activity_log', _partition_cutoff(policies, activity_cutoffs), report, dry_run,
+            _count_partition(report, 'activity_rows')
+        )
+        freed = _new_freed()
+        _drop_partitions(
+            'screenshots', _partition_cutoff(policies, screenshot_cutoffs), report, dry_run,
+            _release_partition(report, freed)
+        )
+        _reclaim_files(freed, report)
+        _progress(report)
+
+    for cid, cutoff in activity_cutoffs.items():
+        if company_id is None or cid == company_id:
+            purge_activity(cid, cutoff, report, dry_run)
+    for cid, cutoff in screenshot_cutoffs.items():
+        if company_id is None or cid == company_id:
+            purge_screenshots(cid, cutoff, report, dry_run)
+
+
+def _retention_due(cur):
+    cur.execute("""
+        SELECT MAX(finished_at) AS last_finished FROM retention_runs
+        WHERE status = 'completed' AND NOT dry_run
+    """)
+    last_finished = cur.fetchone()['last_finished']
+    return last_finished is None or last_finished <= datetime.utcnow() - timedelta(seconds=RETENTION_INTERVAL_SECONDS)
+
+
+def run_retention(dry_run=False, company_id=None, force=True):
+    """
+    One retention pass (all companies, or only `company_id` without
+    partition drops). Returns the report, or None when another worker holds
+    the lock or (force=False) the last completed pass is recent enough.
+    """
+    lock_conn = get_db_connection()
+    try:
+        lock_cur = lock_conn.cursor()
+        lock_cur.execute("SELECT pg_try_advisory_lock(%s) AS locked", (RETENTION_LOCK_KEY,))
+        locked = lock_cur.fetchone()['locked']
+        lock_conn.commit()
+        if not locked:
+            return None
+        try:
+            return _run_locked(dry_run, company_id, force)
+        finally:
+            lock_cur.execute("SELECT pg_advisory_unlock(%s)", (RETENTION_LOCK_KEY,))
+            lock_conn.commit()
+    finally:
+        return_connection(lock_conn)
+
+
+def _run_locked(dry_run, company_id, force):
+    with get_db() as conn:
+        cur = conn.cursor()
+        if not force and not _retention_due(cur):
+            return None
+        cur.execute("""
+            INSERT INTO retention_runs (dry_run, company_id, status)
+            VALUES (%s, %s, 'running') RETURNING id
+        """, (dry_run, company_id))
+        run_id = cur.fetchone()['id']
+
+    report = _new_report(dry_run)
+    started = time.time()
+    with _engine_lock:
+        _engine_stats['running'] = True
+    print(f"🧹 Retention pass {run_id} started{' (dry run)' if dry_run else ''}")
+    status, error = 'completed', None
+    try:
+        _execute_pass(report, company_id)
+    except Exception as e:
+        status, error = 'failed', str(e)
+        raise
+    finally:
+        report['bytes_reclaimed'] = _bytes_reclaimed(report)
+        report['seconds'] = round(time.time() - started, 1)
+        with get_db() as conn:
+            conn.cursor().execute("""
+                UPDATE retention_runs
+                SET status = %s, finished_at = CURRENT_TIMESTAMP, activity_rows = %s, screenshot_rows = %s,
+                    partitions_dropped = %s, blobs_deleted = %s, files_removed = %s,
+                    bytes_reclaimed = %s, report = %s::jsonb, error = %s
+                WHERE id = %s
+            """, (
+                status, report['activity_rows'] + report['window_activity_rows'], report['screenshot_rows'],
+                len(report['partitions_dropped']), report['blobs_deleted'], report['files_removed'],
+                report['bytes_reclaimed'], json.dumps(report), error, run_id
+            ))
+        with _engine_lock:
+            _engine_stats['running'] = False
+            _engine_stats['current'] = None
+
+    print(
+        f"✅ Retention pass {run_id}{' (dry run)' if dry_run else ''}: "
+        f"{report['activity_rows'] + report['window_activity_rows']} activity rows, "
+        f"{report['screenshot_rows']} screenshots, {len(report['partitions_dropped'])} partitions, "
+        f"{report['blobs_deleted']} blobs, {report['files_removed']} files, "
+        f"{report['bytes_reclaimed']} bytes reclaimed in {report['seconds']}s"
+    )
+    return report
+
+
+def _engine_loop():
+    while True:
+        try:
+            report = run_retention(force=False)
+            with _engine_lock:
+                if report is not None:
+                    _engine_stats['runs'] += 1
+                    _engine_stats['last_run_at'] = datetime.utcnow().isoformat()
+                    _engine_stats['last_report'] = {
+                        key: report[key] for key in ('activity_rows', 'screenshot_rows', 'blobs_deleted',
+                                                     'files_removed', 'bytes_reclaimed', 'seconds')
+                    }
+                _engine_stats['last_error'] = None
+        except Exception as e:
+            print(f"⚠️ Retention error: {e}")
+            with _engine_lock:
+                _engine_stats['errors'] += 1
+                _engine_stats['last_error'] = str(e)
+        # Passes are due once per RETENTION_INTERVAL_SECONDS; check hourly so a
+        # restarted worker never waits a full interval behind schedule
+        time.sleep(min(RETENTION_INTERVAL_SECONDS, 3600))
+
+
+def start_retention_engine():
+    """Start this worker's retention thread (idempotent)"""
+    global _engine_thread
+    if not RETENTION_ENABLED:
+        print("🧹 Retention engine disabled (RETENTION_ENABLED=false)")
+        return
+    with _engine_lock:
+        if _engine_thread is not None and _engine_thread.is_alive():
+            return
+        _engine_thread = threading.Thread(target=_engine_loop, name='retention', daemon=True)
+        _engine_thread.start()
+    print(f"🧹 Retention engine started (every {RETENTION_INTERVAL_SECONDS:.0f}s, batches of {RETENTION_BATCH_SIZE})")
+
+
+def get_retention_stats():
+    with _engine_lock:
+        stats = dict(_engine_stats)
+    stats.update({
+        'enabled': RETENTION_ENABLED,
+        'default_activity_days': RETENTION_ACTIVITY_DAYS,
+        'default_screenshot_days': RETENTION_SCREENSHOT_DAYS
+    })
+    return stats
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'retention_policies',
+    'purge_activity',
+    'purge_screenshots',
+    'run_retention',
+    'start_retention_engine',
+    'get_retention_stats'
+]
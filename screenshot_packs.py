@@ -0,0 +1,376 @@
+"""
+SCREENSHOT_PACKS.PY - Append-only pack files for the screenshot filesystem mirror
+================================================================================
+✅ Screenshot blobs are appended to pack files per company and day instead of
+   one file per image, so backups, inode use and directory scans stay cheap
+✅ Offset index in `screenshot_blobs` (pack_file, pack_offset, pack_length)
+✅ Self-describing records: each image is preceded by its SHA-256 and length,
+   so a pack can be verified (or its index rebuilt) without the database
+✅ Reads go through a read-only mmap, cached per pack file in each worker,
+   or a bounded file view the WSGI server can sendfile() from
+✅ Appends from all workers are serialized with flock on a per-directory lock
+
+Layout (under SCREENSHOT_SAVE_PATH):
+    <company_id>/packs/<YYYYMMDD>/<seq:06d>.pack
+    <company_id>/packs/<YYYYMMDD>/append.lock
+
+Record: b'WEP1' | SHA-256 digest (32 bytes) | data length (uint32, big endian) | data
+pack_file is stored relative to SCREENSHOT_SAVE_PATH and pack_offset points at
+the data, after the header. Packs only ever grow; space held by deleted blobs
+is reclaimed by compact_pack_dir() (scripts/compact_screenshot_packs.py,
+retention.py).
+"""
+
+import os
+import mmap
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+PACK_MAX_BYTES = int(os.getenv('SCREENSHOT_PACK_MAX_BYTES', str(256 * 1024 * 1024)))
+PACK_MAP_CACHE_SIZE = int(os.getenv('SCREENSHOT_PACK_MAP_CACHE', '64'))
+
+RECORD_MAGIC = b'WEP1'
+RECORD_HEADER = struct.Struct('>4s32sI')
+
+_O_BINARY = getattr(os, 'O_BINARY', 0)
+
+
+def save_root():
+    return os.getenv('SCREENSHOT_SAVE_PATH', os.path.join(os.getcwd(), 'screenshots'))
+
+
+def pack_dir(company_id, day):
+    """Pack directory for a company and day, relative to SCREENSHOT_SAVE_PATH"""
+    return os.path.join(str(company_id), 'packs', day.strftime('%Y%m%d'))
+
+
+def pack_path(pack_file):
+    return os.path.join(save_root(), pack_file)
+
+
+# ============================================================================
+# APPEND
+# ============================================================================
+
+_append_lock = threading.Lock()
+
+
+class pack_dir_lock:
+    """Exclusive lock on a pack directory (all workers and the compaction tool)"""
+
+    def __init__(self, abs_dir):
+        self.path = os.path.join(abs_dir, 'append.lock')
+        self.fd = None
+
+    def __enter__(self):
+        _append_lock.acquire()
+        try:
+            self.fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+        except Exception:
+            if self.fd is not None:
+                os.close(self.fd)
+            _append_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+        finally:
+            _append_lock.release()
+        return False
+
+
+def list_packs(abs_dir):
+    try:
+        return sorted(name for name in os.listdir(abs_dir) if name.endswith('.pack'))
+    except FileNotFoundError:
+        return []
+
+
+def next_pack_name(abs_dir, reuse_last=True):
+    """Last pack in the directory while it has room (reuse_last), else a new one"""
+    packs = list_packs(abs_dir)
+    if not packs:
+        return f"{1:06d}.pack"
+    if reuse_last and os.path.getsize(os.path.join(abs_dir, packs[-1])) < PACK_MAX_BYTES:
+        return packs[-1]
+    return f"{int(packs[-1].split('.')[0]) + 1:06d}.pack"
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def write_record(fd, content_hash, data):
+    """Append one record at the end of an O_APPEND pack; returns the data offset"""
+    start = os.fstat(fd).st_size
+    _write_all(fd, RECORD_HEADER.pack(RECORD_MAGIC, bytes.fromhex(content_hash), len(data)))
+    _write_all(fd, data)
+    return start + RECORD_HEADER.size
+
+
+def open_pack_for_append(path):
+    return os.open(path, os.O_CREAT | os.O_WRONLY | os.O_APPEND | _O_BINARY, 0o644)
+
+
+def append_blob(company_id, data, content_hash=None, day=None):
+    """
+    Append one image to the company's pack for `day` (default: today, UTC)
+    and fsync it. Returns (pack_file, pack_offset, pack_length).
+    """
+    content_hash = content_hash or hashlib.sha256(data).hexdigest()
+    rel_dir = pack_dir(company_id, day or datetime.utcnow().date())
+    abs_dir = os.path.join(save_root(), rel_dir)
+    os.makedirs(abs_dir, exist_ok=True)
+
+    with pack_dir_lock(abs_dir):
+        name = next_pack_name(abs_dir)
+        fd = open_pack_for_append(os.path.join(abs_dir, name))
+        try:
+            offset = write_record(fd, content_hash, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    return os.path.join(rel_dir, name), offset, len(data)
+
+
+# ============================================================================
+# READ
+# ============================================================================
+
+_maps = OrderedDict()
+_maps_lock = threading.Lock()
+
+
+def read_blob(pack_file, offset, length):
+    """
+    Bytes of one packed image through a cached read-only mmap.
+    The map is rebuilt when the pack grew or was replaced (new inode).
+    Raises OSError when the pack isn't on this host.
+    """
+    path = pack_path(pack_file)
+    st = os.stat(path)
+    with _maps_lock:
+        cached = _maps.get(path)
+        if cached is None or cached[0] != st.st_ino or offset + length > len(cached[1]):
+            if cached is not None:
+                _maps.pop(path)[1].close()
+            with open(path, 'rb') as f:
+                cached = (st.st_ino, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            _maps[path] = cached
+            while len(_maps) > PACK_MAP_CACHE_SIZE:
+                _maps.popitem(last=False)[1][1].close()
+        _maps.move_to_end(path)
+        if offset + length > len(cached[1]):
+            raise OSError(f"record at {offset}+{length} is past the end of {pack_file}")
+        return cached[1][offset:offset + length]
+
+
+class PackSlice:
+    """
+    Read-only file view of one record. fileno() and tell() expose the pack
+    itself, so wsgi.file_wrapper implementations that sendfile() (gunicorn)
+    copy the record kernel-side; read() never goes past the record.
+    """
+
+    mode = 'rb'
+
+    def __init__(self, pack_file, offset, length):
+        self._f = open(pack_path(pack_file), 'rb', buffering=0)
+        self._f.seek(offset)
+        self.end = offset + length
+        self.length = length
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def tell(self):
+        return self._f.tell()
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        return self._f.seek(pos, whence)
+
+    def read(self, size=-1):
+        remaining = self.end - self._f.tell()
+        if remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        return self._f.read(size)
+
+    def close(self):
+        self._f.close()
+
+
+def open_record(pack_file, offset, length):
+    """PackSlice over one record; raises OSError when the pack isn't on this host"""
+    return PackSlice(pack_file, offset, length)
+
+
+def scan_pack(path):
+    """
+    Yield (pack_offset, pack_length, content_hash) for every record in a pack.
+    Stops at the first torn or foreign header.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            while pos + RECORD_HEADER.size <= size:
+                magic, digest, length = RECORD_HEADER.unpack_from(mm, pos)
+                if magic != RECORD_MAGIC or pos + RECORD_HEADER.size + length > size:
+                    print(f"⚠️ Pack {path}: bad record header at {pos}, scan stopped")
+                    return
+                yield pos + RECORD_HEADER.size, length, digest.hex()
+                pos += RECORD_HEADER.size + length
+
+
+# ============================================================================
+# COMPACTION
+# ============================================================================
+
+def live_records(cur, company_id, pack_files):
+    """Blob and rendition rows pointing into the given packs, grouped by pack"""
+    cur.execute("""
+        SELECT content_hash, NULL AS rendition, pack_file, pack_offset, pack_length
+        FROM screenshot_blobs
+        WHERE company_id = %s AND pack_file = ANY(%s)
+        UNION ALL
+        SELECT content_hash, rendition, pack_file, pack_offset, pack_length
+        FROM screenshot_renditions
+        WHERE company_id = %s AND pack_file = ANY(%s)
+        ORDER BY pack_file, pack_offset
+    """, (company_id, pack_files, company_id, pack_files))
+    live = {}
+    for row in cur.fetchall():
+        live.setdefault(row['pack_file'], []).append(row)
+    return live
+
+
+def compact_pack_dir(company_id, rel_dir, min_dead, dry_run=False):
+    """
+    Rewrite the directory's packs that are at least min_dead dead (records
+    no blob or rendition row points at): live records are copied into a new
+    pack, the index is updated, then the old packs are deleted.
+    Returns bytes reclaimed.
+    """
+    # Imported here: transcode workers import this module without a database
+    from psycopg2.extras import execute_values
+    from db import get_db
+
+    abs_dir = os.path.join(save_root(), rel_dir)
+    with pack_dir_lock(abs_dir):
+        pack_files = [os.path.join(rel_dir, name) for name in list_packs(abs_dir)]
+        with get_db() as conn:
+            live = live_records(conn.cursor(), company_id, pack_files)
+
+        victims = []
+        reclaimed = 0
+        for pack_file in pack_files:
+            size = os.path.getsize(pack_path(pack_file))
+            live_bytes = sum(RECORD_HEADER.size + r['pack_length'] for r in live.get(pack_file, []))
+            dead = 1 - live_bytes / size if size else 1.0
+            if dead >= min_dead:
+                victims.append(pack_file)
+                reclaimed += size - live_bytes
+                print(f"{pack_file}: {size} bytes, {dead:.0%} dead{' (would compact)' if dry_run else ''}")
+
+        if not victims or dry_run:
+            return reclaimed if victims else 0
+
+        moved = [r for pack_file in victims for r in live.get(pack_file, [])]
+        if moved:
+            new_name = next_pack_name(abs_dir, reuse_last=False)
+            new_file = os.path.join(rel_dir, new_name)
+            blob_updates, rendition_updates = [], []
+            fd = open_pack_for_append(os.path.join(abs_dir, new_name))
+            try:
+                for r in moved:
+                    data = read_blob(r['pack_file'], r['pack_offset'], r['pack_length'])
+                    content_hash = r['content_hash'].strip()
+                    # Rendition records are keyed by their own bytes, not the blob's hash
+                    record_hash = hashlib.sha256(data).hexdigest()
+                    if r['rendition'] is None and record_hash != content_hash:
+                        print(f"⚠️ {r['pack_file']}@{r['pack_offset']}: content does not match {content_hash}")
+                    offset = write_record(fd, record_hash, data)
+                    if r['rendition'] is None:
+                        blob_updates.append((company_id, content_hash, new_file, offset, pack_path(new_file)))
+                    else:
+                        rendition_updates.append((company_id, content_hash, r['rendition'], new_file, offset))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            with get_db() as conn:
+                cur = conn.cursor()
+                if blob_updates:
+                    execute_values(cur, """
+                        UPDATE screenshot_blobs AS b
+                        SET pack_file = v.pack_file, pack_offset = v.pack_offset, saved_filename = v.saved_filename
+                        FROM (VALUES %s) AS v (company_id, content_hash, pack_file, pack_offset, saved_filename)
+                        WHERE b.company_id = v.company_id AND b.content_hash = v.content_hash
+                    """, blob_updates)
+                if rendition_updates:
+                    execute_values(cur, """
+                        UPDATE screenshot_renditions AS r
+                        SET pack_file = v.pack_file, pack_offset = v.pack_offset
+                        FROM (VALUES %s) AS v (company_id, content_hash, rendition, pack_file, pack_offset)
+                        WHERE r.company_id = v.company_id AND r.content_hash = v.content_hash
+                          AND r.rendition = v.rendition
+                    """, rendition_updates)
+                cur.execute("""
+                    UPDATE screenshots SET saved_filename = %s
+                    WHERE company_id = %s AND saved_filename = ANY(%s)
+                """, (pack_path(new_file), company_id, [pack_path(v) for v in victims]))
+
+        for pack_file in victims:
+            os.remove(pack_path(pack_file))
+        print(f"Compacted {len(victims)} packs in {rel_dir}: {len(moved)} live records kept, {reclaimed} bytes reclaimed")
+        return reclaimed
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'PACK_MAX_BYTES',
+    'RECORD_HEADER',
+    'save_root',
+    'pack_dir',
+    'pack_path',
+    'pack_dir_lock',
+    'list_packs',
+    'next_pack_name',
+    'write_record',
+    'open_pack_for_append',
+    'append_blob',
+    'read_blob',
+    'PackSlice',
+    'open_record',
+    'scan_pack',
+    'live_records',
+    'compact_pack_dir'
+]
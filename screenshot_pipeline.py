@@ -0,0 +1,778 @@
+"""
+SCREENSHOT_PIPELINE.PY - Asynchronous Screenshot Processing
+============================================================
+✅ Upload requests only accept raw image bytes or streams (durable hand-off queue on disk)
+✅ Decode / WebP transcode / validity check run in a bounded process pool
+✅ `screenshots` row insert and filesystem mirror happen off the request thread
+✅ Crash-safe: queued jobs survive restarts and are claimed with atomic renames
+✅ Content-addressed storage: identical WebP images (SHA-256) share one
+   `screenshot_blobs` row and one file; `screenshots` rows only reference them
+✅ Thumbnail and preview renditions generated at transcode time and stored
+   per blob in `screenshot_renditions` (the dashboard grid loads those)
+✅ Image bytes go to the configured blob store (blob_store.py); with the
+   `db` store the filesystem mirror is kept in append-only pack files
+✅ Memory-bounded decoding: pixel budget checked from the header, WebP
+   uploads kept as-is; with the opt-in SCREENSHOT_MAX_EDGE_PX, oversized
+   JPEGs are decoded straight at a reduced scale (draft); per-job peak RSS
+   of the transcode workers is measured
+✅ Near-duplicate suppression: a 64-bit dHash per frame; a frame within
+   SCREENSHOT_NEAR_DUP_DISTANCE bits of the member's previous frame is stored
+   as a reference to it or skipped (per-member policy), counted on the kept frame
+✅ Queue depth and throughput metrics for the health endpoint
+
+Queue layout (under SCREENSHOT_QUEUE_PATH):
+    pending/<job>.json     job metadata, waiting for a worker
+    processing/<job>.json  claimed by a dispatcher (mtime = claim time)
+    failed/<job>.json      gave up after SCREENSHOT_JOB_MAX_ATTEMPTS
+    blobs/<job>.bin        raw image bytes as uploaded by the tracker
+
+This module must stay importable without a database connection: the
+process-pool children import it to run transcode_job().
+"""
+
+import os
+import json
+import time
+import hashlib
+import uuid
+import queue
+import shutil
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from PIL import Image
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from psycopg2.extras import execute_values
+
+from screenshot_packs import append_blob, pack_path
+from blob_store import put_blob
+from member_day import record_screenshot
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+SAVE_SCREENSHOTS_TO_FS = os.getenv('SAVE_SCREENSHOTS_TO_FS', 'true').lower() in ('1', 'true', 'yes')
+SCREENSHOT_SAVE_PATH = os.getenv('SCREENSHOT_SAVE_PATH', os.path.join(os.getcwd(), 'screenshots'))
+
+PIPELINE_ENABLED = os.getenv('SCREENSHOT_PIPELINE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+QUEUE_PATH = os.getenv('SCREENSHOT_QUEUE_PATH', os.path.join(os.getcwd(), 'screenshot_queue'))
+PIPELINE_WORKERS = int(os.getenv('SCREENSHOT_PIPELINE_WORKERS', '2'))
+PIPELINE_MAX_INFLIGHT = int(os.getenv('SCREENSHOT_PIPELINE_MAX_INFLIGHT', str(PIPELINE_WORKERS * 2)))
+QUEUE_MAX_DEPTH = int(os.getenv('SCREENSHOT_QUEUE_MAX_DEPTH', '5000'))
+JOB_MAX_ATTEMPTS = int(os.getenv('SCREENSHOT_JOB_MAX_ATTEMPTS', '3'))
+JOB_STALE_SECONDS = int(os.getenv('SCREENSHOT_JOB_STALE_SECONDS', '600'))
+POLL_INTERVAL_SECONDS = float(os.getenv('SCREENSHOT_PIPELINE_POLL_SECONDS', '1.0'))
+START_METHOD = os.getenv('SCREENSHOT_PIPELINE_START_METHOD', 'spawn')
+
+WEBP_QUALITY = 80
+MIN_FILE_SIZE = 1024
+MIN_DIM = 100
+
+# Images over MAX_PIXELS are rejected before decoding. Opt-in: images larger
+# than MAX_EDGE_PX on the long edge are stored downscaled, which re-encodes
+# them and permanently lowers the stored quality (0 = keep the original size)
+MAX_PIXELS = int(os.getenv('SCREENSHOT_MAX_PIXELS', str(40_000_000)))
+MAX_EDGE_PX = int(os.getenv('SCREENSHOT_MAX_EDGE_PX', '0'))
+
+# Rendition name → longest edge in pixels. Images already within the bound get
+# no rendition (the original is served instead).
+RENDITIONS = {
+    'thumb': int(os.getenv('SCREENSHOT_THUMB_PX', '320')),
+    'preview': int(os.getenv('SCREENSHOT_PREVIEW_PX', '1280')),
+}
+RENDITION_WEBP_QUALITY = 70
+
+# Near-duplicate frames: 'keep' stores every frame, 'reference' stores a row
+# pointing at the previous frame's image, 'skip' stores nothing.
+# members.screenshot_near_dup_policy overrides the default per member.
+NEAR_DUP_POLICIES = ('keep', 'reference', 'skip')
+NEAR_DUP_POLICY = os.getenv('SCREENSHOT_NEAR_DUP_POLICY', 'reference').lower()
+NEAR_DUP_DISTANCE = int(os.getenv('SCREENSHOT_NEAR_DUP_DISTANCE', '2'))
+NEAR_DUP_WINDOW_MINUTES = int(os.getenv('SCREENSHOT_NEAR_DUP_WINDOW_MINUTES', '15'))
+
+PENDING_DIR = os.path.join(QUEUE_PATH, 'pending')
+PROCESSING_DIR = os.path.join(QUEUE_PATH, 'processing')
+FAILED_DIR = os.path.join(QUEUE_PATH, 'failed')
+BLOBS_DIR = os.path.join(QUEUE_PATH, 'blobs')
+
+
+class QueueFullError(Exception):
+    """Raised when the hand-off queue is at SCREENSHOT_QUEUE_MAX_DEPTH"""
+
+
+class ImageRejected(Exception):
+    """Raised for an image the pipeline will never accept (retrying is pointless)"""
+
+
+# ============================================================================
+# TRANSCODE (runs inside the process pool)
+# ============================================================================
+
+def _read_source(source):
+    """The raw bytes of a path, binary file object or bytes"""
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read()
+    source.seek(0)
+    return source.read()
+
+
+def transcode_image(source):
+    """
+    Decode an uploaded image (path, binary file object or bytes) and store it as WebP.
+    Returns a dict with the WebP bytes, dimensions and validity verdict.
+
+    The pixel budget is checked from the header before any pixel is decoded,
+    so no upload decodes to more than MAX_PIXELS. Originals keep their size
+    unless MAX_EDGE_PX is set; then larger images are decoded at the nearest
+    JPEG DCT scale (draft) and reduced, so a 4K JPEG never exists as a
+    full-size bitmap. A WebP upload that needs no resize is stored
+    byte-for-byte.
+    """
+    img = Image.open(BytesIO(source) if isinstance(source, bytes) else source)
+    if img.width * img.height > MAX_PIXELS:
+        raise ImageRejected(f"{img.width}x{img.height} exceeds the {MAX_PIXELS} pixel budget")
+
+    passthrough = img.format == 'WEBP'
+    if MAX_EDGE_PX and max(img.size) > MAX_EDGE_PX:
+        scale = MAX_EDGE_PX / max(img.size)
+        target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        img.draft(None, target)
+        img = img.resize(target, Image.LANCZOS, reducing_gap=2.0)
+        passthrough = False
+
+    if passthrough:
+        webp_binary = _read_source(source)
+    else:
+        output = BytesIO()
+        img.save(output, format='WEBP', quality=WEBP_QUALITY)
+        webp_binary = output.getvalue()
+    content_hash = hashlib.sha256(webp_binary).hexdigest()
+
+    is_valid = True
+    invalid_reason = None
+    if len(webp_binary) < MIN_FILE_SIZE or img.width < MIN_DIM or img.height < MIN_DIM:
+        is_valid = False
+        invalid_reason = 'too_small_or_small_dimensions'
+
+    return {
+        'webp': webp_binary,
+        'content_hash': content_hash,
+        'file_size': len(webp_binary),
+        'width': img.width,
+        'height': img.height,
+        'is_valid': is_valid,
+        'invalid_reason': invalid_reason,
+        'dhash': dhash(img),
+        'renditions': make_renditions(img)
+    }
+
+
+def dhash(img):
+    """64-bit difference hash (9x8 grayscale, left/right gradients) as a signed BIGINT"""
+    small = img.convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def hash_distance(a, b):
+    """Number of differing bits between two dHashes"""
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+
+def make_renditions(img):
+    """Downscaled WebP copies of a decoded image, keyed by rendition name"""
+    renditions = {}
+    for name, max_px in RENDITIONS.items():
+        if max(img.width, img.height) <= max_px:
+            continue
+        scaled = img.copy()
+        scaled.thumbnail((max_px, max_px), Image.LANCZOS)
+        output = BytesIO()
+        scaled.save(output, format='WEBP', quality=RENDITION_WEBP_QUALITY)
+        renditions[name] = {
+            'webp': output.getvalue(),
+            'width': scaled.width,
+            'height': scaled.height
+        }
+    return renditions
+
+
+def _reset_peak_rss():
+    """Reset this process's peak RSS (VmHWM) so the next reading covers one job (Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # Process-lifetime peak where VmHWM can't be reset
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+
+
+def transcode_job(blob_path):
+    """Process-pool entry point: transcode a queued image straight from its blob file"""
+    _reset_peak_rss()
+    started = time.perf_counter()
+    result = transcode_image(blob_path)
+    result['transcode_ms'] = (time.perf_counter() - started) * 1000.0
+    result['peak_rss_kb'] = _peak_rss_kb()
+    return result
+
+
+# ============================================================================
+# STORAGE (runs in the web process)
+# ============================================================================
+
+def blob_file_path(company_id, content_hash):
+    """Loose-file location of a content-addressed blob (before pack files; compaction packs these)"""
+    save_root = os.getenv('SCREENSHOT_SAVE_PATH', SCREENSHOT_SAVE_PATH)
+    return os.path.join(save_root, str(company_id), 'blobs', content_hash[:2], f"{content_hash}.webp")
+
+
+def store_screenshot_blob(cur, company_id, processed):
+    """
+    Reference (or create) the company's blob for a transcoded image.
+
+    A repeat capture only bumps ref_count, so its bytes never travel to the
+    database again. Returns (content_hash, saved_filename, deduplicated).
+    """
+    content_hash = processed['content_hash']
+
+    cur.execute("""
+        UPDATE screenshot_blobs
+        SET ref_count = ref_count + 1, last_referenced_at = NOW()
+        WHERE company_id = %s AND content_hash = %s
+        RETURNING saved_filename
+    """, (company_id, content_hash))
+    existing = cur.fetchone()
+    if existing:
+        return content_hash, existing['saved_filename'], True
+
+    # Bytes go to the blob store first; the row only keeps the locator.
+    # Losing the insert race below leaves an unreferenced pack record,
+    # reclaimed by compaction.
+    locator = put_blob(company_id, processed['webp'], content_hash)
+    cur.execute("""
+        INSERT INTO screenshot_blobs (
+            company_id, content_hash, data, storage_backend, pack_file, pack_offset, pack_length,
+            saved_filename, file_size, width, height, ref_count
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 1)
+        ON CONFLICT (company_id, content_hash) DO UPDATE
+        SET ref_count = screenshot_blobs.ref_count + 1, last_referenced_at = NOW()
+        RETURNING saved_filename, (xmax = 0) AS inserted
+    """, (
+        company_id, content_hash, locator['data'], locator['storage_backend'],
+        locator['pack_file'], locator['pack_offset'], locator['pack_length'],
+        pack_path(locator['pack_file']) if locator['pack_file'] else None,
+        processed['file_size'], processed['width'], processed['height']
+    ))
+    row = cur.fetchone()
+    saved_filename = row['saved_filename']
+    if not row['inserted']:
+        return content_hash, saved_filename, True
+    store_renditions(cur, company_id, content_hash, processed.get('renditions'))
+
+    # Database-stored blobs can still be mirrored to the filesystem. Callers
+    # only store screenshots for punched-in members, so
+    # SAVE_SCREENSHOTS_ONLY_WHEN_PUNCHED_IN is already satisfied here.
+    if SAVE_SCREENSHOTS_TO_FS and not saved_filename:
+        try:
+            pack_file, pack_offset, pack_length = append_blob(company_id, processed['webp'], content_hash)
+            saved_filename = pack_path(pack_file)
+            cur.execute("""
+                UPDATE screenshot_blobs
+                SET saved_filename = %s, pack_file = %s, pack_offset = %s, pack_length = %s
+                WHERE company_id = %s AND content_hash = %s
+            """, (saved_filename, pack_file, pack_offset, pack_length, company_id, content_hash))
+        except Exception as e:
+            print(f"⚠️ Failed to save screenshot blob to filesystem: {e}")
+
+    return content_hash, saved_filename, False
+
+
+def store_renditions(cur, company_id, content_hash, renditions):
+    """Store a blob's renditions in the blob store and index them (kept if they already exist)"""
+    if not renditions:
+        return
+    rows = []
+    for name, r in renditions.items():
+        locator = put_blob(company_id, r['webp'])
+        rows.append((
+            company_id, content_hash, name, locator['data'], locator['storage_backend'],
+            locator['pack_file'], locator['pack_offset'], locator['pack_length'],
+            len(r['webp']), r['width'], r['height']
+        ))
+    execute_values(cur, """
+        INSERT INTO screenshot_renditions (
+            company_id, content_hash, rendition, data, storage_backend, pack_file, pack_offset, pack_length,
+            file_size, width, height
+        )
+        VALUES %s
+        ON CONFLICT (company_id, content_hash, rendition) DO NOTHING
+    """, rows)
+
+
+def find_near_duplicate(cur, meta, processed):
+    """
+    The member's previous valid frame (same device, within the window) when
+    the new frame is a near duplicate of it and the member's policy isn't
+    'keep'. Returns (policy, previous row or None).
+    """
+    frame_hash = processed.get('dhash')
+    if frame_hash is None or not processed['is_valid']:
+        return NEAR_DUP_POLICY, None
+
+    cur.execute("""
+        SELECT COALESCE(m.screenshot_near_dup_policy, %s) AS policy, prev.*
+        FROM members m
+        LEFT JOIN LATERAL (
+            SELECT id, phash, near_dup_of, content_hash, file_size, width, height, saved_filename
+            FROM screenshots
+            WHERE company_id = m.company_id AND member_id = m.id
+              AND device_id IS NOT DISTINCT FROM %s
+              AND timestamp <= %s::timestamp
+              AND timestamp >= %s::timestamp - %s * INTERVAL '1 minute'
+              -- Bounds the partition key too, so only the current partition(s) are searched
+              AND tracking_date BETWEEN %s::date - 1 AND %s::date
+              AND is_valid AND phash IS NOT NULL
+            ORDER BY timestamp DESC
+            LIMIT 1
+        ) prev ON TRUE
+        WHERE m.id = %s AND m.company_id = %s
+    """, (
+        NEAR_DUP_POLICY, meta['device_db_id'], meta['timestamp'], meta['timestamp'],
+        NEAR_DUP_WINDOW_MINUTES, meta['tracking_date'], meta['tracking_date'],
+        meta['member_id'], meta['company_id']
+    ))
+    row = cur.fetchone()
+    policy = row['policy'] if row and row['policy'] in NEAR_DUP_POLICIES else NEAR_DUP_POLICY
+
+    if policy == 'keep' or not row or row['id'] is None:
+        return policy, None
+    if hash_distance(frame_hash, row['phash']) > NEAR_DUP_DISTANCE:
+        return policy, None
+    return policy, row
+
+
+def save_processed_screenshot(cur, meta, processed):
+    """
+    Insert the `screenshots` row for a transcoded image. The image itself is
+    stored once per company in `screenshot_blobs` (and mirrored to the
+    filesystem when SAVE_SCREENSHOTS_TO_FS is enabled). Returns the screenshot id.
+
+    A near duplicate of the member's previous frame is stored as a row
+    referencing that frame's image (near_dup_of) or, under the 'skip'
+    policy, not stored at all (the previous frame's id is returned).
+    Either way the kept frame's near_dup_count goes up.
+    """
+    company_id = meta['company_id']
+    member_id = meta['member_id']
+
+    policy, previous = find_near_duplicate(cur, meta, processed)
+    if previous:
+        kept_id = previous['near_dup_of'] or previous['id']
+        cur.execute("UPDATE screenshots SET near_dup_count = near_dup_count + 1 WHERE id = %s", (kept_id,))
+        if policy == 'skip':
+            _bump('near_duplicates_skipped')
+            print(f"🔍 Near-duplicate screenshot skipped for member {member_id} (kept {kept_id})")
+            return kept_id
+
+        # Reference the kept frame's image; the new frame's bytes are never stored
+        _bump('near_duplicates_referenced')
+        content_hash = previous['content_hash']
+        cur.execute("""
+            UPDATE screenshot_blobs
+            SET ref_count = ref_count + 1, last_referenced_at = NOW()
+            WHERE company_id = %s AND content_hash = %s
+        """, (company_id, content_hash))
+        image = {
+            'file_size': previous['file_size'], 'width': previous['width'], 'height': previous['height'],
+            'is_valid': True, 'invalid_reason': None, 'phash': previous['phash']
+        }
+        saved_filename = previous['saved_filename']
+        near_dup_of = kept_id
+        deduplicated = False
+    else:
+        content_hash, saved_filename, deduplicated = store_screenshot_blob(cur, company_id, processed)
+        image = dict(processed, phash=processed.get('dhash'))
+        near_dup_of = None
+
+    cur.execute("""
+        INSERT INTO screenshots (
+            company_id, member_id, device_id, raw_data_id, timestamp, tracking_date,
+            content_hash, file_size, width, height, is_valid, invalid_reason,
+            is_saved_to_fs, saved_filename, phash, near_dup_of
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING id
+    """, (
+        company_id, member_id, meta['device_db_id'], meta.get('raw_data_id'),
+        meta['timestamp'], meta['tracking_date'], content_hash,
+        image['file_size'], image['width'], image['height'],
+        image['is_valid'], image['invalid_reason'],
+        saved_filename is not None, saved_filename, image['phash'], near_dup_of
+    ))
+
+    result = cur.fetchone()
+    screenshot_id = result['id'] if result else None
+    record_screenshot(cur, company_id, member_id, meta['timestamp'])
+    if deduplicated:
+        _bump('deduplicated')
+    note = ' (duplicate)' if deduplicated else f' (near duplicate of {near_dup_of})' if near_dup_of else ''
+    print(f"🔍 screenshot_id={screenshot_id}, company_id={company_id}, member_id={member_id}, "
+          f"hash={content_hash[:12]}{note}")
+
+    return screenshot_id
+
+
+# ============================================================================
+# DURABLE HAND-OFF QUEUE
+# ============================================================================
+
+_stats_lock = threading.Lock()
+_stats = {
+    'enqueued': 0,
+    'processed': 0,
+    'failed': 0,
+    'requeued': 0,
+    'rejected_queue_full': 0,
+    'deduplicated': 0,
+    'near_duplicates_referenced': 0,
+    'near_duplicates_skipped': 0,
+    'rejected_too_large': 0,
+    'transcode_ms_total': 0.0,
+    'peak_rss_kb_total': 0,
+    'peak_rss_samples': 0,
+    'peak_rss_kb_max': 0,
+    'peak_rss_kb_last': None
+}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _record_peak_rss(peak_rss_kb):
+    if peak_rss_kb is None:
+        return
+    with _stats_lock:
+        _stats['peak_rss_kb_total'] += peak_rss_kb
+        _stats['peak_rss_samples'] += 1
+        _stats['peak_rss_kb_max'] = max(_stats['peak_rss_kb_max'], peak_rss_kb)
+        _stats['peak_rss_kb_last'] = peak_rss_kb
+
+
+def _ensure_queue_dirs():
+    for path in (PENDING_DIR, PROCESSING_DIR, FAILED_DIR, BLOBS_DIR):
+        os.makedirs(path, exist_ok=True)
+
+
+def _count_files(path, suffix='.json'):
+    try:
+        with os.scandir(path) as it:
+            return sum(1 for entry in it if entry.name.endswith(suffix))
+    except FileNotFoundError:
+        return 0
+
+
+def write_durable(path, payload):
+    """Write bytes (or copy a binary stream) to `path` atomically (tmp file + fsync + rename)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        if hasattr(payload, 'read'):
+            shutil.copyfileobj(payload, f, 256 * 1024)
+        else:
+            f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def enqueue_screenshot(meta, img_data):
+    """
+    Durably hand a raw screenshot to the pipeline and return the job id.
+
+    meta must contain company_id, member_id, device_db_id, raw_data_id,
+    timestamp and tracking_date. img_data is either bytes or a binary stream
+    (e.g. a multipart file part), which is copied to the queue in chunks
+    without being loaded into memory. The raw bytes are written first and the
+    metadata file last, so a job is only visible once it is complete.
+    """
+    _ensure_queue_dirs()
+
+    if _count_files(PENDING_DIR) >= QUEUE_MAX_DEPTH:
+        _bump('rejected_queue_full')
+        raise QueueFullError(f"Screenshot queue is full ({QUEUE_MAX_DEPTH} jobs)")
+
+    job_id = f"{time.time_ns()}_{uuid.uuid4().hex[:12]}"
+    job = dict(meta)
+    job['job_id'] = job_id
+    job['attempts'] = 0
+    job['enqueued_at'] = datetime.utcnow().isoformat()
+    for key in ('timestamp', 'tracking_date'):
+        if hasattr(job.get(key), 'isoformat'):
+            job[key] = job[key].isoformat()
+
+    write_durable(os.path.join(BLOBS_DIR, f"{job_id}.bin"), img_data)
+    write_durable(os.path.join(PENDING_DIR, f"{job_id}.json"), json.dumps(job).encode('utf-8'))
+
+    _bump('enqueued')
+    start_screenshot_pipeline()
+    _wakeup.set()
+    return job_id
+
+
+def _claim_next_job():
+    """Atomically move the oldest pending job into processing/. Returns the job dict or None."""
+    try:
+        names = sorted(n for n in os.listdir(PENDING_DIR) if n.endswith('.json'))
+    except FileNotFoundError:
+        return None
+
+    for name in names:
+        src = os.path.join(PENDING_DIR, name)
+        dst = os.path.join(PROCESSING_DIR, name)
+        try:
+            os.rename(src, dst)
+        except (FileNotFoundError, OSError):
+            continue  # another worker claimed it first
+        try:
+            os.utime(dst, None)
+            with open(dst, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Screenshot pipeline: unreadable job {name}: {e}")
+            try:
+                os.rename(dst, os.path.join(FAILED_DIR, name))
+            except OSError:
+                pass
+    return None
+
+
+def _finish_job(job):
+    job_id = job['job_id']
+    for path in (os.path.join(PROCESSING_DIR, f"{job_id}.json"), os.path.join(BLOBS_DIR, f"{job_id}.bin")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _retry_or_fail_job(job, error, retry=True):
+    job_id = job['job_id']
+    job['attempts'] = int(job.get('attempts', 0)) + 1
+    job['last_error'] = str(error)
+    target_dir = PENDING_DIR if retry and job['attempts'] < JOB_MAX_ATTEMPTS else FAILED_DIR
+    try:
+        write_durable(os.path.join(target_dir, f"{job_id}.json"), json.dumps(job).encode('utf-8'))
+        os.remove(os.path.join(PROCESSING_DIR, f"{job_id}.json"))
+    except Exception as e:
+        print(f"⚠️ Screenshot pipeline: could not move job {job_id}: {e}")
+
+    if target_dir == FAILED_DIR:
+        _bump('failed')
+        print(f"❌ Screenshot job {job_id} failed after {job['attempts']} attempts: {error}")
+    else:
+        _bump('requeued')
+        print(f"⚠️ Screenshot job {job_id} requeued (attempt {job['attempts']}): {error}")
+
+
+def _recover_stale_jobs():
+    """Move jobs left in processing/ by a crashed worker back to pending/"""
+    cutoff = time.time() - JOB_STALE_SECONDS
+    try:
+        names = [n for n in os.listdir(PROCESSING_DIR) if n.endswith('.json')]
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(PROCESSING_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.rename(path, os.path.join(PENDING_DIR, name))
+                print(f"♻️ Screenshot pipeline: recovered stale job {name}")
+        except OSError:
+            continue
+
+
+# ============================================================================
+# DISPATCHER
+# ============================================================================
+
+_start_lock = threading.Lock()
+_started = False
+_wakeup = threading.Event()
+_inflight = threading.BoundedSemaphore(max(1, PIPELINE_MAX_INFLIGHT))
+_results = queue.Queue()
+_inflight_count = 0
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=max(1, PIPELINE_WORKERS),
+            mp_context=multiprocessing.get_context(START_METHOD)
+        )
+    return _executor
+
+
+def _set_inflight(delta):
+    global _inflight_count
+    with _stats_lock:
+        _inflight_count += delta
+
+
+def _dispatch_loop():
+    last_recovery = 0.0
+    while True:
+        if time.time() - last_recovery > 60:
+            _recover_stale_jobs()
+            last_recovery = time.time()
+
+        _inflight.acquire()
+        job = _claim_next_job()
+        if job is None:
+            _inflight.release()
+            _wakeup.wait(POLL_INTERVAL_SECONDS)
+            _wakeup.clear()
+            continue
+
+        _set_inflight(1)
+        blob_path = os.path.join(BLOBS_DIR, f"{job['job_id']}.bin")
+        try:
+            future = _get_executor().submit(transcode_job, blob_path)
+        except Exception as e:
+            _results.put((job, None, e))
+            continue
+        future.add_done_callback(lambda fut, job=job: _results.put((job, fut, None)))
+
+
+def _writer_loop():
+    from db import get_db
+
+    while True:
+        job, future, error = _results.get()
+        try:
+            if error is None:
+                error = future.exception()
+            if isinstance(error, ImageRejected):
+                _bump('rejected_too_large')
+                _retry_or_fail_job(job, error, retry=False)
+                continue
+            if error is not None:
+                _retry_or_fail_job(job, error)
+                continue
+
+            processed = future.result()
+            with get_db() as conn:
+                cur = conn.cursor()
+                save_processed_screenshot(cur, job, processed)
+            _finish_job(job)
+            _bump('processed')
+            _bump('transcode_ms_total', processed.get('transcode_ms', 0.0))
+            _record_peak_rss(processed.get('peak_rss_kb'))
+        except Exception as e:
+            _retry_or_fail_job(job, e)
+        finally:
+            _set_inflight(-1)
+            _inflight.release()
+
+
+def start_screenshot_pipeline():
+    """Start the dispatcher and writer threads for this process (idempotent)"""
+    global _started
+    if not PIPELINE_ENABLED or _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        _ensure_queue_dirs()
+        threading.Thread(target=_dispatch_loop, name='screenshot-dispatcher', daemon=True).start()
+        threading.Thread(target=_writer_loop, name='screenshot-writer', daemon=True).start()
+        _started = True
+        print(f"📸 Screenshot pipeline started (workers={PIPELINE_WORKERS}, queue={QUEUE_PATH})")
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+def get_pipeline_stats():
+    """Queue depth and throughput counters for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+        inflight = _inflight_count
+    processed = stats['processed']
+    rss_samples = stats['peak_rss_samples']
+    return {
+        'enabled': PIPELINE_ENABLED,
+        'queue_depth': _count_files(PENDING_DIR),
+        'processing': _count_files(PROCESSING_DIR),
+        'failed_jobs': _count_files(FAILED_DIR),
+        'inflight': inflight,
+        'workers': PIPELINE_WORKERS,
+        'max_queue_depth': QUEUE_MAX_DEPTH,
+        'enqueued': stats['enqueued'],
+        'processed': processed,
+        'failed': stats['failed'],
+        'requeued': stats['requeued'],
+        'rejected_queue_full': stats['rejected_queue_full'],
+        'deduplicated': stats['deduplicated'],
+        'near_duplicates_referenced': stats['near_duplicates_referenced'],
+        'near_duplicates_skipped': stats['near_duplicates_skipped'],
+        'rejected_too_large': stats['rejected_too_large'],
+        'avg_transcode_ms': round(stats['transcode_ms_total'] / processed, 1) if processed else None,
+        'worker_peak_rss_kb': {
+            'last': stats['peak_rss_kb_last'],
+            'avg': round(stats['peak_rss_kb_total'] / rss_samples) if rss_samples else None,
+            'max': stats['peak_rss_kb_max'] or None
+        }
+    }
+
+
+__all__ = [
+    'PIPELINE_ENABLED',
+    'SAVE_SCREENSHOTS_TO_FS',
+    'SCREENSHOT_SAVE_PATH',
+    'RENDITIONS',
+    'NEAR_DUP_POLICIES',
+    'QueueFullError',
+    'ImageRejected',
+    'write_durable',
+    'transcode_image',
+    'make_renditions',
+    'dhash',
+    'hash_distance',
+    'blob_file_path',
+    'store_screenshot_blob',
+    'store_renditions',
+    'find_near_duplicate',
+    'save_processed_screenshot',
+    'enqueue_screenshot',
+    'start_screenshot_pipeline',
+    'get_pipeline_stats'
+]
@@ -3,18 +3,25 @@ SCREENSHOTS_ROUTES.PY - Screenshot Retrieval (Admin-Only)
 ==========================================================
 ✅ Secure company-scoped screenshot access
 ✅ Returns WebP screenshots with pagination
+✅ Thumbnail / preview renditions via ?size= (listing returns their URLs)
+✅ Images served from the blob store (blob_store.py): pack-file records go
+   out via sendfile(), so the bytes pass neither the database connection
+   nor Python memory
 ✅ Linked to member_id and admin_token
 """
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, url_for
 from admin_auth_routes import require_admin_auth
 from db import get_db
+from blob_store import open_blob
 from datetime import datetime, timedelta
-from io import BytesIO
 import os
 
 screenshots_bp = Blueprint('screenshots', __name__)
 
+# ?size= values for the image endpoint ('full' is the original WebP)
+IMAGE_SIZES = ('thumb', 'preview', 'full')
+
 # ============================================================================
 # GET SCREENSHOTS FOR MEMBER
 # ============================================================================
@@ -34,6 +41,8 @@ def get_member_screenshots(member_id):
     - date: Filter by date (YYYY-MM-DD), defaults to today IST
     - limit: Number of screenshots (default 20, max 100)
     - offset: Pagination offset (default 0)
+    - collapse: true to hide near-duplicate reference frames (their kept
+      frame carries near_duplicate_count)
     """
     try:
         company_id = request.company_id  # From JWT
@@ -42,6 +51,8 @@ def get_member_screenshots(member_id):
         date_str = request.args.get('date')
         limit = min(int(request.args.get('limit', 20)), 100)
         offset = int(request.args.get('offset', 0))
+        collapse = request.args.get('collapse', 'false').lower() in ('1', 'true', 'yes')
+        near_dup_clause = 'AND near_dup_of IS NULL' if collapse else ''
         
         # Default to today IST if no date specified
         if date_str:
@@ -73,22 +84,25 @@ def get_member_screenshots(member_id):
             if not member:
                 return jsonify({'error': 'Member not found'}), 404
             
-            # Get total count
+            # local_date is the IST day asked for; tracking_date (the UTC day and
+            # partition key) is bounded around it so other partitions are skipped
             cur.execute(
-                """
+                f"""
                 SELECT COUNT(*) as total
                 FROM screenshots
                 WHERE company_id = %s 
                   AND member_id = %s 
-                  AND tracking_date = %s
+                  AND local_date = %s
+                  AND tracking_date BETWEEN %s::date - 1 AND %s::date + 1
+                  {near_dup_clause}
                 """,
-                (company_id, member_id, filter_date)
+                (company_id, member_id, filter_date, filter_date, filter_date)
             )
             total_count = cur.fetchone()['total']
             
             # Get screenshots (metadata only, no binary data yet)
             cur.execute(
-                """
+                f"""
                 SELECT 
                     id,
                     timestamp,
@@ -100,15 +114,19 @@ def get_member_screenshots(member_id):
                     invalid_reason,
                     is_saved_to_fs,
                     saved_filename,
+                    near_dup_of,
+                    near_dup_count,
                     created_at
                 FROM screenshots
                 WHERE company_id = %s 
                   AND member_id = %s 
-                  AND tracking_date = %s
+                  AND local_date = %s
+                  AND tracking_date BETWEEN %s::date - 1 AND %s::date + 1
+                  {near_dup_clause}
                 ORDER BY timestamp DESC
                 LIMIT %s OFFSET %s
                 """,
-                (company_id, member_id, filter_date, limit, offset)
+                (company_id, member_id, filter_date, filter_date, filter_date, limit, offset)
             )
             screenshots = cur.fetchall()
             
@@ -126,6 +144,11 @@ def get_member_screenshots(member_id):
                     'invalid_reason': screenshot.get('invalid_reason'),
                     'is_saved_to_fs': bool(screenshot.get('is_saved_to_fs')),
                     'saved_filename': screenshot.get('saved_filename'),
+                    'near_duplicate_of': screenshot.get('near_dup_of'),
+                    'near_duplicate_count': screenshot.get('near_dup_count') or 0,
+                    'image_url': url_for('screenshots.get_screenshot_image', screenshot_id=screenshot['id']),
+                    'thumbnail_url': url_for('screenshots.get_screenshot_image', screenshot_id=screenshot['id'], size='thumb'),
+                    'preview_url': url_for('screenshots.get_screenshot_image', screenshot_id=screenshot['id'], size='preview'),
                     'name': member['name'],
                     'email': member['email']
                 })
@@ -161,37 +184,81 @@ def get_screenshot_image(screenshot_id):
     Security:
     - Admin JWT required
     - Verifies screenshot belongs to admin's company
+
+    Query params:
+    - size: thumb | preview | full (default). Falls back to the original
+      when the image has no rendition of that size (small or older images).
     """
     try:
         company_id = request.company_id
+
+        size = request.args.get('size', 'full')
+        if size not in IMAGE_SIZES:
+            return jsonify({'error': f"Invalid size. Use one of: {', '.join(IMAGE_SIZES)}"}), 400
         
         with get_db() as conn:
             cur = conn.cursor()
             
             # Get screenshot with company verification
+            # Locator of the rendition (or the original); bytes are only
+            # selected when there is no local pack copy to serve
             cur.execute(
                 """
-                SELECT screenshot_data, timestamp
-                FROM screenshots
-                WHERE id = %s AND company_id = %s
+                SELECT s.timestamp, s.content_hash, r.rendition,
+                       CASE WHEN r.rendition IS NOT NULL THEN r.storage_backend ELSE b.storage_backend END AS storage_backend,
+                       CASE WHEN r.rendition IS NOT NULL THEN r.pack_file ELSE b.pack_file END AS pack_file,
+                       CASE WHEN r.rendition IS NOT NULL THEN r.pack_offset ELSE b.pack_offset END AS pack_offset,
+                       CASE WHEN r.rendition IS NOT NULL THEN r.pack_length ELSE b.pack_length END AS pack_length,
+                       CASE WHEN (CASE WHEN r.rendition IS NOT NULL THEN r.pack_file ELSE b.pack_file END) IS NULL
+                            THEN COALESCE(r.data, s.screenshot_data, b.data) END AS data
+                FROM screenshots s
+                LEFT JOIN screenshot_blobs b
+                  ON b.company_id = s.company_id AND b.content_hash = s.content_hash
+                LEFT JOIN screenshot_renditions r
+                  ON r.company_id = s.company_id AND r.content_hash = s.content_hash AND r.rendition = %s
+                WHERE s.id = %s AND s.company_id = %s
                 """,
-                (screenshot_id, company_id)
+                (size, screenshot_id, company_id)
             )
             screenshot = cur.fetchone()
             
             if not screenshot:
                 return jsonify({'error': 'Screenshot not found'}), 404
-            
-            if not screenshot['screenshot_data']:
+
+            def load_data():
+                # Pack not on this host: database copy, if the row kept one
+                cur.execute(
+                    """
+                    SELECT COALESCE(r.data, s.screenshot_data, b.data) AS data
+                    FROM screenshots s
+                    LEFT JOIN screenshot_blobs b
+                      ON b.company_id = s.company_id AND b.content_hash = s.content_hash
+                    LEFT JOIN screenshot_renditions r
+                      ON r.company_id = s.company_id AND r.content_hash = s.content_hash AND r.rendition = %s
+                    WHERE s.id = %s
+                    """,
+                    (size, screenshot_id)
+                )
+                return cur.fetchone()['data']
+
+            image_file, length = open_blob(screenshot, load_data)
+            if image_file is None or not length:
                 return jsonify({'error': 'Screenshot data missing'}), 404
             
-            # Return WebP image
-            return send_file(
-                BytesIO(screenshot['screenshot_data']),
+            # Return WebP image (immutable once stored, so the grid can cache it).
+            # Content-Length bounds the response to the record, so gunicorn
+            # sendfile()s it straight out of the pack file.
+            suffix = f"_{screenshot['rendition']}" if screenshot['rendition'] else ''
+            response = send_file(
+                image_file,
                 mimetype='image/webp',
                 as_attachment=False,
-                download_name=f"screenshot_{screenshot_id}_{screenshot['timestamp'].strftime('%Y%m%d_%H%M%S')}.webp"
+                download_name=f"screenshot_{screenshot_id}_{screenshot['timestamp'].strftime('%Y%m%d_%H%M%S')}{suffix}.webp",
+                conditional=False
             )
+            response.content_length = length
+            response.headers['Cache-Control'] = 'private, max-age=86400'
+            return response
     
     except Exception as e:
         print(f"❌ Get screenshot image error: {e}")
@@ -222,7 +289,8 @@ def backfill_screenshots():
 
         with get_db() as conn:
             cur = conn.cursor()
-            params = [cutoff, limit]
+            # tracking_date bound lets Postgres skip partitions older than the window
+            params = [cutoff, (cutoff - timedelta(days=1)).date(), limit]
             member_clause = ''
             if member_id:
                 member_clause = 'AND member_id = %s'
@@ -233,6 +301,8 @@ def backfill_screenshots():
                 FROM screenshots
                 WHERE screenshot_data IS NOT NULL AND (is_saved_to_fs IS DISTINCT FROM TRUE OR saved_filename IS NULL)
                   AND timestamp >= %s
+                  AND tracking_date >= %s
+                LIMIT %s
             """
             if member_clause:
                 # Place member filter correctly
@@ -0,0 +1,40 @@
+"""
+Idempotent tracker uploads.
+
+Adds `activity_log.client_seq` (the tracker's upload sequence number) and a
+partial unique index on (company_id, device_id, client_seq), so a replayed
+upload hits ON CONFLICT DO NOTHING instead of inserting a duplicate row and
+screenshot. Rows from trackers that send no seq keep client_seq NULL.
+
+Usage:
+  python scripts/add_activity_client_seq.py
+"""
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'activity_log'")
+        existing = [r['column_name'] for r in cur.fetchall()]
+
+        if 'client_seq' not in existing:
+            cur.execute("ALTER TABLE activity_log ADD COLUMN client_seq BIGINT NULL")
+            print('Added client_seq')
+        else:
+            print('client_seq exists')
+
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_activity_log_client_seq
+            ON activity_log (company_id, device_id, client_seq)
+            WHERE client_seq IS NOT NULL
+        """)
+        print('Index uq_activity_log_client_seq ready')
+
+
+if __name__ == '__main__':
+    create_schema()
+    print('Migration complete')
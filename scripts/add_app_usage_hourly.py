@@ -0,0 +1,86 @@
+"""
+Hourly application usage rollup (see app_usage.py).
+
+Creates `app_usage_hourly`, the `rollup_watermarks` table the rollup job
+keeps its activity_log id watermark in, and the (member, time) index the
+rollup reads samples through. The job backfills existing rows on its own,
+in id batches; --backfill does it now instead (after waiting out
+APP_USAGE_ROLLUP_LAG_SECONDS, so uploads in flight are committed).
+
+Usage:
+  python scripts/add_app_usage_hourly.py
+  python scripts/add_app_usage_hourly.py --backfill
+"""
+
+import sys, os
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS app_usage_hourly (
+                company_id INTEGER NOT NULL,
+                member_id INTEGER NOT NULL,
+                hour TIMESTAMP NOT NULL,
+                process VARCHAR(255) NOT NULL,
+                total_seconds NUMERIC(12,2) NOT NULL DEFAULT 0,
+                active_seconds NUMERIC(12,2) NOT NULL DEFAULT 0,
+                idle_seconds NUMERIC(12,2) NOT NULL DEFAULT 0,
+                samples INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (member_id, hour, process)
+            )
+        """)
+        print('app_usage_hourly ready')
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_app_usage_hourly_company_hour
+            ON app_usage_hourly (company_id, hour)
+        """)
+        print('Index idx_app_usage_hourly_company_hour ready')
+
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS rollup_watermarks (
+                name VARCHAR(64) PRIMARY KEY,
+                last_id BIGINT NOT NULL DEFAULT 0,
+                safe_id BIGINT NOT NULL DEFAULT 0,
+                horizon_id BIGINT NULL,
+                horizon_at TIMESTAMP NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Tables created before the time-based lag kept the previous batch's id instead
+        cur.execute("ALTER TABLE rollup_watermarks ADD COLUMN IF NOT EXISTS safe_id BIGINT NOT NULL DEFAULT 0")
+        cur.execute("ALTER TABLE rollup_watermarks ADD COLUMN IF NOT EXISTS horizon_id BIGINT NULL")
+        cur.execute("ALTER TABLE rollup_watermarks ADD COLUMN IF NOT EXISTS horizon_at TIMESTAMP NULL")
+        cur.execute("ALTER TABLE rollup_watermarks DROP COLUMN IF EXISTS previous_id")
+        print('rollup_watermarks ready')
+
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_activity_log_member_time ON activity_log (member_id, timestamp)")
+        print('Index idx_activity_log_member_time ready')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backfill', action='store_true', default=False, help='Roll up existing activity now')
+    parser.add_argument('--batch', type=int, default=50000, help='activity_log ids per transaction')
+    args = parser.parse_args()
+
+    create_schema()
+    if args.backfill:
+        import time
+        from app_usage import run_app_usage_rollup, APP_USAGE_ROLLUP_LAG_SECONDS
+        # The first pass records the MAX(id) horizon; it is safe to fold once the lag has passed
+        run_app_usage_rollup(args.batch)
+        print(f'Waiting {APP_USAGE_ROLLUP_LAG_SECONDS:.0f}s for uploads in flight to commit')
+        time.sleep(APP_USAGE_ROLLUP_LAG_SECONDS)
+        totals = run_app_usage_rollup(args.batch)
+        if totals is None:
+            print('Another worker is rolling up; the background job will finish the backfill')
+        else:
+            print(f"Rolled up {totals['hours']} member hours in {totals['batches']} batches")
+    print('Migration complete')
@@ -0,0 +1,166 @@
+"""
+Blob store locators for screenshot images (see blob_store.py).
+
+Adds `storage_backend` ('db' | 'local') to `screenshot_blobs` and
+`screenshot_renditions`, gives renditions the same pack locator columns as
+blobs, then moves existing BYTEA images out of Postgres into local pack
+files in batches:
+
+  1. inline `screenshots.screenshot_data` is folded into `screenshot_blobs`
+     (scripts/add_screenshot_blobs.py)
+  2. blobs already mirrored to a pack only drop their BYTEA once the pack
+     copy checks out; the others are appended to the pack of the day they
+     were created
+  3. renditions are appended the same way
+
+Space is only returned to the OS after the tables are rewritten
+(VACUUM FULL or pg_repack on screenshot_blobs / screenshot_renditions /
+screenshots); plain VACUUM makes it reusable for new rows.
+
+Usage:
+  python scripts/add_blob_store.py                 # schema + move images out
+  python scripts/add_blob_store.py --schema-only
+  python scripts/add_blob_store.py --batch 50
+"""
+
+import sys, os
+import argparse
+import hashlib
+from datetime import datetime
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db
+from screenshot_packs import append_blob, read_blob, pack_path
+from add_screenshot_blobs import migrate_existing as fold_inline_screenshots
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+
+        for table, columns in (
+            ('screenshot_blobs', (
+                ('storage_backend', "ALTER TABLE screenshot_blobs ADD COLUMN storage_backend VARCHAR(16) NOT NULL DEFAULT 'db'"),
+            )),
+            ('screenshot_renditions', (
+                ('storage_backend', "ALTER TABLE screenshot_renditions ADD COLUMN storage_backend VARCHAR(16) NOT NULL DEFAULT 'db'"),
+                ('pack_file', 'ALTER TABLE screenshot_renditions ADD COLUMN pack_file TEXT NULL'),
+                ('pack_offset', 'ALTER TABLE screenshot_renditions ADD COLUMN pack_offset BIGINT NULL'),
+                ('pack_length', 'ALTER TABLE screenshot_renditions ADD COLUMN pack_length INTEGER NULL'),
+            )),
+        ):
+            cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = %s", (table,))
+            existing = [r['column_name'] for r in cur.fetchall()]
+            for column, ddl in columns:
+                if column not in existing:
+                    cur.execute(ddl)
+                    print(f'Added {table}.{column}')
+                else:
+                    print(f'{table}.{column} exists')
+
+        # Locally stored renditions keep no bytes in the row
+        cur.execute("ALTER TABLE screenshot_renditions ALTER COLUMN data DROP NOT NULL")
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_screenshot_renditions_pack_file
+            ON screenshot_renditions (pack_file) WHERE pack_file IS NOT NULL
+        """)
+        print('Index idx_screenshot_renditions_pack_file ready')
+
+
+def move_blobs(batch_size=50):
+    """Move screenshot_blobs BYTEA into packs, one batch per transaction"""
+    total = 0
+    last_key = (0, '')
+    while True:
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT company_id, content_hash, data, created_at, pack_file, pack_offset, pack_length
+                FROM screenshot_blobs
+                WHERE (company_id, content_hash) > (%s, %s) AND data IS NOT NULL
+                ORDER BY company_id, content_hash
+                LIMIT %s
+            """, (*last_key, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_key = (rows[-1]['company_id'], rows[-1]['content_hash'])
+
+            for row in rows:
+                content_hash = row['content_hash'].strip()
+                locator = None
+                if row['pack_file']:
+                    mirrored = (row['pack_file'], row['pack_offset'], row['pack_length'])
+                    try:
+                        if hashlib.sha256(read_blob(*mirrored)).hexdigest() == content_hash:
+                            locator = mirrored
+                    except OSError:
+                        pass
+                    if locator is None:
+                        print(f"⚠️ Blob {content_hash}: pack copy missing or damaged, packing again")
+                if locator is None:
+                    day = (row['created_at'] or datetime.utcnow()).date()
+                    locator = append_blob(row['company_id'], bytes(row['data']), content_hash, day)
+
+                cur.execute("""
+                    UPDATE screenshot_blobs
+                    SET data = NULL, storage_backend = 'local',
+                        pack_file = %s, pack_offset = %s, pack_length = %s, saved_filename = %s
+                    WHERE company_id = %s AND content_hash = %s
+                """, (*locator, pack_path(locator[0]), row['company_id'], row['content_hash']))
+                cur.execute("""
+                    UPDATE screenshots SET saved_filename = %s, is_saved_to_fs = TRUE
+                    WHERE company_id = %s AND content_hash = %s AND saved_filename IS NULL
+                """, (pack_path(locator[0]), row['company_id'], row['content_hash']))
+
+        total += len(rows)
+        print(f'Moved {len(rows)} blobs out of the database (total {total})')
+
+
+def move_renditions(batch_size=50):
+    """Move screenshot_renditions BYTEA into packs, one batch per transaction"""
+    total = 0
+    last_key = (0, '', '')
+    while True:
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT r.company_id, r.content_hash, r.rendition, r.data, b.created_at
+                FROM screenshot_renditions r
+                JOIN screenshot_blobs b ON b.company_id = r.company_id AND b.content_hash = r.content_hash
+                WHERE (r.company_id, r.content_hash, r.rendition) > (%s, %s, %s) AND r.data IS NOT NULL
+                ORDER BY r.company_id, r.content_hash, r.rendition
+                LIMIT %s
+            """, (*last_key, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_key = (rows[-1]['company_id'], rows[-1]['content_hash'], rows[-1]['rendition'])
+
+            for row in rows:
+                day = (row['created_at'] or datetime.utcnow()).date()
+                locator = append_blob(row['company_id'], bytes(row['data']), day=day)
+                cur.execute("""
+                    UPDATE screenshot_renditions
+                    SET data = NULL, storage_backend = 'local',
+                        pack_file = %s, pack_offset = %s, pack_length = %s
+                    WHERE company_id = %s AND content_hash = %s AND rendition = %s
+                """, (*locator, row['company_id'], row['content_hash'], row['rendition']))
+
+        total += len(rows)
+        print(f'Moved {len(rows)} renditions out of the database (total {total})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schema-only', action='store_true', default=False, help='Add columns only')
+    parser.add_argument('--batch', type=int, default=50, help='Images moved per transaction')
+    args = parser.parse_args()
+
+    create_schema()
+    if not args.schema_only:
+        fold_inline_screenshots()
+        move_blobs(args.batch)
+        move_renditions(args.batch)
+        print('Run VACUUM FULL (or pg_repack) on screenshot_blobs, screenshot_renditions and screenshots to return the space')
+    print('Migration complete')
@@ -0,0 +1,122 @@
+"""
+Interned URL, domain, process and window title dimensions (see dimensions.py).
+
+Creates dim_domains, dim_urls, dim_processes and dim_window_titles and adds
+process_id, window_title_id and url_ids to activity_log. --backfill fills
+those columns on existing rows (only rows that have none of them), newest
+first within --days, in id batches of one transaction each.
+
+Usage:
+  python scripts/add_dimensions.py
+  python scripts/add_dimensions.py --backfill --days 31
+"""
+
+import sys, os
+import argparse
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from psycopg2.extras import execute_values
+from db import get_db
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS dim_domains (
+                id SERIAL PRIMARY KEY,
+                domain VARCHAR(255) NOT NULL UNIQUE
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS dim_urls (
+                id SERIAL PRIMARY KEY,
+                url TEXT NOT NULL,
+                domain_id INTEGER NOT NULL REFERENCES dim_domains(id)
+            )
+        """)
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_dim_urls_url ON dim_urls (md5(url))")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_dim_urls_domain ON dim_urls (domain_id)")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS dim_processes (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL UNIQUE
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS dim_window_titles (
+                id SERIAL PRIMARY KEY,
+                title TEXT NOT NULL
+            )
+        """)
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_dim_window_titles_title ON dim_window_titles (md5(title))")
+        print('Dimension tables ready')
+
+        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'activity_log'")
+        existing = [r['column_name'] for r in cur.fetchall()]
+        for column, definition in (
+            ('process_id', 'INTEGER NULL'),
+            ('window_title_id', 'INTEGER NULL'),
+            ('url_ids', 'INTEGER[] NULL'),
+        ):
+            if column not in existing:
+                cur.execute(f"ALTER TABLE activity_log ADD COLUMN {column} {definition}")
+                print(f'Added activity_log.{column}')
+            else:
+                print(f'activity_log.{column} exists')
+
+
+def backfill(days=31, batch_size=5000):
+    from dimensions import intern_samples, sample_dimension_ids
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    last_id = None
+    total = 0
+    while True:
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT id, timestamp, current_process, current_window, browser_history
+                FROM activity_log
+                WHERE timestamp >= %s
+                  AND process_id IS NULL AND window_title_id IS NULL AND url_ids IS NULL
+                  {'AND id < %s' if last_id else ''}
+                ORDER BY id DESC
+                LIMIT %s
+            """, (cutoff, last_id, batch_size) if last_id else (cutoff, batch_size))
+            rows = cur.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+
+        samples = [{
+            'currentprocess': row['current_process'],
+            'currentwindow': row['current_window'],
+            'browserhistory': row['browser_history']
+        } for row in rows]
+        ids = intern_samples(samples)
+        values = [(row['id'], row['timestamp'], *sample_dimension_ids(sample, ids)) for row, sample in zip(rows, samples)]
+        values = [v for v in values if any(x is not None for x in v[2:])]
+
+        with get_db() as conn:
+            execute_values(conn.cursor(), """
+                UPDATE activity_log a
+                SET process_id = v.process_id, window_title_id = v.window_title_id, url_ids = v.url_ids
+                FROM (VALUES %s) AS v(id, timestamp, process_id, window_title_id, url_ids)
+                WHERE a.id = v.id AND a.timestamp = v.timestamp
+            """, values, template='(%s, %s::timestamp, %s::int, %s::int, %s::int[])', page_size=len(values) or 1)
+        total += len(values)
+        print(f'Backfilled {total} rows (id >= {last_id})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backfill', action='store_true', default=False, help='Fill the new columns on existing rows')
+    parser.add_argument('--days', type=int, default=31, help='Backfill rows from the last N days')
+    parser.add_argument('--batch', type=int, default=5000, help='Rows per transaction')
+    args = parser.parse_args()
+
+    create_schema()
+    if args.backfill:
+        backfill(args.days, args.batch)
+    print('Migration complete')
@@ -0,0 +1,33 @@
+"""
+Per-company ingest limits for tracker admission control.
+
+Adds `ingest_rate_per_minute` and `ingest_burst` to company_configurations.
+NULL means the server default (INGEST_RATE_PER_MINUTE / INGEST_BURST);
+a rate of 0 disables the limit for that company.
+
+Usage:
+  python scripts/add_ingest_limits.py
+"""
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'company_configurations'")
+        existing = [r['column_name'] for r in cur.fetchall()]
+
+        for column in ('ingest_rate_per_minute', 'ingest_burst'):
+            if column not in existing:
+                cur.execute(f"ALTER TABLE company_configurations ADD COLUMN {column} INTEGER NULL")
+                print(f'Added {column}')
+            else:
+                print(f'{column} exists')
+
+
+if __name__ == '__main__':
+    create_schema()
+    print('Migration complete')
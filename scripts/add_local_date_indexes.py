@@ -0,0 +1,151 @@
+"""
+Stored local date on activity_log and screenshots, plus the route index pack.
+
+local_date is the sample's date in LOCAL_TIMEZONE (member_day.py), the day
+every dashboard and route date parameter means. It is filled by a BEFORE
+INSERT / UPDATE OF timestamp trigger, so every writer (uploads, batch ingest,
+the screenshot pipeline, scripts) gets it without listing the column, and
+routes filter and group on the column instead of DATE(timestamp), which no
+index can serve. punch_logs needs no new column: punch_date is already
+written as the IST date at punch in.
+
+The index pack is versioned: INDEX_PACK_VERSION is recorded in
+index_pack_versions once every index in INDEX_PACK exists and the
+RETIRED_INDEXES are gone. Change the pack by bumping the version.
+
+Existing rows are backfilled newest first, in id batches of one
+transaction each; routes read local_date, so let the backfill finish
+before deploying them.
+
+Usage:
+  python scripts/add_local_date_indexes.py
+  python scripts/add_local_date_indexes.py --skip-backfill
+"""
+
+import sys, os
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db
+from member_day import LOCAL_DATE_SQL
+
+# table -> partition key (the backfill addresses rows by id and key)
+LOCAL_DATE_TABLES = {
+    'activity_log': 'timestamp',
+    'screenshots': 'tracking_date',
+}
+
+INDEX_PACK_VERSION = 1
+
+# (name, table, definition)
+INDEX_PACK = [
+    ('idx_activity_log_member_local_date', 'activity_log', '(member_id, local_date)'),
+    ('idx_activity_log_time_brin', 'activity_log', 'USING brin (timestamp)'),
+    ('idx_screenshots_member_local_date', 'screenshots', '(company_id, member_id, local_date, timestamp DESC)'),
+    ('idx_screenshots_time_brin', 'screenshots', 'USING brin (timestamp)'),
+    ('idx_punch_logs_company_date', 'punch_logs', '(company_id, punch_date)'),
+    ('idx_punch_logs_member_date', 'punch_logs', '(member_id, punch_date)'),
+]
+
+# Indexes no route reads any more (screenshots.captured_at is never queried)
+RETIRED_INDEXES = ['idx_screenshots_company']
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION set_local_date() RETURNS trigger AS $$
+            BEGIN
+                NEW.local_date := {LOCAL_DATE_SQL.format(expr='NEW.timestamp')};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+
+        for table in LOCAL_DATE_TABLES:
+            cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = %s", (table,))
+            if 'local_date' not in [r['column_name'] for r in cur.fetchall()]:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN local_date DATE NULL")
+                print(f'Added {table}.local_date')
+            else:
+                print(f'{table}.local_date exists')
+
+            cur.execute(f"DROP TRIGGER IF EXISTS trg_{table}_local_date ON {table}")
+            cur.execute(f"""
+                CREATE TRIGGER trg_{table}_local_date
+                BEFORE INSERT OR UPDATE OF timestamp ON {table}
+                FOR EACH ROW EXECUTE FUNCTION set_local_date()
+            """)
+            print(f'Trigger trg_{table}_local_date ready')
+
+
+def backfill(table, batch_size=20000):
+    key = LOCAL_DATE_TABLES[table]
+    last_id = None
+    total = 0
+    while True:
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                WITH batch AS (
+                    SELECT id, {key} FROM {table}
+                    WHERE local_date IS NULL {'AND id < %s' if last_id else ''}
+                    ORDER BY id DESC
+                    LIMIT %s
+                )
+                UPDATE {table} t
+                SET local_date = {LOCAL_DATE_SQL.format(expr='t.timestamp')}
+                FROM batch
+                WHERE t.id = batch.id AND t.{key} = batch.{key}
+                RETURNING t.id
+            """, (last_id, batch_size) if last_id else (batch_size,))
+            ids = [r['id'] for r in cur.fetchall()]
+        if not ids:
+            break
+        last_id = min(ids)
+        total += len(ids)
+        print(f'{table}: backfilled {total} rows (id >= {last_id})')
+
+
+def apply_index_pack():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS index_pack_versions (
+                version INTEGER PRIMARY KEY,
+                indexes TEXT[] NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        for name, table, definition in INDEX_PACK:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL AS present", (table,))
+            if cur.fetchone()['present']:
+                cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} {definition}")
+                print(f'Index {name} ready')
+            else:
+                print(f'Skipped {name}: no {table} table')
+
+        for name in RETIRED_INDEXES:
+            cur.execute(f"DROP INDEX IF EXISTS {name}")
+            print(f'Index {name} dropped')
+
+        cur.execute("""
+            INSERT INTO index_pack_versions (version, indexes) VALUES (%s, %s)
+            ON CONFLICT (version) DO UPDATE SET indexes = EXCLUDED.indexes, applied_at = CURRENT_TIMESTAMP
+        """, (INDEX_PACK_VERSION, [name for name, _, _ in INDEX_PACK]))
+        print(f'Index pack v{INDEX_PACK_VERSION} applied')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--skip-backfill', action='store_true', default=False, help='Only add the columns, trigger and indexes')
+    parser.add_argument('--batch', type=int, default=20000, help='Rows per transaction')
+    args = parser.parse_args()
+
+    create_schema()
+    if not args.skip_backfill:
+        for table in LOCAL_DATE_TABLES:
+            backfill(table, args.batch)
+    apply_index_pack()
+    print('Migration complete')
@@ -0,0 +1,127 @@
+"""
+Per member, per local day counters (see member_day.py).
+
+Creates `member_day_state`, then backfills it from activity_log and
+screenshots one local day per transaction. The backfill only raises
+counters, so it can run while trackers upload.
+
+Usage:
+  python scripts/add_member_day_state.py                # schema + backfill all days
+  python scripts/add_member_day_state.py --days 31      # backfill the last 31 days
+  python scripts/add_member_day_state.py --schema-only
+"""
+
+import sys, os
+import argparse
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db, IST
+from member_day import LOCAL_TIMEZONE, LOCAL_DATE_SQL
+
+# UTC bounds of a local day (naive UTC timestamps, like activity_log.timestamp)
+DAY_START_SQL = f"(%(day)s::date)::timestamp AT TIME ZONE '{LOCAL_TIMEZONE}' AT TIME ZONE 'UTC'"
+DAY_END_SQL = f"(%(day)s::date + 1)::timestamp AT TIME ZONE '{LOCAL_TIMEZONE}' AT TIME ZONE 'UTC'"
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS member_day_state (
+                company_id INTEGER NOT NULL,
+                member_id INTEGER NOT NULL,
+                local_date DATE NOT NULL,
+                screen_time_seconds NUMERIC(12,2) NOT NULL DEFAULT 0,
+                active_time_seconds NUMERIC(12,2) NOT NULL DEFAULT 0,
+                idle_time_seconds NUMERIC(12,2) NOT NULL DEFAULT 0,
+                first_activity_at TIMESTAMP NULL,
+                last_activity_at TIMESTAMP NULL,
+                sample_count INTEGER NOT NULL DEFAULT 0,
+                screenshot_count INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (member_id, local_date)
+            )
+        """)
+        print('member_day_state ready')
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_member_day_state_company_date
+            ON member_day_state (company_id, local_date)
+        """)
+        print('Index idx_member_day_state_company_date ready')
+
+
+def backfill_day(cur, day):
+    """Fold one local day of activity_log and screenshots into member_day_state"""
+    cur.execute(f"""
+        INSERT INTO member_day_state (
+            company_id, member_id, local_date, screen_time_seconds, active_time_seconds,
+            idle_time_seconds, first_activity_at, last_activity_at, sample_count
+        )
+        SELECT company_id, member_id, %(day)s::date,
+               COALESCE(MAX(total_seconds), 0), COALESCE(MAX(active_seconds), 0), COALESCE(MAX(idle_seconds), 0),
+               MIN(timestamp), MAX(timestamp), COUNT(*)
+        FROM activity_log
+        WHERE member_id IS NOT NULL
+          AND timestamp >= {DAY_START_SQL} AND timestamp < {DAY_END_SQL}
+        GROUP BY company_id, member_id
+        ORDER BY member_id
+        ON CONFLICT (member_id, local_date) DO UPDATE
+        SET screen_time_seconds = GREATEST(member_day_state.screen_time_seconds, EXCLUDED.screen_time_seconds),
+            active_time_seconds = GREATEST(member_day_state.active_time_seconds, EXCLUDED.active_time_seconds),
+            idle_time_seconds = GREATEST(member_day_state.idle_time_seconds, EXCLUDED.idle_time_seconds),
+            first_activity_at = LEAST(member_day_state.first_activity_at, EXCLUDED.first_activity_at),
+            last_activity_at = GREATEST(member_day_state.last_activity_at, EXCLUDED.last_activity_at),
+            sample_count = GREATEST(member_day_state.sample_count, EXCLUDED.sample_count),
+            updated_at = CURRENT_TIMESTAMP
+    """, {'day': day})
+    members = cur.rowcount
+
+    # tracking_date is the UTC day; the local day spans at most the one before and after
+    cur.execute(f"""
+        INSERT INTO member_day_state (company_id, member_id, local_date, screenshot_count)
+        SELECT company_id, member_id, %(day)s::date, COUNT(*)
+        FROM screenshots
+        WHERE member_id IS NOT NULL
+          AND tracking_date BETWEEN %(day)s::date - 1 AND %(day)s::date + 1
+          AND {LOCAL_DATE_SQL.format(expr='timestamp')} = %(day)s::date
+        GROUP BY company_id, member_id
+        ORDER BY member_id
+        ON CONFLICT (member_id, local_date) DO UPDATE
+        SET screenshot_count = GREATEST(member_day_state.screenshot_count, EXCLUDED.screenshot_count),
+            updated_at = CURRENT_TIMESTAMP
+    """, {'day': day})
+    return members
+
+
+def backfill(days=None):
+    today = datetime.now(IST).date()
+    if days:
+        first = today - timedelta(days=days - 1)
+    else:
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT MIN({LOCAL_DATE_SQL.format(expr='timestamp')}) AS first FROM activity_log")
+            first = cur.fetchone()['first']
+        if first is None:
+            print('No activity to backfill')
+            return
+
+    day = first
+    while day <= today:
+        with get_db() as conn:
+            members = backfill_day(conn.cursor(), day)
+        print(f'{day}: {members} members')
+        day += timedelta(days=1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schema-only', action='store_true', default=False, help='Create the table only')
+    parser.add_argument('--days', type=int, help='Backfill only the last N local days')
+    args = parser.parse_args()
+
+    create_schema()
+    if not args.schema_only:
+        backfill(args.days)
+    print('Migration complete')
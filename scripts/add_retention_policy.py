@@ -0,0 +1,68 @@
+"""
+Per-company retention policy (see retention.py).
+
+Adds `activity_retention_days` and `screenshot_retention_days` to
+company_configurations (NULL = server default RETENTION_ACTIVITY_DAYS /
+RETENTION_SCREENSHOT_DAYS, 0 = keep forever), the `retention_runs` log and
+the (company, time) indexes the batched deletes walk.
+
+Usage:
+  python scripts/add_retention_policy.py
+"""
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'company_configurations'")
+        existing = [r['column_name'] for r in cur.fetchall()]
+
+        for column in ('activity_retention_days', 'screenshot_retention_days'):
+            if column not in existing:
+                cur.execute(f"ALTER TABLE company_configurations ADD COLUMN {column} INTEGER NULL")
+                print(f'Added {column}')
+            else:
+                print(f'{column} exists')
+
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS retention_runs (
+                id SERIAL PRIMARY KEY,
+                company_id INTEGER NULL,
+                dry_run BOOLEAN NOT NULL DEFAULT FALSE,
+                status VARCHAR(16) NOT NULL,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP NULL,
+                activity_rows BIGINT NOT NULL DEFAULT 0,
+                screenshot_rows BIGINT NOT NULL DEFAULT 0,
+                partitions_dropped INTEGER NOT NULL DEFAULT 0,
+                blobs_deleted INTEGER NOT NULL DEFAULT 0,
+                files_removed INTEGER NOT NULL DEFAULT 0,
+                bytes_reclaimed BIGINT NOT NULL DEFAULT 0,
+                report JSONB NULL,
+                error TEXT NULL
+            )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_retention_runs_finished
+            ON retention_runs (finished_at DESC) WHERE status = 'completed'
+        """)
+        print('retention_runs ready')
+
+        for table, name, columns in (
+            ('activity_log', 'idx_activity_log_company_time', 'company_id, timestamp'),
+            ('screenshots', 'idx_screenshots_company_date', 'company_id, tracking_date'),
+            ('window_activity', 'idx_window_activity_company_date', 'company_id, date'),
+        ):
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL AS present", (table,))
+            if cur.fetchone()['present']:
+                cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+                print(f'Index {name} ready')
+
+
+if __name__ == '__main__':
+    create_schema()
+    print('Migration complete')
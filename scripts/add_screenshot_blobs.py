@@ -0,0 +1,118 @@
+"""
+Content-addressed screenshot storage.
+
+Creates `screenshot_blobs` (one row per distinct WebP image per company, keyed
+by SHA-256) and `screenshots.content_hash`, then moves existing BYTEA images
+out of `screenshots` into blobs in batches so duplicates collapse to one copy.
+
+Usage:
+  python scripts/add_screenshot_blobs.py                 # schema + migrate existing rows
+  python scripts/add_screenshot_blobs.py --schema-only
+  python scripts/add_screenshot_blobs.py --batch 200
+"""
+
+import sys, os
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS screenshot_blobs (
+                company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+                content_hash CHAR(64) NOT NULL,
+                data BYTEA,
+                file_size INTEGER,
+                width INTEGER,
+                height INTEGER,
+                ref_count INTEGER NOT NULL DEFAULT 0,
+                saved_filename TEXT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_referenced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (company_id, content_hash)
+            )
+        """)
+        print('screenshot_blobs ready')
+
+        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'screenshots'")
+        existing = [r['column_name'] for r in cur.fetchall()]
+
+        if 'content_hash' not in existing:
+            cur.execute("ALTER TABLE screenshots ADD COLUMN content_hash CHAR(64) NULL")
+            print('Added content_hash')
+        else:
+            print('content_hash exists')
+
+        # New rows keep their image in screenshot_blobs only
+        cur.execute("ALTER TABLE screenshots ALTER COLUMN screenshot_data DROP NOT NULL")
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_screenshots_content_hash
+            ON screenshots (company_id, content_hash)
+        """)
+        print('Index idx_screenshots_content_hash ready')
+
+
+def migrate_existing(batch_size=500):
+    """Move inline screenshot_data into screenshot_blobs, one batch per transaction"""
+    total = 0
+    while True:
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                CREATE TEMP TABLE blob_batch ON COMMIT DROP AS
+                SELECT id, company_id, screenshot_data, file_size, width, height,
+                       encode(sha256(screenshot_data), 'hex') AS content_hash
+                FROM screenshots
+                WHERE content_hash IS NULL AND screenshot_data IS NOT NULL
+                ORDER BY id
+                LIMIT %s
+            """, (batch_size,))
+            moved = cur.rowcount
+            if not moved:
+                break
+
+            cur.execute("""
+                INSERT INTO screenshot_blobs (company_id, content_hash, data, file_size, width, height, ref_count)
+                SELECT DISTINCT ON (company_id, content_hash)
+                       company_id, content_hash, screenshot_data, file_size, width, height,
+                       COUNT(*) OVER (PARTITION BY company_id, content_hash)
+                FROM blob_batch
+                ORDER BY company_id, content_hash, id
+                ON CONFLICT (company_id, content_hash) DO UPDATE
+                SET ref_count = screenshot_blobs.ref_count + EXCLUDED.ref_count
+            """)
+            cur.execute("""
+                UPDATE screenshots AS s
+                SET content_hash = b.content_hash, screenshot_data = NULL
+                FROM blob_batch AS b
+                WHERE s.id = b.id
+            """)
+
+        total += moved
+        print(f'Moved {moved} screenshots into blobs (total {total})')
+
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT COUNT(*) AS blobs, COALESCE(SUM(ref_count), 0) AS refs,
+                   COALESCE(SUM(file_size), 0) AS bytes
+            FROM screenshot_blobs
+        """)
+        row = cur.fetchone()
+        print(f"Blobs: {row['blobs']} distinct images for {row['refs']} screenshots ({row['bytes']} bytes)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schema-only', action='store_true', default=False, help='Create table/column only')
+    parser.add_argument('--batch', type=int, default=500, help='Screenshots moved per transaction')
+    args = parser.parse_args()
+
+    create_schema()
+    if not args.schema_only:
+        migrate_existing(args.batch)
+    print('Migration complete')
@@ -0,0 +1,47 @@
+"""
+Pack-file index for the screenshot filesystem mirror.
+
+Adds `screenshot_blobs.pack_file` / `pack_offset` / `pack_length` (where a
+blob's bytes live inside an append-only pack file) and the index the
+compaction tool uses to find a pack's live records.
+
+Existing loose files are moved into packs by:
+  python scripts/compact_screenshot_packs.py --pack-loose
+
+Usage:
+  python scripts/add_screenshot_packs.py
+"""
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+
+        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'screenshot_blobs'")
+        existing = [r['column_name'] for r in cur.fetchall()]
+
+        for column, ddl in (
+            ('pack_file', 'ALTER TABLE screenshot_blobs ADD COLUMN pack_file TEXT NULL'),
+            ('pack_offset', 'ALTER TABLE screenshot_blobs ADD COLUMN pack_offset BIGINT NULL'),
+            ('pack_length', 'ALTER TABLE screenshot_blobs ADD COLUMN pack_length INTEGER NULL'),
+        ):
+            if column not in existing:
+                cur.execute(ddl)
+                print(f'Added {column}')
+            else:
+                print(f'{column} exists')
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_screenshot_blobs_pack_file
+            ON screenshot_blobs (pack_file) WHERE pack_file IS NOT NULL
+        """)
+        print('Index idx_screenshot_blobs_pack_file ready')
+
+
+if __name__ == '__main__':
+    create_schema()
+    print('Migration complete')
@@ -0,0 +1,59 @@
+"""
+Near-duplicate screenshot suppression.
+
+Adds `screenshots.phash` (64-bit dHash of the displayed image),
+`screenshots.near_dup_of` (the kept frame a reference row points at),
+`screenshots.near_dup_count` (near duplicates folded into a kept frame) and
+`members.screenshot_near_dup_policy` ('keep' | 'reference' | 'skip', NULL =
+SCREENSHOT_NEAR_DUP_POLICY), plus the index used to find a member's
+previous frame.
+
+Usage:
+  python scripts/add_screenshot_phash.py
+"""
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+
+        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'screenshots'")
+        existing = [r['column_name'] for r in cur.fetchall()]
+
+        for column, ddl in (
+            ('phash', 'ALTER TABLE screenshots ADD COLUMN phash BIGINT NULL'),
+            ('near_dup_of', 'ALTER TABLE screenshots ADD COLUMN near_dup_of INTEGER NULL'),
+            ('near_dup_count', 'ALTER TABLE screenshots ADD COLUMN near_dup_count INTEGER NOT NULL DEFAULT 0'),
+        ):
+            if column not in existing:
+                cur.execute(ddl)
+                print(f'Added {column}')
+            else:
+                print(f'{column} exists')
+
+        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'members'")
+        existing = [r['column_name'] for r in cur.fetchall()]
+
+        if 'screenshot_near_dup_policy' not in existing:
+            cur.execute("""
+                ALTER TABLE members ADD COLUMN screenshot_near_dup_policy VARCHAR(16) NULL
+                CHECK (screenshot_near_dup_policy IN ('keep', 'reference', 'skip'))
+            """)
+            print('Added members.screenshot_near_dup_policy')
+        else:
+            print('members.screenshot_near_dup_policy exists')
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_screenshots_member_time
+            ON screenshots (company_id, member_id, timestamp DESC)
+        """)
+        print('Index idx_screenshots_member_time ready')
+
+
+if __name__ == '__main__':
+    create_schema()
+    print('Migration complete')
@@ -0,0 +1,90 @@
+"""
+Thumbnail / preview renditions for screenshots.
+
+Creates `screenshot_renditions` (one row per blob and rendition name, keyed
+like `screenshot_blobs`), then generates renditions for existing blobs in
+batches so the dashboard grid can use them for older screenshots too.
+
+Usage:
+  python scripts/add_screenshot_renditions.py                 # schema + backfill
+  python scripts/add_screenshot_renditions.py --schema-only
+  python scripts/add_screenshot_renditions.py --batch 100
+"""
+
+import sys, os
+import argparse
+from io import BytesIO
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from PIL import Image
+from db import get_db
+from screenshot_pipeline import RENDITIONS, make_renditions, store_renditions
+from blob_store import load_blob
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS screenshot_renditions (
+                company_id INTEGER NOT NULL,
+                content_hash CHAR(64) NOT NULL,
+                rendition VARCHAR(16) NOT NULL,
+                data BYTEA NOT NULL,
+                file_size INTEGER,
+                width INTEGER,
+                height INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (company_id, content_hash, rendition),
+                FOREIGN KEY (company_id, content_hash)
+                    REFERENCES screenshot_blobs (company_id, content_hash) ON DELETE CASCADE
+            )
+        """)
+        print('screenshot_renditions ready')
+
+
+def backfill(batch_size=100):
+    """Generate renditions for blobs large enough to need one, one batch per transaction"""
+    total = 0
+    last_key = (0, '')
+    while True:
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT b.company_id, b.content_hash, b.data, b.pack_file, b.pack_offset, b.pack_length
+                FROM screenshot_blobs b
+                WHERE (b.company_id, b.content_hash) > (%s, %s)
+                  AND (b.data IS NOT NULL OR b.pack_file IS NOT NULL)
+                  AND GREATEST(b.width, b.height) > %s
+                  AND NOT EXISTS (
+                      SELECT 1 FROM screenshot_renditions r
+                      WHERE r.company_id = b.company_id AND r.content_hash = b.content_hash
+                  )
+                ORDER BY b.company_id, b.content_hash
+                LIMIT %s
+            """, (*last_key, min(RENDITIONS.values()), batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+
+            for row in rows:
+                try:
+                    img = Image.open(BytesIO(load_blob(row)))
+                    store_renditions(cur, row['company_id'], row['content_hash'], make_renditions(img))
+                except Exception as e:
+                    print(f"Skipped blob {row['content_hash']}: {e}")
+            last_key = (rows[-1]['company_id'], rows[-1]['content_hash'])
+
+        total += len(rows)
+        print(f'Rendered {len(rows)} blobs (total {total})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schema-only', action='store_true', default=False, help='Create table only')
+    parser.add_argument('--batch', type=int, default=100, help='Blobs rendered per transaction')
+    args = parser.parse_args()
+
+    create_schema()
+    if not args.schema_only:
+        backfill(args.batch)
+    print('Migration complete')
@@ -0,0 +1,47 @@
+"""
+Per-device tracker state for the delta upload protocol.
+
+Creates `tracker_device_state`: one row per (member, tracker device id)
+holding the last acknowledged sequence number, the cumulative counters
+rebuilt from deltas and the rolling windows_opened list.
+
+Usage:
+  python scripts/add_tracker_device_state.py
+"""
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_device_state (
+                company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+                member_id INTEGER NOT NULL REFERENCES members(id) ON DELETE CASCADE,
+                device_id VARCHAR(255) NOT NULL,
+                session_start TIMESTAMP NULL,
+                last_seq BIGINT NOT NULL DEFAULT 0,
+                total_seconds NUMERIC(12, 2) DEFAULT 0,
+                active_seconds NUMERIC(12, 2) DEFAULT 0,
+                idle_seconds NUMERIC(12, 2) DEFAULT 0,
+                locked_seconds NUMERIC(12, 2) DEFAULT 0,
+                windows_opened JSONB DEFAULT '[]',
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (member_id, device_id)
+            )
+        """)
+        print('tracker_device_state ready')
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tracker_device_state_company
+            ON tracker_device_state (company_id)
+        """)
+        print('Index idx_tracker_device_state_company ready')
+
+
+if __name__ == '__main__':
+    create_schema()
+    print('Migration complete')
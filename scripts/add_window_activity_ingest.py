@@ -0,0 +1,80 @@
+"""
+Per window dwell time written at ingest (see window_activity.py).
+
+Prepares `window_activity` (created by init_db.py, unused until now) for
+the upload statements' upsert:
+  - creates it when missing (without init_db's devices foreign key)
+  - adds member_id, which window analytics filter on
+  - makes window_title / process_name NOT NULL DEFAULT '' so samples
+    without a title still hit the unique key (NULLs never conflict)
+  - adds the (member_id, date) index and the (member_id, timestamp)
+    activity_log index the upsert reads the previous sample through
+
+Dwell time is accumulated from the moment the new code runs; earlier
+activity is not backfilled.
+
+Usage:
+  python scripts/add_window_activity_ingest.py
+"""
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db
+
+
+def create_schema():
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS window_activity (
+                id SERIAL PRIMARY KEY,
+                company_id INTEGER NOT NULL,
+                device_id VARCHAR(255) NOT NULL,
+                date DATE NOT NULL,
+                window_title TEXT,
+                process_name VARCHAR(255),
+                total_time_seconds NUMERIC(12, 2) DEFAULT 0,
+                visit_count INTEGER DEFAULT 1,
+                first_seen TIMESTAMP,
+                last_seen TIMESTAMP,
+                UNIQUE(company_id, device_id, date, window_title, process_name),
+                FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
+            )
+        """)
+        print('window_activity ready')
+
+        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'window_activity'")
+        existing = [r['column_name'] for r in cur.fetchall()]
+        if 'member_id' not in existing:
+            cur.execute("ALTER TABLE window_activity ADD COLUMN member_id INTEGER NULL")
+            print('Added member_id')
+        else:
+            print('member_id exists')
+
+        cur.execute("""
+            UPDATE window_activity w SET member_id = d.member_id
+            FROM devices d
+            WHERE w.member_id IS NULL AND d.device_id = w.device_id AND d.company_id = w.company_id
+        """)
+        if cur.rowcount:
+            print(f'Filled member_id on {cur.rowcount} rows')
+
+        for column in ('window_title', 'process_name'):
+            cur.execute(f"UPDATE window_activity SET {column} = '' WHERE {column} IS NULL")
+            cur.execute(f"ALTER TABLE window_activity ALTER COLUMN {column} SET DEFAULT ''")
+            cur.execute(f"ALTER TABLE window_activity ALTER COLUMN {column} SET NOT NULL")
+            print(f'{column} NOT NULL')
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_window_activity_member_date
+            ON window_activity (member_id, date)
+        """)
+        print('Index idx_window_activity_member_date ready')
+
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_activity_log_member_time ON activity_log (member_id, timestamp)")
+        print('Index idx_activity_log_member_time ready')
+
+
+if __name__ == '__main__':
+    create_schema()
+    print('Migration complete')
@@ -0,0 +1,191 @@
+"""
+Maintenance for screenshot pack files (see screenshot_packs.py).
+
+  compaction    packs whose dead bytes (records no screenshot_blobs or
+                screenshot_renditions row points at any more) reach
+                --min-dead are rewritten: live records are
+                copied into a new pack in the same directory, the index is
+                updated, then the old packs are deleted
+  --pack-loose  moves loose mirror files (one file per image, from before pack
+                files) into packs; with --from-db also packs blobs that only
+                exist in the database
+  --verify      checks every indexed record against its pack header
+
+Today's directories are skipped by compaction unless --include-today.
+
+Usage:
+  python scripts/compact_screenshot_packs.py --dry-run
+  python scripts/compact_screenshot_packs.py --min-dead 0.5
+  python scripts/compact_screenshot_packs.py --pack-loose --remove-loose
+  python scripts/compact_screenshot_packs.py --verify
+"""
+
+import sys, os
+import argparse
+from datetime import datetime
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from psycopg2.extras import execute_values
+from db import get_db
+from screenshot_packs import (
+    save_root, pack_path, list_packs, append_blob, scan_pack, live_records, compact_pack_dir
+)
+
+
+def pack_dirs(include_today=False):
+    """(company_id, relative pack directory) for every company/day pack directory"""
+    root = save_root()
+    today = datetime.utcnow().strftime('%Y%m%d')
+    try:
+        companies = sorted(name for name in os.listdir(root) if name.isdigit())
+    except FileNotFoundError:
+        return
+    for company in companies:
+        packs_root = os.path.join(root, company, 'packs')
+        if not os.path.isdir(packs_root):
+            continue
+        for day in sorted(os.listdir(packs_root)):
+            if day == today and not include_today:
+                continue
+            yield int(company), os.path.join(company, 'packs', day)
+
+
+# ============================================================================
+# COMPACTION
+# ============================================================================
+
+def compact(min_dead=0.3, include_today=False, dry_run=False):
+    total = 0
+    for company_id, rel_dir in pack_dirs(include_today):
+        total += compact_pack_dir(company_id, rel_dir, min_dead, dry_run)
+    print(f"Reclaimed {total} bytes{' (dry run)' if dry_run else ''}")
+
+
+# ============================================================================
+# LOOSE FILES → PACKS
+# ============================================================================
+
+def pack_loose(batch_size=50, from_db=False, remove_loose=False, dry_run=False):
+    """Move blobs mirrored as loose files (or, with from_db, only stored in the database) into packs"""
+    total = 0
+    last_key = (0, '')
+    while True:
+        removable = []
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT company_id, content_hash, saved_filename, created_at
+                FROM screenshot_blobs
+                WHERE (company_id, content_hash) > (%s, %s)
+                  AND pack_file IS NULL
+                  {'' if from_db else 'AND saved_filename IS NOT NULL'}
+                ORDER BY company_id, content_hash
+                LIMIT %s
+            """, (*last_key, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_key = (rows[-1]['company_id'], rows[-1]['content_hash'])
+
+            updates = []
+            for row in rows:
+                content_hash = row['content_hash'].strip()
+                loose = row['saved_filename']
+                if dry_run:
+                    print(f"Would pack {content_hash} ({loose or 'database'})")
+                    continue
+                if loose and os.path.isfile(loose):
+                    with open(loose, 'rb') as f:
+                        data = f.read()
+                else:
+                    cur.execute(
+                        "SELECT data FROM screenshot_blobs WHERE company_id = %s AND content_hash = %s",
+                        (row['company_id'], row['content_hash'])
+                    )
+                    data = cur.fetchone()['data']
+                    data = bytes(data) if data is not None else None
+                if not data:
+                    print(f"⚠️ Blob {content_hash}: no file and no database copy, skipped")
+                    continue
+
+                day = (row['created_at'] or datetime.utcnow()).date()
+                pack_file, offset, length = append_blob(row['company_id'], data, content_hash, day)
+                updates.append((row['company_id'], row['content_hash'], pack_file, offset, length, pack_path(pack_file)))
+
+                cur.execute("""
+                    SELECT DISTINCT saved_filename FROM screenshots
+                    WHERE company_id = %s AND content_hash = %s AND saved_filename IS NOT NULL
+                """, (row['company_id'], row['content_hash']))
+                removable.extend(r['saved_filename'] for r in cur.fetchall())
+                if loose:
+                    removable.append(loose)
+
+            if updates:
+                execute_values(cur, """
+                    UPDATE screenshot_blobs AS b
+                    SET pack_file = v.pack_file, pack_offset = v.pack_offset,
+                        pack_length = v.pack_length, saved_filename = v.saved_filename
+                    FROM (VALUES %s) AS v (company_id, content_hash, pack_file, pack_offset, pack_length, saved_filename)
+                    WHERE b.company_id = v.company_id AND b.content_hash = v.content_hash
+                """, updates)
+                execute_values(cur, """
+                    UPDATE screenshots AS s
+                    SET saved_filename = v.saved_filename, is_saved_to_fs = TRUE
+                    FROM (VALUES %s) AS v (company_id, content_hash, saved_filename)
+                    WHERE s.company_id = v.company_id AND s.content_hash = v.content_hash
+                """, [(u[0], u[1], u[5]) for u in updates])
+
+        # Loose copies go only after the new locations are committed
+        if remove_loose:
+            packs_marker = os.sep + 'packs' + os.sep
+            for path in set(removable):
+                if packs_marker not in path and os.path.isfile(path):
+                    os.remove(path)
+
+        total += len(rows)
+        print(f'Packed {len(rows)} blobs (total {total})')
+
+
+# ============================================================================
+# VERIFY
+# ============================================================================
+
+def verify():
+    """Compare the index with the pack headers. Returns the number of problems."""
+    problems = 0
+    for company_id, rel_dir in pack_dirs(include_today=True):
+        abs_dir = os.path.join(save_root(), rel_dir)
+        pack_files = [os.path.join(rel_dir, name) for name in list_packs(abs_dir)]
+        with get_db() as conn:
+            live = live_records(conn.cursor(), company_id, pack_files)
+        for pack_file in pack_files:
+            records = {offset: (length, content_hash) for offset, length, content_hash in scan_pack(pack_path(pack_file))}
+            for r in live.get(pack_file, []):
+                record = records.get(r['pack_offset'])
+                # Rendition records carry the hash of their own bytes
+                expected_hash = record[1] if record and r['rendition'] is not None else r['content_hash'].strip()
+                if record != (r['pack_length'], expected_hash):
+                    problems += 1
+                    print(f"❌ {pack_file}@{r['pack_offset']}: index entry for {r['content_hash']} has no matching record")
+            print(f"{pack_file}: {len(records)} records, {len(live.get(pack_file, []))} live")
+    print(f"Verify complete: {problems} problems")
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--min-dead', type=float, default=0.3, help='Dead fraction at which a pack is rewritten')
+    parser.add_argument('--include-today', action='store_true', default=False, help='Also compact today\'s packs')
+    parser.add_argument('--pack-loose', action='store_true', default=False, help='Move loose mirror files into packs')
+    parser.add_argument('--from-db', action='store_true', default=False, help='With --pack-loose: also pack blobs only stored in the database')
+    parser.add_argument('--remove-loose', action='store_true', default=False, help='With --pack-loose: delete loose files once packed')
+    parser.add_argument('--batch', type=int, default=50, help='Blobs packed per transaction')
+    parser.add_argument('--verify', action='store_true', default=False, help='Check the index against the pack headers')
+    parser.add_argument('--dry-run', action='store_true', default=False, help='Report only')
+    args = parser.parse_args()
+
+    if args.verify:
+        sys.exit(1 if verify() else 0)
+    if args.pack_loose:
+        pack_loose(args.batch, args.from_db, args.remove_loose, args.dry_run)
+    else:
+        compact(args.min_dead, args.include_today, args.dry_run)
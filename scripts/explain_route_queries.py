@@ -0,0 +1,151 @@
+"""
+EXPLAIN the hot *_routes.py queries and flag the ones that scan whole tables.
+
+Each entry of ROUTE_QUERIES mirrors a route's query over activity_log,
+screenshots, punch_logs or one of the rollup tables (keep them in step when
+a route changes). Plans are checked for sequential scans of relations
+larger than --min-rows rows; small tables are scanned whatever the indexes,
+so run this against production-sized data. Exits 1 when a plan is flagged.
+
+Usage:
+  python scripts/explain_route_queries.py --company 1 --member 1
+  python scripts/explain_route_queries.py --company 1 --member 1 --date 2026-10-01 --verbose
+"""
+
+import sys, os
+import json
+import argparse
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db, get_ist_now
+
+# route -> (query, params built from company, member, local date)
+ROUTE_QUERIES = {
+    'GET /api/dashboard/stats': ("""
+        SELECT m.id, d.screen_time_seconds, d.active_time_seconds
+        FROM members m
+        LEFT JOIN member_day_state d ON d.member_id = m.id AND d.local_date = %s
+        WHERE m.company_id = %s AND m.is_active = TRUE
+    """, lambda c, m, d: (d, c)),
+    'GET /api/attendance/members': ("""
+        SELECT member_id, MAX(punch_in_time), SUM(COALESCE(duration_minutes, 0))
+        FROM punch_logs
+        WHERE company_id = %s AND punch_date = %s
+        GROUP BY member_id
+    """, lambda c, m, d: (c, d)),
+    'GET /api/attendance/member/<member_id>': ("""
+        SELECT punch_date, punch_in_time, punch_out_time
+        FROM punch_logs
+        WHERE company_id = %s AND member_id = %s AND punch_date BETWEEN %s AND %s
+    """, lambda c, m, d: (c, m, d - timedelta(days=30), d)),
+    'GET /api/screenshots/<member_id>': ("""
+        SELECT id, timestamp, tracking_date, file_size
+        FROM screenshots
+        WHERE company_id = %s AND member_id = %s
+          AND local_date = %s
+          AND tracking_date BETWEEN %s::date - 1 AND %s::date + 1
+        ORDER BY timestamp DESC
+        LIMIT 20
+    """, lambda c, m, d: (c, m, d, d, d)),
+    'GET /api/website-visits/<member_id>': ("""
+        SELECT u.domain_id, COUNT(*)
+        FROM activity_log a
+        CROSS JOIN LATERAL unnest(a.url_ids) AS v(url_id)
+        JOIN dim_urls u ON u.id = v.url_id
+        WHERE a.company_id = %s AND a.member_id = %s
+          AND a.local_date >= %s AND a.local_date <= %s
+          AND a.timestamp >= %s::date - INTERVAL '1 day'
+          AND a.timestamp < %s::date + INTERVAL '2 days'
+          AND a.url_ids IS NOT NULL
+        GROUP BY u.domain_id
+    """, lambda c, m, d: (c, m, d, d, d, d)),
+    'GET /api/app-usage/<member_id>': ("""
+        SELECT process, SUM(total_seconds)
+        FROM app_usage_hourly
+        WHERE company_id = %s AND hour >= %s AND hour <= %s AND member_id = %s
+        GROUP BY process
+    """, lambda c, m, d: (c, datetime.combine(d, datetime.min.time()), datetime.combine(d, datetime.max.time()), m)),
+    'GET /analytics/member/<member_id>': ("""
+        SELECT local_date, COUNT(*), COALESCE(SUM(total_seconds), 0)
+        FROM activity_log
+        WHERE member_id = %s AND timestamp >= %s AND timestamp <= %s
+        GROUP BY local_date
+    """, lambda c, m, d: (m, d - timedelta(days=30), d + timedelta(days=1))),
+    'GET /analytics/productivity-trends': ("""
+        SELECT local_date, COUNT(DISTINCT member_id), COUNT(*)
+        FROM activity_log
+        WHERE company_id = %s AND timestamp >= %s
+        GROUP BY local_date
+    """, lambda c, m, d: (c, d - timedelta(days=30))),
+    'GET /analytics/activity': ("""
+        SELECT id, timestamp, current_window, local_date
+        FROM activity_log
+        WHERE company_id = %s AND member_id = %s AND timestamp >= %s AND timestamp <= %s
+        ORDER BY timestamp DESC
+        LIMIT 50
+    """, lambda c, m, d: (c, m, d - timedelta(days=7), d + timedelta(days=1))),
+    'GET /analytics/windows': ("""
+        SELECT window_title, process_name, SUM(total_time_seconds)
+        FROM window_activity
+        WHERE company_id = %s AND member_id = %s AND date >= %s AND date <= %s
+        GROUP BY window_title, process_name
+    """, lambda c, m, d: (c, m, d - timedelta(days=7), d)),
+    'GET /analytics/work-behavior': ("""
+        SELECT timestamp, current_process, is_idle
+        FROM activity_log
+        WHERE company_id = %s AND member_id = %s
+          AND local_date = %s
+          AND timestamp >= %s::date - INTERVAL '1 day'
+          AND timestamp < %s::date + INTERVAL '2 days'
+        ORDER BY timestamp
+    """, lambda c, m, d: (c, m, d, d, d)),
+}
+
+
+def seq_scans(plan):
+    """(relation, plan rows) of every Seq Scan node in an EXPLAIN (FORMAT JSON) plan"""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append((plan['Relation Name'], plan.get('Plan Rows', 0)))
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def check(company_id, member_id, local_date, min_rows=10000, verbose=False):
+    flagged = 0
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT relname, reltuples FROM pg_class WHERE relkind IN ('r', 'p')")
+        sizes = {r['relname']: r['reltuples'] for r in cur.fetchall()}
+
+        for route, (query, params) in ROUTE_QUERIES.items():
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params(company_id, member_id, local_date))
+            plan = cur.fetchone()['QUERY PLAN']
+            plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan']
+            large = [rel for rel, _ in seq_scans(plan) if sizes.get(rel, 0) >= min_rows]
+            if large:
+                flagged += 1
+                print(f"⚠️  {route}: sequential scan of {', '.join(sorted(set(large)))}")
+            else:
+                print(f"✅ {route}")
+            if verbose:
+                cur.execute("EXPLAIN " + query, params(company_id, member_id, local_date))
+                for row in cur.fetchall():
+                    print('      ' + row['QUERY PLAN'])
+    return flagged
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--company', type=int, required=True, help='Company id to plan with')
+    parser.add_argument('--member', type=int, required=True, help='Member id to plan with')
+    parser.add_argument('--date', help='Local date YYYY-MM-DD (default: today IST)')
+    parser.add_argument('--min-rows', type=int, default=10000, help='Ignore sequential scans of smaller relations')
+    parser.add_argument('--verbose', action='store_true', default=False, help='Print every plan')
+    args = parser.parse_args()
+
+    local_date = datetime.strptime(args.date, '%Y-%m-%d').date() if args.date else get_ist_now().date()
+    flagged = check(args.company, args.member, local_date, args.min_rows, args.verbose)
+    print(f'{flagged} of {len(ROUTE_QUERIES)} route queries scan a large table sequentially')
+    sys.exit(1 if flagged else 0)
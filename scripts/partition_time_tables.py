@@ -0,0 +1,241 @@
+"""
+Convert activity_log and screenshots into time-partitioned tables
+(see partitions.py for the layout and the maintenance thread).
+
+Per table, while the application keeps running:
+  1. NULL partition keys are filled (the key becomes NOT NULL)
+  2. <table>_partitioned is created with the same columns, defaults and
+     checks, PRIMARY KEY (id, key), one partition per period that holds
+     data, the current and TIME_PARTITION_PREMAKE upcoming periods and a
+     DEFAULT partition
+  3. rows are copied in id batches, then indexes and foreign keys are
+     recreated (unique indexes gain the partition key:
+     uq_activity_log_client_seq becomes uq_activity_log_client_seq_ts)
+  4. final step, writes blocked (EXCLUSIVE lock, reads continue): rows
+     written or changed since step 1 are copied again, deleted rows are
+     removed, the tables are swapped and the id sequence is re-owned
+
+The old table stays as <table>_unpartitioned until --drop-old. Foreign
+keys from other tables pointing at the old table are dropped (they can't
+reference a partitioned table without its partition key) and reported.
+
+Usage:
+  python scripts/partition_time_tables.py
+  python scripts/partition_time_tables.py --table activity_log --batch 20000
+  python scripts/partition_time_tables.py --drop-old
+"""
+
+import sys, os
+import argparse
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from db import get_db
+from partitions import (
+    PARTITIONED_TABLES, PARTITION_INTERVAL, next_period, is_partitioned,
+    create_partition, create_default_partition, ensure_partitions
+)
+
+# Partition key for rows that have none
+KEY_FILL = {
+    'activity_log': 'COALESCE(session_start, last_activity, CURRENT_TIMESTAMP)',
+    'screenshots': 'COALESCE(timestamp::date, created_at::date, CURRENT_DATE)',
+}
+
+# Unique indexes rebuilt with the partition key under a new name
+UNIQUE_REPLACEMENTS = {
+    'uq_activity_log_client_seq': (
+        'uq_activity_log_client_seq_ts',
+        'CREATE UNIQUE INDEX uq_activity_log_client_seq_ts ON {table} '
+        '(company_id, device_id, client_seq, timestamp) WHERE client_seq IS NOT NULL'
+    ),
+}
+
+
+def columns_of(cur, table):
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = %s ORDER BY ordinal_position
+    """, (table,))
+    return [r['column_name'] for r in cur.fetchall()]
+
+
+def create_partitioned_copy(cur, table, key, new):
+    cur.execute(f"""
+        CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS)
+        PARTITION BY RANGE ({key})
+    """)
+    cur.execute(f"ALTER TABLE {new} ALTER COLUMN {key} SET NOT NULL")
+
+    trunc = 'week' if PARTITION_INTERVAL == 'week' else 'month'
+    cur.execute(f"SELECT DISTINCT date_trunc('{trunc}', {key})::date AS start FROM {table} ORDER BY 1")
+    periods = [r['start'] for r in cur.fetchall()]
+    for start in periods:
+        create_partition(cur, new, start, next_period(start), prefix=table)
+    created = ensure_partitions(cur, new, prefix=table)
+    create_default_partition(cur, new, prefix=table)
+    print(f"{new}: {len(periods)} partitions with data, {len(created)} upcoming, default")
+
+
+def copy_rows(table, new, batch_size):
+    """Copy rows in id batches (one transaction each). Returns the highest id copied."""
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT COALESCE(MAX(id), 0) AS max_id FROM {table}")
+        max_id = cur.fetchone()['max_id']
+
+    last_id = 0
+    total = 0
+    while last_id < max_id:
+        upper = min(last_id + batch_size, max_id)
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute(f"INSERT INTO {new} SELECT * FROM {table} WHERE id > %s AND id <= %s", (last_id, upper))
+            total += cur.rowcount
+        last_id = upper
+        print(f'{table}: copied {total} rows (id <= {last_id} of {max_id})')
+    return max_id
+
+
+def copy_indexes_and_keys(cur, table, key, new):
+    """Recreate the old table's indexes and foreign keys on the partitioned copy"""
+    cur.execute("""
+        SELECT c.relname AS name, pg_get_indexdef(i.indexrelid) AS indexdef, i.indisunique AS is_unique,
+               ARRAY(SELECT a.attname FROM pg_attribute a
+                     WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)) AS columns
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = %s::regclass AND NOT i.indisprimary
+    """, (table,))
+    indexes = cur.fetchall()
+
+    cur.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {table}_pkey TO {table}_unpartitioned_pkey")
+    cur.execute(f"ALTER TABLE {new} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, {key})")
+
+    for index in indexes:
+        # Old names move out of the way so the partitioned table keeps them
+        cur.execute(f"ALTER INDEX {index['name']} RENAME TO {index['name']}_unpartitioned")
+        if index['name'] in UNIQUE_REPLACEMENTS:
+            name, ddl = UNIQUE_REPLACEMENTS[index['name']]
+            cur.execute(ddl.format(table=new))
+            print(f"Index {index['name']} -> {name}")
+            continue
+        if index['is_unique'] and key not in index['columns']:
+            print(f"⚠️ Unique index {index['name']} lacks {key}; not recreated on the partitioned table")
+            continue
+        indexdef = index['indexdef'].replace(f" ON public.{table} ", f" ON {new} ").replace(f" ON {table} ", f" ON {new} ")
+        cur.execute(indexdef)
+        print(f"Index {index['name']} ready")
+
+    cur.execute("""
+        SELECT conname, pg_get_constraintdef(oid) AS definition
+        FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'
+    """, (table,))
+    for fk in cur.fetchall():
+        cur.execute(f"ALTER TABLE {new} ADD CONSTRAINT {fk['conname']} {fk['definition']}")
+        print(f"Foreign key {fk['conname']} ready")
+
+
+def swap_tables(cur, table, key, new, start_txid):
+    """Catch up on writes since start_txid and swap the tables (writes blocked meanwhile)"""
+    cur.execute("SET LOCAL lock_timeout = '30s'")
+    cur.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE")
+    cur.execute("SELECT txid_current() - %s AS recent", (start_txid,))
+    recent = cur.fetchone()['recent']
+
+    columns = columns_of(cur, table)
+    cur.execute(f"""
+        INSERT INTO {new}
+        SELECT o.* FROM {table} o
+        WHERE age(o.xmin) <= %s AND NOT EXISTS (SELECT 1 FROM {new} n WHERE n.id = o.id)
+    """, (recent,))
+    inserted = cur.rowcount
+    cur.execute(f"""
+        UPDATE {new} AS n
+        SET {', '.join(f'{c} = o.{c}' for c in columns if c != 'id')}
+        FROM {table} AS o
+        WHERE n.id = o.id AND age(o.xmin) <= %s
+    """, (recent,))
+    updated = cur.rowcount
+    cur.execute(f"DELETE FROM {new} AS n WHERE NOT EXISTS (SELECT 1 FROM {table} o WHERE o.id = n.id)")
+    deleted = cur.rowcount
+    print(f"{table}: caught up {inserted} new, {updated} changed, {deleted} deleted rows")
+
+    cur.execute("""
+        SELECT conrelid::regclass::text AS referencing, conname
+        FROM pg_constraint WHERE confrelid = %s::regclass AND contype = 'f'
+    """, (table,))
+    for fk in cur.fetchall():
+        cur.execute(f"ALTER TABLE {fk['referencing']} DROP CONSTRAINT {fk['conname']}")
+        print(f"⚠️ Dropped foreign key {fk['referencing']}.{fk['conname']} (referenced {table})")
+
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id') AS seq", (table,))
+    sequence = cur.fetchone()['seq']
+    cur.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+    cur.execute(f"ALTER TABLE {new} RENAME TO {table}")
+    if sequence:
+        cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+
+
+def convert_table(table, batch_size=50000):
+    key = PARTITIONED_TABLES[table]
+    new = f"{table}_partitioned"
+    started = time.time()
+
+    with get_db() as conn:
+        cur = conn.cursor()
+        if is_partitioned(cur, table):
+            print(f'{table} is already partitioned')
+            return False
+        cur.execute(f"UPDATE {table} SET {key} = {KEY_FILL[table]} WHERE {key} IS NULL")
+        if cur.rowcount:
+            print(f'{table}: filled {cur.rowcount} NULL {key} values')
+
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT txid_current() AS txid")
+        start_txid = cur.fetchone()['txid']
+        cur.execute(f"DROP TABLE IF EXISTS {new}")
+        create_partitioned_copy(cur, table, key, new)
+
+    copy_rows(table, new, batch_size)
+
+    with get_db() as conn:
+        copy_indexes_and_keys(conn.cursor(), table, key, new)
+
+    with get_db() as conn:
+        swap_tables(conn.cursor(), table, key, new, start_txid)
+
+    print(f'✅ {table} partitioned by {key} in {time.time() - started:.1f}s (old table: {table}_unpartitioned)')
+    return True
+
+
+def create_schema(batch_size=50000, tables=None):
+    for table in tables or PARTITIONED_TABLES:
+        convert_table(table, batch_size)
+
+
+def drop_old(tables=None):
+    with get_db() as conn:
+        cur = conn.cursor()
+        for table in tables or PARTITIONED_TABLES:
+            cur.execute("SELECT pg_total_relation_size(to_regclass(%s)) AS bytes", (f'{table}_unpartitioned',))
+            size = cur.fetchone()['bytes']
+            if size is None:
+                print(f'{table}_unpartitioned does not exist')
+                continue
+            cur.execute(f"DROP TABLE {table}_unpartitioned")
+            print(f'Dropped {table}_unpartitioned ({size} bytes)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--table', choices=list(PARTITIONED_TABLES), help='Only this table')
+    parser.add_argument('--batch', type=int, default=50000, help='Rows copied per transaction')
+    parser.add_argument('--drop-old', action='store_true', default=False, help='Drop the *_unpartitioned copies')
+    args = parser.parse_args()
+
+    tables = [args.table] if args.table else None
+    if args.drop_old:
+        drop_old(tables)
+    else:
+        create_schema(args.batch, tables)
+    print('Migration complete')
@@ -0,0 +1,28 @@
+"""
+Run a retention pass now (see retention.py), e.g. after changing a policy
+or to preview what the scheduled pass would remove.
+
+Usage:
+  python scripts/run_retention.py --dry-run
+  python scripts/run_retention.py
+  python scripts/run_retention.py --company 12
+"""
+
+import sys, os
+import json
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from retention import run_retention
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dry-run', action='store_true', default=False, help='Report what would be removed')
+    parser.add_argument('--company', type=int, help='Only this company (no partition drops)')
+    args = parser.parse_args()
+
+    report = run_retention(dry_run=args.dry_run, company_id=args.company)
+    if report is None:
+        print('Another retention pass is running')
+        sys.exit(1)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,155 @@
+"""
+Ingest spool drainer: replay failures (no database needed).
+
+Run: python -m pytest tests/test_ingest_spool.py
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import unittest
+
+SPOOL_ROOT = tempfile.mkdtemp(prefix='ingest_spool_test_')
+os.environ['INGEST_SPOOL_PATH'] = SPOOL_ROOT
+os.environ['INGEST_SPOOL_MODE'] = 'fallback'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest_spool
+
+
+class DatabaseDown(Exception):
+    pass
+
+
+def write_segment(*records):
+    os.makedirs(ingest_spool.SEGMENTS_DIR, exist_ok=True)
+    path = os.path.join(ingest_spool.SEGMENTS_DIR, f"{time.time_ns()}.seg")
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    return path
+
+
+def record(company_id, *samples, punched_in=None):
+    return {
+        'company_id': company_id,
+        'received_at': time.time(),
+        'samples': list(samples),
+        'screenshots': {},
+        'punched_in': punched_in or [True] * len(samples)
+    }
+
+
+def dead_letters():
+    try:
+        with open(ingest_spool.DEAD_LETTER_PATH, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+
+class DrainOnceTest(unittest.TestCase):
+
+    def setUp(self):
+        for name in os.listdir(SPOOL_ROOT):
+            path = os.path.join(SPOOL_ROOT, name)
+            if os.path.isdir(path):
+                for child in os.listdir(path):
+                    os.remove(os.path.join(path, child))
+            else:
+                os.remove(path)
+        self.replayed = []
+
+    def replay_batch(self, company_id, samples, files, punched_in):
+        if any(sample.get('totalseconds') == 'abc' for sample in samples):
+            raise ValueError('invalid input syntax for type numeric: "abc"')
+        self.replayed.append((company_id, [sample['seq'] for sample in samples]))
+        # Members are punched out by the time of the drain unless recorded otherwise
+        return [{'accepted': bool(state), 'code': None if state else 'NOT_PUNCHED_IN'} for state in punched_in]
+
+    def test_bad_record_is_dead_lettered_and_others_drain(self):
+        write_segment(record(1, {'seq': 1, 'totalseconds': 'abc'}), record(2, {'seq': 2}))
+
+        self.assertTrue(ingest_spool.drain_once(self.replay_batch, (DatabaseDown,)))
+
+        self.assertEqual(self.replayed, [(2, [2])])
+        letters = dead_letters()
+        self.assertEqual(len(letters), 1)
+        self.assertEqual(letters[0]['record']['company_id'], 1)
+        self.assertIn('ValueError', letters[0]['error'])
+        self.assertFalse(ingest_spool.has_backlog())
+        self.assertFalse(ingest_spool.should_spool())
+
+    def test_failing_group_is_replayed_record_by_record(self):
+        write_segment(record(1, {'seq': 1}), record(1, {'seq': 2, 'totalseconds': 'abc'}), record(1, {'seq': 3}))
+
+        self.assertTrue(ingest_spool.drain_once(self.replay_batch, (DatabaseDown,)))
+
+        self.assertEqual(self.replayed, [(1, [1]), (1, [3])])
+        self.assertEqual([letter['record']['samples'][0]['seq'] for letter in dead_letters()], [2])
+
+    def test_retryable_error_keeps_the_segment(self):
+        path = write_segment(record(1, {'seq': 1}))
+
+        def database_down(company_id, samples, files, punched_in):
+            raise DatabaseDown('connection refused')
+
+        with self.assertRaises(DatabaseDown):
+            ingest_spool.drain_once(database_down, (DatabaseDown,))
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(dead_letters(), [])
+        self.assertTrue(ingest_spool.should_spool())
+
+        self.assertTrue(ingest_spool.drain_once(self.replay_batch, (DatabaseDown,)))
+        self.assertEqual(self.replayed, [(1, [1])])
+        self.assertFalse(ingest_spool.has_backlog())
+
+    def test_committed_groups_are_not_replayed_after_an_outage(self):
+        write_segment(record(1, {'seq': 1}), record(2, {'seq': 2}), record(3, {'seq': 3}))
+
+        def down_for_company_2(company_id, samples, files, punched_in):
+            if company_id == 2:
+                raise DatabaseDown('connection refused')
+            return self.replay_batch(company_id, samples, files, punched_in)
+
+        with self.assertRaises(DatabaseDown):
+            ingest_spool.drain_once(down_for_company_2, (DatabaseDown,))
+        self.assertTrue(ingest_spool.drain_once(self.replay_batch, (DatabaseDown,)))
+
+        self.assertEqual(self.replayed, [(1, [1]), (2, [2]), (3, [3])])
+
+    def test_fallback_leaves_spool_mode_once_caught_up(self):
+        write_segment(record(1, {'seq': 1}))
+        self.assertTrue(ingest_spool.should_spool())
+        self.assertTrue(ingest_spool.drain_once(self.replay_batch, (DatabaseDown,)))
+
+        # Steady traffic keeps landing in the active segment: direct writes resume anyway
+        with open(ingest_spool.ACTIVE_SEGMENT, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(record(1, {'seq': 2})) + '\n')
+        self.assertFalse(ingest_spool.should_spool())
+
+        # The drainer seals and replays that tail without re-entering spool mode
+        self.assertTrue(ingest_spool.drain_once(self.replay_batch, (DatabaseDown,)))
+        self.assertEqual(self.replayed, [(1, [1]), (1, [2])])
+        self.assertFalse(ingest_spool.should_spool())
+
+    def test_punch_state_at_receipt_is_replayed(self):
+        write_segment(
+            record(1, {'seq': 1}, {'seq': 2}, punched_in=[True, None]),
+            {'company_id': 1, 'received_at': time.time(), 'samples': [{'seq': 3}], 'screenshots': {}}
+        )
+        before = ingest_spool.get_spool_stats()
+
+        self.assertTrue(ingest_spool.drain_once(self.replay_batch, (DatabaseDown,)))
+
+        after = ingest_spool.get_spool_stats()
+        self.assertEqual(self.replayed, [(1, [1, 2, 3])])
+        self.assertEqual(after['drained_samples'] - before['drained_samples'], 1)
+        self.assertEqual(after['drain_not_punched_in_samples'] - before['drain_not_punched_in_samples'], 2)
+        self.assertEqual(after['drain_rejected_samples'] - before['drain_rejected_samples'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
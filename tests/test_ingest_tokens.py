@@ -0,0 +1,82 @@
+"""
+Per-company ingest token buckets in the shared presence store.
+
+Run: python -m pytest tests/test_ingest_tokens.py
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ['PRESENCE_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='presence_test_'), 'presence.sqlite3')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import presence
+from presence import take_ingest_tokens
+
+RATE = 60  # one token per second
+BURST = 5
+
+
+class TakeIngestTokensTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1_000_000.0
+        patcher = mock.patch.object(presence.time, 'time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with presence._transaction(presence._connect()) as conn:
+            conn.execute("DELETE FROM ingest_bucket")
+
+    def take(self, cost=1, company_id=1):
+        return take_ingest_tokens(company_id, RATE, BURST, cost)
+
+    def test_burst_then_denied_with_retry_after(self):
+        self.assertEqual([self.take() for _ in range(BURST)], [(True, 0)] * BURST)
+
+        allowed, retry_after = self.take(cost=2)
+
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 2.0)
+
+    def test_tokens_refill_over_time(self):
+        self.assertTrue(self.take(cost=BURST)[0])
+        self.assertFalse(self.take()[0])
+
+        self.now += 3
+        self.assertEqual(self.take(cost=3), (True, 0))
+        allowed, retry_after = self.take()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 1.0)
+
+    def test_refill_is_capped_at_burst(self):
+        self.assertTrue(self.take(cost=BURST)[0])
+
+        self.now += 3600
+        self.assertTrue(self.take(cost=BURST)[0])
+        self.assertFalse(self.take()[0])
+
+    def test_denied_request_does_not_spend_tokens(self):
+        self.assertTrue(self.take(cost=3)[0])
+        self.assertFalse(self.take(cost=3)[0])
+
+        self.assertEqual(self.take(cost=2), (True, 0))
+
+    def test_batch_larger_than_burst_costs_a_full_bucket(self):
+        self.assertEqual(self.take(cost=BURST * 10), (True, 0))
+
+        allowed, retry_after = self.take(cost=BURST * 10)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, float(BURST))
+
+    def test_buckets_are_per_company(self):
+        self.assertTrue(self.take(cost=BURST, company_id=1)[0])
+
+        self.assertTrue(self.take(cost=BURST, company_id=2)[0])
+        self.assertFalse(self.take(company_id=1)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
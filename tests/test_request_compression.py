@@ -0,0 +1,133 @@
+"""
+Compressed tracker request bodies: decoding caps and middleware responses.
+
+Run: python -m pytest tests/test_request_compression.py
+"""
+
+import io
+import os
+import sys
+import json
+import gzip
+import zlib
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+import request_compression
+from request_compression import BodyTooLarge, DecompressionMiddleware, decompress_body, supported_encodings
+
+BODY = json.dumps({'samples': [{'seq': i, 'windowtitle': 'x' * 200} for i in range(200)]}).encode()
+
+
+def read_all(encoding, payload, limit=len(BODY)):
+    out, size = decompress_body(io.BytesIO(payload), encoding, limit)
+    try:
+        return out.read(), size
+    finally:
+        out.close()
+
+
+def echo_app(environ, start_response):
+    body = environ['wsgi.input'].read()
+    response = Response(json.dumps({
+        'length': len(body),
+        'content_length': environ.get('CONTENT_LENGTH'),
+        'encoding': environ.get('HTTP_CONTENT_ENCODING')
+    }), mimetype='application/json')
+    return response(environ, start_response)
+
+
+class DecompressBodyTest(unittest.TestCase):
+
+    def test_gzip_and_deflate_round_trip(self):
+        for encoding, payload in (('gzip', gzip.compress(BODY)),
+                                  ('x-gzip', gzip.compress(BODY)),
+                                  ('deflate', zlib.compress(BODY))):
+            with self.subTest(encoding=encoding):
+                self.assertEqual(read_all(encoding, payload), (BODY, len(BODY)))
+
+    def test_body_over_the_limit_is_rejected(self):
+        with self.assertRaises(BodyTooLarge):
+            read_all('gzip', gzip.compress(BODY), limit=len(BODY) - 1)
+
+    def test_highly_compressible_body_is_capped_while_inflating(self):
+        bomb = gzip.compress(b'\0' * (8 * 1024 * 1024))
+
+        with self.assertRaises(BodyTooLarge):
+            read_all('gzip', bomb, limit=1024 * 1024)
+
+    def test_truncated_and_corrupt_bodies_raise(self):
+        payload = gzip.compress(BODY)
+        with self.assertRaises(zlib.error):
+            read_all('gzip', payload[:len(payload) // 2])
+        with self.assertRaises(zlib.error):
+            read_all('deflate', b'not deflate at all')
+
+    @unittest.skipUnless(request_compression.zstandard, 'zstandard not installed')
+    def test_zstd_round_trip(self):
+        payload = request_compression.zstandard.ZstdCompressor().compress(BODY)
+
+        self.assertEqual(read_all('zstd', payload), (BODY, len(BODY)))
+
+    def test_zstd_is_not_offered_without_zstandard(self):
+        with mock.patch.object(request_compression, 'zstandard', None):
+            self.assertNotIn('zstd', supported_encodings())
+            self.assertIn('gzip', supported_encodings())
+
+
+class DecompressionMiddlewareTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client(DecompressionMiddleware(echo_app, limit=len(BODY)))
+
+    def post(self, path, payload, encoding):
+        return self.client.post(path, data=payload, headers={'Content-Encoding': encoding})
+
+    def test_body_is_decompressed_for_tracker_paths(self):
+        response = self.post('/tracker/upload', gzip.compress(BODY), 'gzip')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {
+            'length': len(BODY), 'content_length': str(len(BODY)), 'encoding': None
+        })
+
+    def test_other_paths_pass_through(self):
+        payload = gzip.compress(BODY)
+
+        response = self.post('/api/members', payload, 'gzip')
+
+        self.assertEqual(response.get_json()['length'], len(payload))
+        self.assertEqual(response.get_json()['encoding'], 'gzip')
+
+    def test_unsupported_encoding_is_415(self):
+        response = self.post('/tracker/upload', b'data', 'br')
+
+        self.assertEqual(response.status_code, 415)
+        self.assertIn('gzip', response.headers['Accept-Encoding'])
+        self.assertFalse(response.get_json()['success'])
+
+    def test_zstd_without_zstandard_is_415(self):
+        with mock.patch.object(request_compression, 'zstandard', None):
+            response = self.post('/tracker/upload', b'data', 'zstd')
+
+        self.assertEqual(response.status_code, 415)
+        self.assertNotIn('zstd', response.headers['Accept-Encoding'])
+
+    def test_oversized_body_is_413(self):
+        response = self.post('/tracker/upload', gzip.compress(BODY + b' '), 'gzip')
+
+        self.assertEqual(response.status_code, 413)
+
+    def test_corrupt_body_is_400(self):
+        response = self.post('/tracker/upload', b'\x1f\x8b garbage', 'gzip')
+
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
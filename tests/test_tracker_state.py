@@ -0,0 +1,141 @@
+"""
+Delta upload protocol: server-side reconstruction (no database needed).
+
+Run: python -m pytest tests/test_tracker_state.py
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracker_state import MAX_WINDOWS_OPENED, merge_windows, reconstruct_sample_deltas
+
+MEMBER = 1
+DEVICE = 'dev1'
+
+
+def delta(seq, baseseq, total=0, active=0, windows=(), **fields):
+    sample = {
+        'protocol': 2, 'seq': seq, 'baseseq': baseseq, 'sessionstart': '2026-10-18T09:00:00',
+        'delta': {'totalseconds': total, 'activeseconds': active, 'idleseconds': 0, 'lockedseconds': 0},
+        'windowsadded': list(windows)
+    }
+    sample.update(fields)
+    return sample
+
+
+def replay(states, *samples):
+    entries = [(index, MEMBER, DEVICE, sample) for index, sample in enumerate(samples)]
+    return reconstruct_sample_deltas(states, entries)
+
+
+class ReconstructSampleDeltasTest(unittest.TestCase):
+
+    def test_deltas_accumulate_from_zero(self):
+        states = {}
+        first = delta(1, 0, total=30, active=20, windows=['code||a.py'])
+        second = delta(2, 1, total=15, active=15, windows=['code||a.py', 'chrome||docs'])
+
+        outcomes, changed = replay(states, first, second)
+
+        self.assertEqual([outcomes[0]['status'], outcomes[1]['status']], ['applied', 'applied'])
+        self.assertEqual(second['totalseconds'], 45)
+        self.assertEqual(second['activeseconds'], 35)
+        self.assertEqual(second['windowsopened'], ['chrome||docs'])
+        state = changed[(MEMBER, DEVICE)]
+        self.assertEqual(state['last_seq'], 2)
+        self.assertEqual(state['windows'], ['code||a.py', 'chrome||docs'])
+        self.assertIs(states[(MEMBER, DEVICE)], state)
+
+    def test_retry_of_applied_seq_is_a_duplicate(self):
+        states = {}
+        replay(states, delta(1, 0, total=30), delta(2, 1, total=30))
+
+        outcomes, changed = replay(states, delta(2, 1, total=30))
+
+        self.assertEqual(outcomes[0], {'status': 'duplicate', 'seq': 2, 'lastseq': 2})
+        self.assertEqual(changed, {})
+        self.assertEqual(states[(MEMBER, DEVICE)]['counters']['total_seconds'], 60)
+
+    def test_late_replay_from_zero_is_a_duplicate(self):
+        states = {}
+        replay(states, delta(1, 0, total=30), delta(2, 1, total=30))
+
+        outcomes, _ = replay(states, delta(1, 0, total=30))
+
+        self.assertEqual(outcomes[0]['status'], 'duplicate')
+        self.assertEqual(states[(MEMBER, DEVICE)]['last_seq'], 2)
+
+    def test_gap_asks_for_resync(self):
+        states = {}
+        replay(states, delta(1, 0, total=30))
+
+        outcomes, changed = replay(states, delta(5, 4, total=30))
+
+        self.assertEqual(outcomes[0], {'status': 'resync', 'seq': 5, 'lastseq': 1})
+        self.assertEqual(changed, {})
+
+    def test_unknown_device_with_base_asks_for_resync(self):
+        outcomes, _ = replay({}, delta(3, 2, total=30))
+
+        self.assertEqual(outcomes[0], {'status': 'resync', 'seq': 3, 'lastseq': 0})
+
+    def test_restart_from_zero_resets_the_baseline(self):
+        states = {}
+        replay(states, delta(1, 0, total=500, windows=['code||a.py']))
+
+        outcomes, _ = replay(states, delta(2, 0, total=10))
+
+        self.assertEqual(outcomes[0]['status'], 'applied')
+        state = states[(MEMBER, DEVICE)]
+        self.assertEqual(state['counters']['total_seconds'], 10)
+        self.assertEqual(state['windows'], [])
+
+    def test_malformed_samples_ask_for_resync(self):
+        no_seq = delta(None, 0)
+        bad_base = delta(1, 'x')
+        bad_delta = delta(1, 0, delta='not a dict')
+        bad_windows = delta(1, 0, windowsadded='code||a.py')
+
+        outcomes, changed = replay({}, no_seq, bad_base, bad_delta, bad_windows)
+
+        self.assertEqual([outcomes[i]['status'] for i in range(4)], ['resync'] * 4)
+        self.assertEqual(changed, {})
+
+    def test_invalid_increments_count_as_zero(self):
+        sample = delta(1, 0)
+        sample['delta'] = {'totalseconds': -50, 'activeseconds': 'abc', 'idleseconds': None}
+
+        outcomes, _ = replay({}, sample)
+
+        self.assertEqual(outcomes[0]['status'], 'applied')
+        self.assertEqual(sample['totalseconds'], 0)
+        self.assertEqual(sample['activeseconds'], 0)
+        self.assertEqual(sample['idleseconds'], 0)
+
+    def test_full_samples_are_ignored(self):
+        full = {'seq': 1, 'totalseconds': 100}
+
+        outcomes, changed = replay({}, full)
+
+        self.assertEqual(outcomes, {})
+        self.assertEqual(changed, {})
+        self.assertEqual(full, {'seq': 1, 'totalseconds': 100})
+
+
+class MergeWindowsTest(unittest.TestCase):
+
+    def test_keeps_the_last_entries_without_duplicates(self):
+        windows = [f"app||{i}" for i in range(MAX_WINDOWS_OPENED)]
+
+        merged = merge_windows(windows, ['app||0', 'new||1', 42])
+
+        self.assertEqual(len(merged), MAX_WINDOWS_OPENED)
+        self.assertEqual(merged[-1], 'new||1')
+        self.assertNotIn('app||0', merged)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Screenshot transcoding: pixel budget, WebP passthrough and renditions (no database needed).
+
+Run: python -m pytest tests/test_transcode_image.py
+"""
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+SCRATCH = tempfile.mkdtemp(prefix='screenshot_pipeline_test_')
+os.environ['SCREENSHOT_QUEUE_PATH'] = os.path.join(SCRATCH, 'queue')
+os.environ['SCREENSHOT_SAVE_PATH'] = os.path.join(SCRATCH, 'screenshots')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+import screenshot_pipeline
+from screenshot_pipeline import ImageRejected, RENDITIONS, transcode_image
+
+
+def encode(width, height, fmt):
+    """Noise, so the encoded image is well above MIN_FILE_SIZE"""
+    img = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+    output = io.BytesIO()
+    img.save(output, format=fmt)
+    return output.getvalue()
+
+
+class TranscodeImageTest(unittest.TestCase):
+
+    def test_webp_upload_is_stored_byte_for_byte(self):
+        source = encode(400, 300, 'WEBP')
+
+        processed = transcode_image(source)
+
+        self.assertEqual(processed['webp'], source)
+        self.assertEqual(processed['file_size'], len(source))
+        self.assertEqual((processed['width'], processed['height']), (400, 300))
+        self.assertTrue(processed['is_valid'])
+        self.assertIsNone(processed['invalid_reason'])
+
+    def test_jpeg_is_transcoded_to_webp(self):
+        processed = transcode_image(encode(400, 300, 'JPEG'))
+
+        self.assertEqual(Image.open(io.BytesIO(processed['webp'])).format, 'WEBP')
+        self.assertEqual((processed['width'], processed['height']), (400, 300))
+        self.assertEqual(len(processed['content_hash']), 64)
+        self.assertIsInstance(processed['dhash'], int)
+
+    def test_paths_and_file_objects_are_accepted(self):
+        source = encode(200, 200, 'WEBP')
+        path = os.path.join(SCRATCH, 'upload.webp')
+        with open(path, 'wb') as f:
+            f.write(source)
+
+        self.assertEqual(transcode_image(path)['webp'], source)
+        with open(path, 'rb') as f:
+            self.assertEqual(transcode_image(f)['webp'], source)
+
+    def test_image_over_the_pixel_budget_is_rejected(self):
+        with mock.patch.object(screenshot_pipeline, 'MAX_PIXELS', 400 * 300 - 1):
+            with self.assertRaises(ImageRejected):
+                transcode_image(encode(400, 300, 'PNG'))
+
+    def test_tiny_image_is_stored_but_marked_invalid(self):
+        processed = transcode_image(encode(50, 40, 'PNG'))
+
+        self.assertFalse(processed['is_valid'])
+        self.assertEqual(processed['invalid_reason'], 'too_small_or_small_dimensions')
+
+    def test_renditions_only_for_images_larger_than_the_rendition(self):
+        thumb_px = RENDITIONS['thumb']
+        preview_px = RENDITIONS['preview']
+
+        small = transcode_image(encode(thumb_px, thumb_px // 2, 'WEBP'))
+        large = transcode_image(encode(preview_px * 2, preview_px, 'JPEG'))
+
+        self.assertEqual(small['renditions'], {})
+        self.assertEqual(sorted(large['renditions']), ['preview', 'thumb'])
+        self.assertEqual(large['renditions']['thumb']['width'], thumb_px)
+        self.assertEqual(large['renditions']['preview']['width'], preview_px)
+        self.assertEqual((large['width'], large['height']), (preview_px * 2, preview_px))
+
+    def test_max_edge_downscales_only_when_enabled(self):
+        source = encode(1000, 500, 'WEBP')
+
+        with mock.patch.object(screenshot_pipeline, 'MAX_EDGE_PX', 0):
+            self.assertEqual(transcode_image(source)['webp'], source)
+
+        with mock.patch.object(screenshot_pipeline, 'MAX_EDGE_PX', 500):
+            processed = transcode_image(source)
+        self.assertNotEqual(processed['webp'], source)
+        self.assertEqual((processed['width'], processed['height']), (500, 250))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,231 @@
+"""
+TRACKER_CACHE.PY - In-process caches for tracker authentication
+================================================================
+✅ `companies` schema capabilities resolved once per process (no information_schema per request)
+✅ Tracker token → company cache with TTL (heartbeats authenticate without a DB round trip)
+✅ Short negative cache for invalid tokens
+✅ Explicit invalidation when a company's tracker token, status or ingest
+   limits change, reaching every worker
+✅ Bounded LRU identity cache: (company, email) → member id,
+   (company, member, device string) → devices.id
+
+The caches are per process. Token verdicts and identity entries are tagged
+with the company's generation in the shared presence store and checked on
+every hit, so invalidate_company() and invalidate_identities() reach every
+worker immediately.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from db import get_db
+from presence import (
+    get_identity_generation, bump_identity_generation,
+    get_auth_generation, bump_auth_generation
+)
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+TRACKER_AUTH_CACHE_TTL = int(os.getenv('TRACKER_AUTH_CACHE_TTL', '300'))
+TRACKER_AUTH_NEGATIVE_TTL = int(os.getenv('TRACKER_AUTH_NEGATIVE_TTL', '30'))
+TRACKER_AUTH_CACHE_MAX_ENTRIES = int(os.getenv('TRACKER_AUTH_CACHE_MAX_ENTRIES', '10000'))
+TRACKER_IDENTITY_CACHE_SIZE = int(os.getenv('TRACKER_IDENTITY_CACHE_SIZE', '20000'))
+TRACKER_IDENTITY_CACHE_TTL = int(os.getenv('TRACKER_IDENTITY_CACHE_TTL', '900'))
+
+_lock = threading.Lock()
+_company_schema = None
+_token_cache = {}   # token -> (expires_at, generation, company_id, company dict or None, error message or None)
+_identity_cache = OrderedDict()   # key -> (expires_at, generation, value), least recently used first
+
+
+# ============================================================================
+# SCHEMA CAPABILITIES
+# ============================================================================
+
+def get_company_schema(cur=None):
+    """
+    Resolve which optional `companies` columns exist (once per process).
+
+    Returns a dict with:
+        columns           frozenset of column names
+        name_col          company name column (or None)
+        isactive_col      active flag column
+        has_tracker_token whether tracker_token is stored
+    """
+    global _company_schema
+
+    if _company_schema is not None:
+        return _company_schema
+
+    def _load(c):
+        c.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = 'companies'
+        """)
+        return frozenset(row['column_name'] for row in c.fetchall())
+
+    if cur is not None:
+        columns = _load(cur)
+    else:
+        with get_db() as conn:
+            columns = _load(conn.cursor())
+
+    name_col = next((c for c in ('company_name', 'name', 'companyname') if c in columns), None)
+    isactive_col = 'isactive' if 'isactive' in columns and 'is_active' not in columns else 'is_active'
+
+    schema = {
+        'columns': columns,
+        'name_col': name_col,
+        'isactive_col': isactive_col,
+        'has_tracker_token': 'tracker_token' in columns
+    }
+
+    with _lock:
+        _company_schema = schema
+
+    print(f"✅ Companies schema resolved: name={name_col}, active={isactive_col}, "
+          f"tracker_token={schema['has_tracker_token']}")
+    return schema
+
+
+# ============================================================================
+# TOKEN → COMPANY CACHE
+# ============================================================================
+
+def get_cached_company(tracker_token):
+    """
+    Look up a token in the cache.
+    Returns (hit, company_id, company, error) — company is None when the
+    cached verdict was a rejection (error holds the message).
+    """
+    with _lock:
+        entry = _token_cache.get(tracker_token)
+    if entry is None:
+        return False, None, None, None
+    expires_at, cached_generation, company_id, company, error = entry
+    generation = get_auth_generation(company_id)
+    if expires_at < time.monotonic() or cached_generation != generation or generation < 0:
+        with _lock:
+            if _token_cache.get(tracker_token) is entry:
+                del _token_cache[tracker_token]
+        return False, None, None, None
+    return True, company_id, company, error
+
+
+def cache_company(tracker_token, company_id, company, error=None, generation=None):
+    """
+    Remember the verdict for a token (positive entries live longer than
+    rejections). Pass the generation read before the DB lookup so a
+    concurrent invalidation is not masked by the older result.
+    """
+    if generation is None:
+        generation = get_auth_generation(company_id)
+    if generation < 0:
+        return
+    ttl = TRACKER_AUTH_CACHE_TTL if company else TRACKER_AUTH_NEGATIVE_TTL
+    with _lock:
+        if len(_token_cache) >= TRACKER_AUTH_CACHE_MAX_ENTRIES:
+            now = time.monotonic()
+            for token in [t for t, e in _token_cache.items() if e[0] < now]:
+                del _token_cache[token]
+            if len(_token_cache) >= TRACKER_AUTH_CACHE_MAX_ENTRIES:
+                _token_cache.clear()
+        _token_cache[tracker_token] = (time.monotonic() + ttl, generation, company_id, company, error)
+
+
+def invalidate_company(company_id):
+    """
+    Drop every cached token verdict for a company in every worker
+    (call after committing a change to its token, status or ingest limits)
+    """
+    bump_auth_generation(company_id)
+    with _lock:
+        for token in [t for t, e in _token_cache.items() if e[2] == company_id]:
+            del _token_cache[token]
+    print(f"🔄 Tracker auth cache invalidated for company {company_id}")
+
+
+# ============================================================================
+# MEMBER / DEVICE IDENTITY CACHE
+# ============================================================================
+
+def member_key(company_id, email):
+    return ('member', company_id, email)
+
+
+def device_key(company_id, member_id, device_id):
+    return ('device', company_id, member_id, device_id)
+
+
+def get_cached_identity(key):
+    """Cached id for a member_key()/device_key(), or None on a miss"""
+    generation = get_identity_generation(key[1])
+    with _lock:
+        entry = _identity_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, cached_generation, value = entry
+        if expires_at < time.monotonic() or cached_generation != generation or generation < 0:
+            del _identity_cache[key]
+            return None
+        _identity_cache.move_to_end(key)
+        return value
+
+
+def cache_identity(key, value, generation=None):
+    """
+    Remember an id. Pass the generation read before the DB lookup so a
+    concurrent invalidation is not masked by the older result.
+    """
+    if generation is None:
+        generation = get_identity_generation(key[1])
+    if generation < 0:
+        return
+    with _lock:
+        _identity_cache[key] = (time.monotonic() + TRACKER_IDENTITY_CACHE_TTL, generation, value)
+        _identity_cache.move_to_end(key)
+        while len(_identity_cache) > TRACKER_IDENTITY_CACHE_SIZE:
+            _identity_cache.popitem(last=False)
+
+
+def invalidate_identities(company_id):
+    """Forget member/device ids for a company in every worker (call after commit)"""
+    bump_identity_generation(company_id)
+    with _lock:
+        for key in [k for k in _identity_cache if k[1] == company_id]:
+            del _identity_cache[key]
+    print(f"🔄 Identity cache invalidated for company {company_id}")
+
+
+def get_cache_stats():
+    """Cache sizes for the health endpoint"""
+    with _lock:
+        return {
+            'entries': len(_token_cache),
+            'ttl_seconds': TRACKER_AUTH_CACHE_TTL,
+            'schema_resolved': _company_schema is not None,
+            'identity_entries': len(_identity_cache),
+            'identity_capacity': TRACKER_IDENTITY_CACHE_SIZE
+        }
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'get_company_schema',
+    'get_cached_company',
+    'cache_company',
+    'invalidate_company',
+    'member_key',
+    'device_key',
+    'get_cached_identity',
+    'cache_identity',
+    'invalidate_identities',
+    'get_cache_stats'
+]
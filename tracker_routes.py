@@ -1173,13 +1173,40 @@ FIXES APPLIED:
 """
 
 from flask import Blueprint, request, jsonify, send_file, after_this_request, current_app
+import psycopg2
+import psycopg2.pool
+from psycopg2.extras import execute_values
 from db import get_db
+from tracker_cache import (
+    get_company_schema, get_cached_company, cache_company, invalidate_company,
+    member_key, device_key, get_cached_identity, cache_identity, invalidate_identities
+)
+from presence import (
+    get_punched_in, set_punched_in, seed_punched_in, get_identity_generation, get_auth_generation,
+    record_member_activity, record_device_seen, flush_presence
+)
+from tracker_state import (
+    STATE_COLUMNS, DEVICE_STATE_UPSERT, DEVICE_STATE_VALUES,
+    is_delta_sample, apply_sample_deltas, device_state_from_row, device_state_row,
+    reconstruct_sample_deltas
+)
+from ingest_admission import ingest_rejection
+from member_day import ACTIVITY_RETURNING, MEMBER_DAY_FROM_INSERT
+from window_activity import WINDOW_RETURNING, WINDOW_ACTIVITY_FROM_INSERT
+from dimensions import intern_samples, sample_dimension_ids
+from ingest_spool import should_spool, spool_enabled, spool_samples, SpoolFullError
+from screenshot_pipeline import (
+    PIPELINE_ENABLED as SCREENSHOT_PIPELINE_ENABLED,
+    SAVE_SCREENSHOTS_TO_FS, SCREENSHOT_SAVE_PATH, QueueFullError,
+    transcode_image, save_processed_screenshot, enqueue_screenshot
+)
 from datetime import datetime, timedelta
 import base64
 import json
 from PIL import Image
 from io import BytesIO
 import os
+import time
 import tempfile
 from functools import wraps
 from datetime import datetime, timezone
@@ -1207,11 +1234,30 @@ async def broadcast_ws_status(company_id, member_id, status):
         print("WS broadcast failed:", e)
 
 
-# Filesystem save configuration (optional)
-SAVE_SCREENSHOTS_TO_FS = os.getenv('SAVE_SCREENSHOTS_TO_FS', 'true').lower() in ('1', 'true', 'yes')
-SCREENSHOT_SAVE_PATH = os.getenv('SCREENSHOT_SAVE_PATH', os.path.join(os.getcwd(), 'screenshots'))
+def schedule_ws_broadcast(company_id, member_id, status):
+    """
+    Queue broadcast_ws_status() on the running asyncio loop, if any.
+    Flask request threads have no loop (Socket.IO emits cover them), so
+    this is a no-op there instead of raising after the data was committed.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    loop.create_task(broadcast_ws_status(company_id, member_id, status))
+
+
+# Filesystem save configuration (optional) lives with the screenshot pipeline
 SAVE_SCREENSHOTS_ONLY_WHEN_PUNCHED_IN = os.getenv('SAVE_SCREENSHOTS_ONLY_WHEN_PUNCHED_IN', 'true').lower() in ('1', 'true', 'yes')
 
+# Batched ingest: upper bound on samples accepted by /tracker/upload-batch
+TRACKER_BATCH_MAX_SAMPLES = int(os.getenv('TRACKER_BATCH_MAX_SAMPLES', '500'))
+
+# Sample timestamps further ahead of the server clock than this are replaced
+# by the receive time (a skewed tracker clock would file them in the DEFAULT partition);
+# samples with a client seq are rejected instead (see unstable_timestamp())
+TRACKER_MAX_FUTURE_SECONDS = int(os.getenv('TRACKER_MAX_FUTURE_SECONDS', '86400'))
+
 if SAVE_SCREENSHOTS_TO_FS:
     try:
         os.makedirs(SCREENSHOT_SAVE_PATH, exist_ok=True)
@@ -1280,6 +1326,55 @@ def emit_member_status_update(company_id, member_id, status):
         print(f"⚠️ Failed to emit status update: {e}")
 
 
+def load_tracker_company(company_id, tracker_token):
+    """
+    Fetch an active company and check the token against its stored tracker_token.
+    The company dict also carries its ingest limits (None = server default).
+    Returns (company, None) or (None, error message).
+    """
+    with get_db() as conn:
+        cur = conn.cursor()
+        schema = get_company_schema(cur)
+
+        select_cols = ['id']
+        if schema['name_col']:
+            select_cols.append(f"{schema['name_col']} as name")
+        if schema['has_tracker_token']:
+            select_cols.append('tracker_token')
+
+        cur.execute(
+            f"SELECT {', '.join(select_cols)} FROM companies WHERE id = %s AND {schema['isactive_col']} = TRUE",
+            (company_id,)
+        )
+        company = cur.fetchone()
+
+        limits = None
+        if company:
+            cur.execute("""
+                SELECT ingest_rate_per_minute, ingest_burst
+                FROM company_configurations
+                WHERE company_id = %s
+            """, (company_id,))
+            limits = cur.fetchone()
+
+    if not company:
+        print(f"❌ Company {company_id} not found or inactive")
+        return None, "Invalid or inactive company"
+
+    if schema['has_tracker_token'] and company.get('tracker_token'):
+        if company['tracker_token'] != tracker_token:
+            print(f"❌ Tracker token mismatch for company {company_id}")
+            return None, "Invalid tracker token"
+
+    print(f"✅ Token verified for company {company_id}: {company.get('name', 'Unknown')}")
+    return {
+        'id': company['id'],
+        'name': company.get('name', 'Unknown'),
+        'ingest_rate_per_minute': limits['ingest_rate_per_minute'] if limits else None,
+        'ingest_burst': limits['ingest_burst'] if limits else None
+    }, None
+
+
 def require_tracker_token(f):
     """Decorator: Require tracker token authentication"""
     @wraps(f)
@@ -1288,8 +1383,11 @@ def require_tracker_token(f):
 
         if not tracker_token:
             try:
-                data = request.get_json(silent=True) or {}
-                tracker_token = data.get('tracker_token')
+                if request.mimetype == 'multipart/form-data':
+                    tracker_token = request.form.get('tracker_token')
+                else:
+                    data = request.get_json(silent=True) or {}
+                    tracker_token = data.get('tracker_token')
             except:
                 pass
 
@@ -1297,67 +1395,31 @@ def require_tracker_token(f):
             print("❌ No tracker token provided in request")
             return jsonify({"error": "Tracker token required"}), 401
 
-        company_id = verify_tracker_token(tracker_token)
+        hit, company_id, company, error = get_cached_company(tracker_token)
 
-        if not company_id:
-            print(f"❌ Invalid tracker token format")
-            return jsonify({"error": "Invalid tracker token"}), 401
+        if not hit:
+            company_id = verify_tracker_token(tracker_token)
 
-        try:
-            with get_db() as conn:
-                cur = conn.cursor()
-
-                cur.execute("""
-                    SELECT column_name FROM information_schema.columns 
-                    WHERE table_name = 'companies'
-                """)
-                company_cols = [row['column_name'] for row in cur.fetchall()]
-                print(f"✅ Companies table columns: {company_cols}")
-
-                select_cols = ['id']
-
-                if 'company_name' in company_cols:
-                    select_cols.append('company_name as name')
-                elif 'name' in company_cols:
-                    select_cols.append('name')
-                elif 'companyname' in company_cols:
-                    select_cols.append('companyname as name')
-
-                if 'tracker_token' in company_cols:
-                    select_cols.append('tracker_token')
-
-                if 'is_active' in company_cols:
-                    isactive_col = 'is_active'
-                elif 'isactive' in company_cols:
-                    isactive_col = 'isactive'
-                else:
-                    isactive_col = 'is_active'
-
-                query = f"SELECT {', '.join(select_cols)} FROM companies WHERE id = %s AND {isactive_col} = TRUE"
-                print(f"🔍 Token verification query: {query}")
+            if not company_id:
+                print(f"❌ Invalid tracker token format")
+                return jsonify({"error": "Invalid tracker token"}), 401
 
-                cur.execute(query, (company_id,))
-                company = cur.fetchone()
-
-                if not company:
-                    print(f"❌ Company {company_id} not found or inactive")
-                    return jsonify({"error": "Invalid or inactive company"}), 401
-
-                if 'tracker_token' in company_cols and company.get('tracker_token'):
-                    if company['tracker_token'] != tracker_token:
-                        print(f"❌ Tracker token mismatch for company {company_id}")
-                        return jsonify({"error": "Invalid tracker token"}), 401
+            generation = get_auth_generation(company_id)
+            try:
+                company, error = load_tracker_company(company_id, tracker_token)
+            except Exception as e:
+                print(f"❌ Database error during token verification: {e}")
+                import traceback
+                traceback.print_exc()
+                return jsonify({"error": "Authentication failed"}), 500
 
-                company_name = company.get('name', 'Unknown')
-                print(f"✅ Token verified for company {company_id}: {company_name}")
+            cache_company(tracker_token, company_id, company, error, generation)
 
-        except Exception as e:
-            print(f"❌ Database error during token verification: {e}")
-            import traceback
-            traceback.print_exc()
-            return jsonify({"error": "Authentication failed"}), 500
+        if not company:
+            return jsonify({"error": error}), 401
 
         request.tracker_company_id = company_id
+        request.tracker_company = company
         request.tracker_token = tracker_token
 
         return f(*args, **kwargs)
@@ -1365,6 +1427,51 @@ def require_tracker_token(f):
     return decorated_function
 
 
+def resolve_member_id(cur, company_id, email):
+    """members.id for (company, email) through the identity cache. None if not found."""
+    key = member_key(company_id, email)
+    member_id = get_cached_identity(key)
+    if member_id is None:
+        generation = get_identity_generation(company_id)
+        cur.execute("SELECT id FROM members WHERE company_id = %s AND email = %s", (company_id, email))
+        row = cur.fetchone()
+        if not row:
+            return None
+        member_id = row['id']
+        cache_identity(key, member_id, generation)
+    return member_id
+
+
+def resolve_device_db_id(cur, company_id, member_id, deviceid_str):
+    """devices.id for a member's device string through the identity cache. None if not registered."""
+    key = device_key(company_id, member_id, deviceid_str)
+    device_db_id = get_cached_identity(key)
+    if device_db_id is None:
+        generation = get_identity_generation(company_id)
+        cur.execute(
+            "SELECT id FROM devices WHERE company_id = %s AND member_id = %s AND device_id = %s",
+            (company_id, member_id, deviceid_str)
+        )
+        row = cur.fetchone()
+        if not row:
+            return None
+        device_db_id = row['id']
+        cache_identity(key, device_db_id, generation)
+    return device_db_id
+
+
+def member_is_punched_in(cur, company_id, member_id):
+    """Punched-in flag from the presence store, falling back to members.is_punched_in"""
+    punched_in = get_punched_in(member_id)
+    if punched_in is None:
+        read_started_at = time.time()
+        cur.execute("SELECT is_punched_in FROM members WHERE id = %s", (member_id,))
+        row = cur.fetchone()
+        punched_in = bool(row and row.get('is_punched_in'))
+        seed_punched_in(company_id, member_id, punched_in, read_started_at)
+    return punched_in
+
+
 # ============================================================================
 # TRACKER DOWNLOAD
 # ============================================================================
@@ -1396,39 +1503,16 @@ def download_tracker():
         with get_db() as conn:
             cur = conn.cursor()
 
-            cur.execute("""
-                SELECT column_name FROM information_schema.columns 
-                WHERE table_name = 'companies'
-            """)
-            company_cols = [row['column_name'] for row in cur.fetchall()]
-            print(f"📋 Companies table columns: {company_cols}")
-
-            if 'company_name' in company_cols:
-                name_col = 'company_name'
-            elif 'companyname' in company_cols:
-                name_col = 'companyname'
-            else:
-                name_col = 'name'
-
-            print(f"✅ Using company name column: {name_col}")
+            schema = get_company_schema(cur)
+            name_col = schema['name_col'] or 'name'
+            has_tracker_token = schema['has_tracker_token']
+            isactive_col = schema['isactive_col']
 
             select_cols = ['id', f'{name_col} as companyname']
-
-            if 'tracker_token' in company_cols:
+            if has_tracker_token:
                 select_cols.append('tracker_token')
-                has_tracker_token = True
-            else:
-                has_tracker_token = False
-
-            if 'is_active' in company_cols:
-                isactive_col = 'is_active'
-            elif 'isactive' in company_cols:
-                isactive_col = 'isactive'
-            else:
-                isactive_col = 'is_active'
 
             query = f"SELECT {', '.join(select_cols)} FROM companies WHERE id = %s AND {isactive_col} = TRUE"
-            print(f"🔍 Executing query: {query}")
 
             cur.execute(query, (company_id,))
             company = cur.fetchone()
@@ -1451,6 +1535,7 @@ def download_tracker():
                     try:
                         cur.execute("UPDATE companies SET tracker_token = %s WHERE id = %s", (tracker_token, company_id))
                         conn.commit()
+                        invalidate_company(company_id)
                         print(f"✅ Saved tracker_token to database")
                     except Exception as e:
                         print(f"⚠️ Could not save tracker_token: {e}")
@@ -1747,6 +1832,7 @@ def verify_member():
                     print(f"✅ New device registered (DB ID: {device_db_id})")
 
             conn.commit()
+            invalidate_identities(company_id)
 
             print("=" * 70)
             print("✅ VERIFY SUCCESS!")
@@ -1798,17 +1884,11 @@ def tracker_punch_in():
         with get_db() as conn:
             cur = conn.cursor()
 
-            cur.execute("""
-                SELECT id FROM members
-                WHERE company_id = %s AND email = %s
-            """, (company_id, email))
-            member = cur.fetchone()
+            member_id = resolve_member_id(cur, company_id, email)
 
-            if not member:
+            if not member_id:
                 return jsonify({"error": "Member not found"}), 404
 
-            member_id = member['id']
-
             # Check existing open session
             cur.execute("""
                 SELECT id FROM punch_logs
@@ -1830,18 +1910,10 @@ def tracker_punch_in():
             now_ist = now.astimezone(ist)
             now_db = now_ist.replace(tzinfo=None)
 
-            cur.execute("""
-                SELECT id FROM devices
-                WHERE company_id = %s AND member_id = %s AND device_id = %s
-            """, (company_id, member_id, deviceid))
-
-            device = cur.fetchone()
-            if not device:
+            device_db_id = resolve_device_db_id(cur, company_id, member_id, deviceid)
+            if not device_db_id:
                 return jsonify({"error": "Device not registered"}), 404
 
-            device_db_id = int(device['id'])
-            print(f"device id type: {type(device_db_id)}, deviceid: {device_db_id}")
-
             cur.execute("""
                 INSERT INTO punch_logs (
                     company_id, member_id, device_id,
@@ -1860,11 +1932,12 @@ def tracker_punch_in():
             """, (now_db, member_id))
 
             conn.commit()
+            set_punched_in(company_id, member_id, True)
 
         # ✅ FIX 1: Emit real-time update so dashboard shows 'active' immediately
         emit_member_status_update(company_id, member_id, 'active')
         
-        asyncio.create_task(broadcast_ws_status(company_id, member_id, 'active'))
+        schedule_ws_broadcast(company_id, member_id, 'active')
 
 
         return jsonify({
@@ -1902,16 +1975,11 @@ def tracker_punch_out():
         with get_db() as conn:
             cur = conn.cursor()
 
-            cur.execute("""
-                SELECT id FROM members
-                WHERE company_id = %s AND email = %s
-            """, (company_id, email))
-            member = cur.fetchone()
+            member_id = resolve_member_id(cur, company_id, email)
 
-            if not member:
+            if not member_id:
                 return jsonify({"error": "Member not found"}), 404
 
-            member_id = member['id']
             now = utc_now()
 
             cur.execute("""
@@ -1961,12 +2029,13 @@ def tracker_punch_out():
             """, (now, member_id))
 
             conn.commit()
+            set_punched_in(company_id, member_id, False)
 
         # ✅ FIX 3: Emit real-time update IMMEDIATELY so dashboard goes offline right away
         # This fixes the bug where dashboard/team page showed 'idle' after punch-out
         emit_member_status_update(company_id, member_id, 'offline')
 
-        asyncio.create_task(broadcast_ws_status(company_id, member_id, 'offline'))
+        schedule_ws_broadcast(company_id, member_id, 'offline')
         return jsonify({
             "success": True,
             "message": "Punched out successfully",
@@ -1982,6 +2051,268 @@ def tracker_punch_out():
         return jsonify({"error": "Failed to record punch out"}), 500
 
 
+# ============================================================================
+# UPLOAD HELPERS
+# ============================================================================
+
+# Errors meaning Postgres is down or saturated (the upload can be spooled instead)
+DB_UNAVAILABLE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError)
+
+ACTIVITY_LOG_COLUMNS = (
+    'company_id', 'member_id', 'device_id', 'timestamp',
+    'session_start', 'last_activity', 'username', 'email',
+    'total_seconds', 'active_seconds', 'idle_seconds', 'locked_seconds',
+    'idle_for', 'is_idle', 'locked', 'mouse_active', 'keyboard_active',
+    'current_window', 'current_process', 'windows_opened', 'browser_history', 'screenshot',
+    'client_seq', 'process_id', 'window_title_id', 'url_ids',
+)
+
+# Replays of an upload (same tracker device + seq) are dropped by uq_activity_log_client_seq
+# (uq_activity_log_client_seq_ts once activity_log is partitioned: the unique index must
+# include the partition key, replays carry the original sample timestamp). No conflict
+# target, so either index applies.
+ACTIVITY_LOG_INSERT = f"""
+    INSERT INTO activity_log ({', '.join(ACTIVITY_LOG_COLUMNS)})
+    VALUES {{values}}
+    ON CONFLICT DO NOTHING
+    RETURNING id, device_id, client_seq, {ACTIVITY_RETURNING}, {WINDOW_RETURNING}
+"""
+
+# Batch insert: the rows written also fold into member_day_state and window_activity
+ACTIVITY_BATCH_INSERT = f"""
+    WITH ins AS ({ACTIVITY_LOG_INSERT.format(values='%s')}),
+    {MEMBER_DAY_FROM_INSERT},
+    {WINDOW_ACTIVITY_FROM_INSERT}
+    SELECT id, device_id, client_seq FROM ins
+"""
+
+# Membership, punch state and device for a single upload, validated inside the
+# upload statement itself. %(punched_in)s is the presence store's answer (NULL
+# when it doesn't know the member, falling back to members.is_punched_in).
+UPLOAD_TARGET_CTE = """
+    m AS (
+        SELECT id, is_punched_in AS db_punched_in,
+               COALESCE(%(punched_in)s::boolean, is_punched_in, FALSE) AS punched_in
+        FROM members
+        WHERE company_id = %(company_id)s AND email = %(email)s
+    ),
+    d AS (
+        SELECT devices.id
+        FROM devices JOIN m ON devices.member_id = m.id
+        WHERE devices.company_id = %(company_id)s AND devices.device_id = %(device_id)s
+    )
+"""
+
+UPLOAD_TARGET_COLUMNS = "m.id AS member_id, m.punched_in, m.db_punched_in, d.id AS device_db_id"
+
+# Full (protocol 1) sample: validate and insert in one round trip.
+# raw_data_id is NULL when nothing was written (not punched in, unknown device, replay).
+UPLOAD_INSERT_SQL = f"""
+    WITH {UPLOAD_TARGET_CTE},
+    ins AS (
+        INSERT INTO activity_log ({', '.join(ACTIVITY_LOG_COLUMNS)})
+        SELECT {', '.join('m.id' if col == 'member_id' else f'%({col})s' for col in ACTIVITY_LOG_COLUMNS)}
+        FROM m JOIN d ON TRUE
+        WHERE m.punched_in
+        ON CONFLICT DO NOTHING
+        RETURNING id, device_id, {ACTIVITY_RETURNING}, {WINDOW_RETURNING}
+    ),
+    {MEMBER_DAY_FROM_INSERT},
+    {WINDOW_ACTIVITY_FROM_INSERT}
+    SELECT {UPLOAD_TARGET_COLUMNS}, (SELECT id FROM ins) AS raw_data_id
+    FROM (SELECT 1) AS one LEFT JOIN m ON TRUE LEFT JOIN d ON TRUE
+"""
+
+# Delta sample: validate and lock the device's tracker_device_state row ...
+UPLOAD_RESOLVE_SQL = f"""
+    WITH {UPLOAD_TARGET_CTE},
+    st AS (
+        SELECT {', '.join(f's.{col}' for col in STATE_COLUMNS)}
+        FROM tracker_device_state s JOIN m ON s.member_id = m.id
+        WHERE s.device_id = %(device_id)s
+        FOR UPDATE OF s
+    )
+    SELECT {UPLOAD_TARGET_COLUMNS}, {', '.join(f'st.{col}' for col in STATE_COLUMNS)}
+    FROM (SELECT 1) AS one LEFT JOIN m ON TRUE LEFT JOIN d ON TRUE LEFT JOIN st ON TRUE
+"""
+
+# ... then write the rebuilt state and the activity row in one statement
+UPLOAD_DELTA_WRITE_SQL = f"""
+    WITH state AS ({DEVICE_STATE_UPSERT.format(values=DEVICE_STATE_VALUES)}),
+    ins AS ({ACTIVITY_LOG_INSERT.format(values=f"({', '.join(['%s'] * len(ACTIVITY_LOG_COLUMNS))})")}),
+    {MEMBER_DAY_FROM_INSERT},
+    {WINDOW_ACTIVITY_FROM_INSERT}
+    SELECT (SELECT id FROM ins) AS raw_data_id
+"""
+
+
+def member_status_for_sample(data):
+    """
+    Map a tracker sample to a member status
+
+    locked   → 'offline' (screen locked, no activity possible)
+    idle     → 'idle'    (mouse/keyboard inactive past threshold)
+    active   → 'active'  (user is actively working)
+    """
+    if data.get('locked', False):
+        return 'offline'
+    if data.get('isidle', False):
+        return 'idle'
+    return 'active'
+
+
+def activity_log_row(company_id, member_id, email, data, now, dimension_ids):
+    """
+    Build the activity_log values tuple (ordered as ACTIVITY_LOG_COLUMNS) for
+    one sample; dimension_ids is what intern_samples() returned for it
+    """
+    return (
+        company_id, member_id, data.get('deviceid', ''), sample_timestamp(data, now),
+        data.get('sessionstart'), data.get('lastactivity'), data.get('username'),
+        email, data.get('totalseconds', 0),
+        data.get('activeseconds', 0), data.get('idleseconds', 0), data.get('lockedseconds', 0),
+        data.get('idlefor', 0), data.get('isidle', False), data.get('locked', False),
+        data.get('mouseactive', False), data.get('keyboardactive', False),
+        data.get('currentwindow'), data.get('currentprocess'),
+        json.dumps(data.get('windowsopened', [])), json.dumps(data.get('browserhistory', [])),
+        data.get('screenshot'), client_seq(data), *sample_dimension_ids(data, dimension_ids),
+    )
+
+
+def timestamp_needs_fallback(data, now):
+    """True when the sample's timestamp is missing or more than TRACKER_MAX_FUTURE_SECONDS ahead of `now`"""
+    value = data.get('timestamp')
+    if not value:
+        return True
+    try:
+        parsed = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    except ValueError:
+        return False
+    # Postgres ignores an offset when casting to timestamp; compare the same way
+    return parsed.replace(tzinfo=None) > now + timedelta(seconds=TRACKER_MAX_FUTURE_SECONDS)
+
+
+def sample_timestamp(data, now):
+    """
+    The sample's timestamp, or `now` (server UTC) when it is missing or more
+    than TRACKER_MAX_FUTURE_SECONDS ahead. Unparseable values are passed on.
+    """
+    if timestamp_needs_fallback(data, now):
+        if data.get('timestamp'):
+            print(f"⚠️ Sample timestamp {data['timestamp']} is ahead of the server clock; using {now.isoformat()}")
+        return now
+    return data['timestamp']
+
+
+def unstable_timestamp(data, now):
+    """
+    True for a sample with a client seq whose timestamp would be replaced by
+    the receive time. (device, client_seq, timestamp) is its idempotency key,
+    so a retry would get a new key and slip past ON CONFLICT: such samples
+    are rejected (INVALID_TIMESTAMP) instead of written.
+    """
+    return client_seq(data) is not None and timestamp_needs_fallback(data, now)
+
+
+def stamp_receipt_time(samples, now):
+    """
+    Fill in the receive time for samples without a client seq whose timestamp
+    would fall back to it, so a spooled sample keeps the time it arrived
+    rather than the time it is drained
+    """
+    for sample in samples:
+        if isinstance(sample, dict) and client_seq(sample) is None and timestamp_needs_fallback(sample, now):
+            sample['timestamp'] = sample_timestamp(sample, now).isoformat()
+
+
+def client_seq(data):
+    """The tracker's upload sequence number (idempotency key with deviceid), or None"""
+    try:
+        return int(data['seq']) if data.get('seq') is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def upload_params(company_id, email, data, now, punched_in, dimension_ids):
+    """Named parameters for UPLOAD_INSERT_SQL / UPLOAD_RESOLVE_SQL"""
+    params = dict(zip(ACTIVITY_LOG_COLUMNS, activity_log_row(company_id, None, email, data, now, dimension_ids)))
+    params['punched_in'] = punched_in
+    return params
+
+
+def read_upload_body():
+    """
+    Parse a tracker upload request. Returns (data, files).
+
+    application/json      the sample itself; screenshot (if any) is base64 in data['screenshot']
+    multipart/form-data   'payload' field holds the sample JSON and screenshots arrive as
+                          binary file parts, which Werkzeug spools to a temp file instead
+                          of holding them in memory as base64 text
+    """
+    if request.mimetype == 'multipart/form-data':
+        try:
+            data = json.loads(request.form.get('payload') or '{}')
+        except ValueError:
+            data = {}
+        return data, request.files
+    return request.get_json(silent=True) or {}, {}
+
+
+def decode_screenshot_payload(screenshot_data):
+    """Strip an optional data-URL prefix and base64-decode a tracker screenshot"""
+    if ',' in screenshot_data:
+        screenshot_data = screenshot_data.split(',', 1)[1]
+    return base64.b64decode(screenshot_data)
+
+
+def screenshot_source(screenshot):
+    """Raw image for a screenshot: decoded bytes for base64 text, the stream for a file part"""
+    if isinstance(screenshot, str):
+        return decode_screenshot_payload(screenshot)
+    return screenshot.stream
+
+
+def store_screenshot(cur, company_id, member_id, device_db_id, raw_data_id, timestamp, tracking_date, screenshot_data):
+    """
+    Synchronously transcode a screenshot (base64 text or multipart file part),
+    store it as WebP and mirror it to the filesystem. Used when the screenshot
+    pipeline is disabled. Returns the screenshot id, or None if processing failed.
+    """
+    try:
+        source = screenshot_source(screenshot_data)
+        processed = transcode_image(source)
+        return save_processed_screenshot(cur, {
+            'company_id': company_id,
+            'member_id': member_id,
+            'device_db_id': device_db_id,
+            'raw_data_id': raw_data_id,
+            'timestamp': timestamp,
+            'tracking_date': tracking_date
+        }, processed)
+    except Exception as e:
+        print(f"⚠️ Screenshot processing error: {e}")
+        return None
+
+
+def queue_screenshots(jobs):
+    """
+    Hand (meta, screenshot) jobs to the async pipeline, where screenshot is
+    base64 text or a multipart file part. Must be called after the activity
+    rows are committed. Returns one job id (or None) per job.
+    """
+    job_ids = []
+    for meta, screenshot_data in jobs:
+        try:
+            job_ids.append(enqueue_screenshot(meta, screenshot_source(screenshot_data)))
+        except QueueFullError as e:
+            print(f"⚠️ Screenshot dropped for member {meta['member_id']}: {e}")
+            job_ids.append(None)
+        except Exception as e:
+            print(f"⚠️ Failed to queue screenshot for member {meta['member_id']}: {e}")
+            job_ids.append(None)
+    return job_ids
+
+
 # ============================================================================
 # UPLOAD DATA
 # ============================================================================
@@ -1989,36 +2320,80 @@ def tracker_punch_out():
 @tracker_bp.route('/tracker/upload', methods=['POST'])
 @require_tracker_token
 def tracker_upload():
-    """Upload tracking data from tracker"""
+    """
+    Upload tracking data from tracker
+
+    Accepts either a JSON body (screenshot as base64) or multipart/form-data
+    with the sample JSON in 'payload' and the image as a binary 'screenshot'
+    part. Multipart screenshots are not copied into activity_log.screenshot.
+    When the ingest spool is in use (or Postgres is unavailable) the sample
+    is spooled and the response is 202.
+    """
     try:
-        data = request.get_json(silent=True) or {}
         company_id = request.tracker_company_id
 
+        rejection = ingest_rejection(company_id, request.tracker_company)
+        if rejection:
+            return rejection
+
+        data, files = read_upload_body()
+
         email = data.get('email', '').lower().strip()
         deviceid_str = data.get('deviceid', '')
 
         if not email or not deviceid_str:
             return jsonify({"error": "Email and deviceid required"}), 400
 
+        if unstable_timestamp(data, datetime.utcnow()):
+            print(f"⚠️ UPLOAD: seq {client_seq(data)} from device {deviceid_str} has no usable timestamp")
+            return jsonify({
+                "success": False,
+                "error": "Sample timestamp is missing or ahead of the server clock",
+                "code": "INVALID_TIMESTAMP"
+            }), 400
+
+        if should_spool():
+            return spool_upload(company_id, [data], {0: files['screenshot']} if files.get('screenshot') else {})
+
+        now = datetime.utcnow()
+        today = now.date()
+        delta = is_delta_sample(data)
+
+        # The presence store answers the punch check when it knows the member;
+        # otherwise the upload statement reads members.is_punched_in itself
+        generation = get_identity_generation(company_id)
+        cached_member_id = get_cached_identity(member_key(company_id, email))
+        cached_punched_in = get_punched_in(cached_member_id) if cached_member_id else None
+        read_started_at = time.time()
+
+        # Process / window / URL ids (a round trip only on a dimension cache miss)
+        dimension_ids = intern_samples([data])
+
         with get_db() as conn:
             cur = conn.cursor()
 
-            cur.execute("SELECT id FROM members WHERE company_id = %s AND email = %s", (company_id, email))
-            member = cur.fetchone()
+            # One round trip validates member, punch state and device and, for a
+            # full sample, inserts the activity row; a delta sample locks its
+            # device state here and is written by a second statement below
+            cur.execute(
+                UPLOAD_RESOLVE_SQL if delta else UPLOAD_INSERT_SQL,
+                upload_params(company_id, email, data, now, cached_punched_in, dimension_ids)
+            )
+            target = cur.fetchone()
+            member_id = target['member_id']
 
-            if not member:
+            if not member_id:
                 return jsonify({"error": "Member not found"}), 404
 
-            member_id = member['id']
+            cache_identity(member_key(company_id, email), member_id, generation)
+            if cached_punched_in is None:
+                seed_punched_in(company_id, member_id, bool(target['db_punched_in']), read_started_at)
 
             # ✅ FIX 4: Guard — if member is not punched in, do NOT update status or write activity.
             # This is the root cause of dashboard/team page showing 'idle' after punch-out:
             # the DataUploader thread sends one or two more uploads after punch-out fires,
             # which overwrote the 'offline' status with 'idle' or 'active'.
-            cur.execute("SELECT is_punched_in FROM members WHERE id = %s", (member_id,))
-            member_state = cur.fetchone()
-
-            if not member_state or not member_state.get('is_punched_in'):
+            if not target['punched_in']:
                 print(f"⚠️ UPLOAD: Member {member_id} is NOT punched in — skipping data write and status update")
                 return jsonify({
                     "success": False,
@@ -2027,166 +2402,85 @@ def tracker_upload():
                 }), 200
 
             # Member is punched in — proceed normally
-            cur.execute(
-                "SELECT id FROM devices WHERE company_id = %s AND member_id = %s AND device_id = %s",
-                (company_id, member_id, deviceid_str)
-            )
-            device = cur.fetchone()
+            device_db_id = target['device_db_id']
 
-            if not device:
+            if not device_db_id:
                 return jsonify({"error": "Device not registered"}), 404
 
-            device_db_id = device['id']
+            cache_identity(device_key(company_id, member_id, deviceid_str), device_db_id, generation)
 
-            now = datetime.utcnow()
-            today = now.date()
+            # Delta protocol: rebuild cumulative counters from the locked tracker_device_state row
+            ack_seq = None
+            if delta:
+                state = device_state_from_row(target)
+                outcomes, changed = reconstruct_sample_deltas(
+                    {(member_id, deviceid_str): state} if state else {},
+                    [(0, member_id, deviceid_str, data)]
+                )
+                outcome = outcomes[0]
+                if outcome['status'] != 'applied':
+                    return jsonify({
+                        "success": outcome['status'] == 'duplicate',
+                        "code": outcome['status'].upper(),
+                        "ackseq": outcome['seq'] if outcome['status'] == 'duplicate' else None,
+                        "lastseq": outcome['lastseq']
+                    }), 200
+                ack_seq = outcome['seq']
+
+                cur.execute(
+                    UPLOAD_DELTA_WRITE_SQL,
+                    device_state_row(company_id, member_id, deviceid_str, changed[(member_id, deviceid_str)])
+                    + activity_log_row(company_id, member_id, email, data, now, dimension_ids)
+                )
+                target = cur.fetchone()
 
-            is_idle = data.get('isidle', False)
-            is_locked = data.get('locked', False)
+            member_status = member_status_for_sample(data)
 
-            # ✅ FIX 5: Correct status mapping
-            # locked   → 'offline' (screen locked, no activity possible)
-            # idle     → 'idle'    (mouse/keyboard inactive past threshold)
-            # active   → 'active'  (user is actively working)
-            if is_locked:
-                member_status = 'offline'
-            elif is_idle:
-                member_status = 'idle'
-            else:
-                member_status = 'active'
+            screenshot_data = files.get('screenshot') or data.get('screenshot')
 
-            screenshot_data = data.get('screenshot')
-            windows_opened = data.get('windowsopened', [])
-            browser_history = data.get('browserhistory', [])
+            # A replayed seq inserts nothing
+            raw_data_id = target['raw_data_id']
+            if not raw_data_id:
+                print(f"🔁 UPLOAD: Replay of seq {client_seq(data)} from device {deviceid_str} ignored")
+                return jsonify({
+                    "success": True,
+                    "message": "Upload already received",
+                    "code": "DUPLICATE",
+                    "ackseq": client_seq(data)
+                }), 200
 
-            # Insert into activity_log
-            cur.execute("""
-                INSERT INTO activity_log (
-                    company_id, member_id, device_id, timestamp,
-                    session_start, last_activity, username, email,
-                    total_seconds, active_seconds, idle_seconds, locked_seconds,
-                    idle_for, is_idle, locked, mouse_active, keyboard_active,
-                    current_window, current_process, windows_opened, browser_history, screenshot
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s
-                ) RETURNING id
-            """, (
-                company_id, member_id, deviceid_str, data.get('timestamp', now),
-                data.get('sessionstart'), data.get('lastactivity'), data.get('username'),
-                email, data.get('totalseconds', 0),
-                data.get('activeseconds', 0), data.get('idleseconds', 0), data.get('lockedseconds', 0),
-                data.get('idlefor', 0), is_idle, is_locked, data.get('mouseactive', False),
-                data.get('keyboardactive', False), data.get('currentwindow'), data.get('currentprocess'),
-                json.dumps(windows_opened), json.dumps(browser_history), screenshot_data
-            ))
-
-            result = cur.fetchone()
-            raw_data_id = result['id'] if result else None
-
-            # Process screenshot if provided
+            # Process screenshot if provided (queued for the async pipeline after commit)
             screenshot_id = None
+            screenshot_jobs = []
             if screenshot_data:
-                try:
-                    if ',' in screenshot_data:
-                        screenshot_data = screenshot_data.split(',', 1)[1]
-
-                    img_data = base64.b64decode(screenshot_data)
-                    img = Image.open(BytesIO(img_data))
-
-                    output = BytesIO()
-                    img.save(output, format='WEBP', quality=80)
-                    webp_binary = output.getvalue()
-
-                    cur.execute("""
-                        INSERT INTO screenshots (
-                            company_id, member_id, device_id, raw_data_id, timestamp, tracking_date,
-                            screenshot_data, file_size, width, height
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        RETURNING id
-                    """, (
-                        company_id, member_id, device_db_id, raw_data_id,
-                        data.get('timestamp', now), today, webp_binary,
-                        len(webp_binary), img.width, img.height
-                    ))
-
-                    result = cur.fetchone()
-                    screenshot_id = result['id'] if result else None
-                    print(f"🔍 screenshot_id={screenshot_id}, company_id={company_id}, member_id={member_id}")
-
-                    # Validate screenshot
-                    try:
-                        MIN_FILE_SIZE = 1024
-                        MIN_DIM = 100
-                        is_valid = True
-                        invalid_reason = None
-                        if len(webp_binary) < MIN_FILE_SIZE or img.width < MIN_DIM or img.height < MIN_DIM:
-                            is_valid = False
-                            invalid_reason = 'too_small_or_small_dimensions'
-                        cur.execute(
-                            "UPDATE screenshots SET is_valid = %s, invalid_reason = %s WHERE id = %s",
-                            (is_valid, invalid_reason, screenshot_id)
-                        )
-                    except Exception as e:
-                        print(f"⚠️ Failed to set validity for screenshot {screenshot_id}: {e}")
-
-                    # Save to filesystem (optional)
-                    try:
-                        if SAVE_SCREENSHOTS_TO_FS and screenshot_id:
-                            should_save = True
-                            if SAVE_SCREENSHOTS_ONLY_WHEN_PUNCHED_IN:
-                                # Already confirmed is_punched_in = TRUE above, so always save
-                                should_save = True
-
-                            if should_save:
-                                save_root = os.getenv('SCREENSHOT_SAVE_PATH', SCREENSHOT_SAVE_PATH)
-                                file_dir = os.path.join(save_root, str(company_id), str(member_id))
-                                try:
-                                    os.makedirs(file_dir, exist_ok=True)
-                                except Exception as e:
-                                    print(f"⚠️ Failed to create screenshot directory '{file_dir}': {e}")
-
-                                ts = data.get('timestamp', now)
-                                try:
-                                    ts_str = ts.strftime('%Y%m%d_%H%M%S')
-                                except Exception:
-                                    ts_str = now.strftime('%Y%m%d_%H%M%S')
-
-                                fname = f"screenshot_{screenshot_id}_{ts_str}.webp"
-                                fpath = os.path.join(file_dir, fname)
-                                print(f"🔍 Writing to {fpath}")
-                                with open(fpath, 'wb') as f:
-                                    f.write(webp_binary)
-                                print(f"✅ Saved screenshot to filesystem: {fpath}")
-                                try:
-                                    cur.execute(
-                                        "UPDATE screenshots SET is_saved_to_fs = TRUE, saved_filename = %s WHERE id = %s",
-                                        (fpath, screenshot_id)
-                                    )
-                                except Exception as e:
-                                    print(f"⚠️ Failed to update screenshot saved flag: {e}")
-                        else:
-                            print(f"⚠️ Not saving to filesystem (SAVE_SCREENSHOTS_TO_FS={SAVE_SCREENSHOTS_TO_FS})")
-                    except Exception as e:
-                        print(f"⚠️ Failed to save screenshot to filesystem: {e}")
+                if SCREENSHOT_PIPELINE_ENABLED:
+                    screenshot_jobs.append(({
+                        'company_id': company_id,
+                        'member_id': member_id,
+                        'device_db_id': device_db_id,
+                        'raw_data_id': raw_data_id,
+                        'timestamp': sample_timestamp(data, now),
+                        'tracking_date': today
+                    }, screenshot_data))
+                else:
+                    screenshot_id = store_screenshot(
+                        cur, company_id, member_id, device_db_id, raw_data_id,
+                        sample_timestamp(data, now), today, screenshot_data
+                    )
 
-                except Exception as e:
-                    print(f"⚠️ Screenshot processing error: {e}")
+            conn.commit()
 
-            # Update member status (only when punched in — already guarded above)
-            cur.execute("""
-                UPDATE members 
-                SET last_activity_at = %s, last_heartbeat_at = %s, status = %s 
-                WHERE id = %s
-            """, (now, now, member_status, member_id))
+        # Member status (only when punched in — already guarded above) goes
+        # through the presence store; Postgres is updated now only on a transition
+        if record_member_activity(company_id, member_id, member_status, now):
+            flush_presence([member_id])
 
-            conn.commit()
+        screenshot_job_ids = queue_screenshots(screenshot_jobs)
 
         # ✅ FIX 6: Emit real-time status update so dashboard reflects idle/active instantly
         emit_member_status_update(company_id, member_id, member_status)
 
-        asyncio.create_task(broadcast_ws_status(company_id, member_id, member_status))
+        schedule_ws_broadcast(company_id, member_id, member_status)
 
 
         print(f"✅ UPLOAD: Data uploaded for member {member_id}, status={member_status}")
@@ -2196,10 +2490,19 @@ def tracker_upload():
             "message": "Data uploaded successfully",
             "rawdataid": raw_data_id,
             "screenshotid": screenshot_id,
+            "screenshotqueued": bool(screenshot_job_ids and screenshot_job_ids[0]),
             "memberstatus": member_status,
+            "ackseq": ack_seq,
             "trackingdate": today.isoformat()
         }), 200
 
+    except DB_UNAVAILABLE_ERRORS as e:
+        if spool_enabled():
+            print(f"⚠️ UPLOAD: database unavailable ({e}) — spooling")
+            return spool_upload(company_id, [data], {0: files['screenshot']} if files.get('screenshot') else {})
+        print(f"❌ UPLOAD Error: {e}")
+        return jsonify({"error": "Failed to upload data"}), 500
+
     except Exception as e:
         print(f"❌ UPLOAD Error: {e}")
         import traceback
@@ -2207,6 +2510,369 @@ def tracker_upload():
         return jsonify({"error": "Failed to upload data"}), 500
 
 
+# ============================================================================
+# UPLOAD BATCH
+# ============================================================================
+
+def ingest_sample_batch(cur, company_id, samples, dimension_ids, files=None, captured_punched_in=None):
+    """
+    Write a batch of tracker samples using multi-row statements.
+
+    Members and devices come from the identity cache; misses for the whole
+    batch are resolved with one query each, and punched-in flags come from
+    the presence store. Activity rows go in with a single multi-row INSERT;
+    member status is left to record_batch_presence() after commit.
+
+    Returns (results, status_updates, screenshot_jobs) where results has one
+    entry per sample (same order), status_updates maps member_id -> latest
+    status in the batch and screenshot_jobs is a list of (index, meta,
+    screenshot) to hand to queue_screenshots() after commit. files maps
+    multipart part names to binary screenshots ('screenshot_<index>').
+    dimension_ids is intern_samples(samples), resolved before the transaction.
+    captured_punched_in (spool replay) holds each sample's punched-in flag
+    when it was received (None where unknown); it takes precedence over the
+    member's current flag, so a punch out before the drain doesn't drop
+    samples captured while punched in.
+    """
+    files = files or {}
+    now = datetime.utcnow()
+    results = [None] * len(samples)
+    pending = []
+
+    for index, sample in enumerate(samples):
+        if not isinstance(sample, dict):
+            results[index] = {"index": index, "accepted": False, "code": "INVALID_SAMPLE"}
+            continue
+        email = str(sample.get('email') or '').lower().strip()
+        deviceid_str = str(sample.get('deviceid') or '')
+        if not email or not deviceid_str:
+            results[index] = {"index": index, "accepted": False, "code": "MISSING_EMAIL_OR_DEVICE"}
+            continue
+        if unstable_timestamp(sample, now):
+            results[index] = {"index": index, "accepted": False, "code": "INVALID_TIMESTAMP"}
+            continue
+        pending.append((index, email, deviceid_str, sample))
+
+    if not pending:
+        return results, {}, []
+
+    # Members: identity cache first, one query for the misses
+    generation = get_identity_generation(company_id)
+    members = {}
+    punched_in = {}
+    missing_emails = []
+    for email in sorted({email for _, email, _, _ in pending}):
+        member_id = get_cached_identity(member_key(company_id, email))
+        if member_id is None:
+            missing_emails.append(email)
+        else:
+            members[email] = member_id
+
+    if missing_emails:
+        read_started_at = time.time()
+        cur.execute("""
+            SELECT id, email, is_punched_in
+            FROM members
+            WHERE company_id = %s AND email = ANY(%s)
+        """, (company_id, missing_emails))
+        for row in cur.fetchall():
+            members[row['email']] = row['id']
+            punched_in[row['id']] = bool(row['is_punched_in'])
+            cache_identity(member_key(company_id, row['email']), row['id'], generation)
+            seed_punched_in(company_id, row['id'], punched_in[row['id']], read_started_at)
+
+    # Punched-in flags: presence store, one query for the unknowns
+    unknown_ids = []
+    for member_id in set(members.values()) - set(punched_in):
+        state = get_punched_in(member_id)
+        if state is None:
+            unknown_ids.append(member_id)
+        else:
+            punched_in[member_id] = state
+
+    if unknown_ids:
+        read_started_at = time.time()
+        cur.execute("SELECT id, is_punched_in FROM members WHERE id = ANY(%s)", (sorted(unknown_ids),))
+        for row in cur.fetchall():
+            punched_in[row['id']] = bool(row['is_punched_in'])
+            seed_punched_in(company_id, row['id'], punched_in[row['id']], read_started_at)
+
+    # Devices: identity cache first, one query for the misses
+    devices = {}
+    missing_devices = set()
+    for _, email, deviceid_str, _ in pending:
+        member_id = members.get(email)
+        if member_id is None or (member_id, deviceid_str) in devices:
+            continue
+        device_db_id = get_cached_identity(device_key(company_id, member_id, deviceid_str))
+        if device_db_id is None:
+            missing_devices.add((member_id, deviceid_str))
+        else:
+            devices[(member_id, deviceid_str)] = device_db_id
+
+    if missing_devices:
+        cur.execute("""
+            SELECT id, member_id, device_id
+            FROM devices
+            WHERE company_id = %s AND member_id = ANY(%s) AND device_id = ANY(%s)
+        """, (company_id,
+              sorted({m for m, _ in missing_devices}),
+              sorted({d for _, d in missing_devices})))
+        for row in cur.fetchall():
+            devices[(row['member_id'], row['device_id'])] = row['id']
+            cache_identity(device_key(company_id, row['member_id'], row['device_id']), row['id'], generation)
+
+    accepted = []
+    for index, email, deviceid_str, sample in pending:
+        member_id = members.get(email)
+        if not member_id:
+            results[index] = {"index": index, "accepted": False, "code": "MEMBER_NOT_FOUND"}
+            continue
+        captured = captured_punched_in[index] if captured_punched_in else None
+        if not (punched_in.get(member_id) if captured is None else captured):
+            results[index] = {"index": index, "accepted": False, "code": "NOT_PUNCHED_IN"}
+            continue
+        device_db_id = devices.get((member_id, deviceid_str))
+        if not device_db_id:
+            results[index] = {"index": index, "accepted": False, "code": "DEVICE_NOT_REGISTERED"}
+            continue
+        accepted.append((index, email, member_id, device_db_id, sample))
+
+    # Delta samples: rebuild cumulative state, drop retries and out-of-sequence uploads
+    delta_outcomes = apply_sample_deltas(
+        cur, company_id,
+        [(index, member_id, str(sample.get('deviceid') or ''), sample) for index, _, member_id, _, sample in accepted]
+    )
+    for index, outcome in delta_outcomes.items():
+        if outcome['status'] == 'duplicate':
+            results[index] = {"index": index, "accepted": True, "code": "DUPLICATE",
+                              "ackseq": outcome['seq'], "rawdataid": None}
+        elif outcome['status'] == 'resync':
+            results[index] = {"index": index, "accepted": False, "code": "RESYNC",
+                              "lastseq": outcome['lastseq']}
+    accepted = [entry for entry in accepted if entry[0] not in delta_outcomes
+                or delta_outcomes[entry[0]]['status'] == 'applied']
+
+    if not accepted:
+        return results, {}, []
+
+    rows = [activity_log_row(company_id, member_id, email, sample, now, dimension_ids)
+            for _, email, member_id, _, sample in accepted]
+    inserted = execute_values(
+        cur,
+        ACTIVITY_BATCH_INSERT,
+        rows,
+        page_size=len(rows),
+        fetch=True
+    )
+
+    # Replayed (device, seq) pairs come back without a row
+    inserted_by_seq = {}
+    inserted_unkeyed = []
+    for row in inserted:
+        if row['client_seq'] is None:
+            inserted_unkeyed.append(row['id'])
+        else:
+            inserted_by_seq[(row['device_id'], row['client_seq'])] = row['id']
+    inserted_unkeyed.reverse()
+
+    status_updates = {}
+    screenshot_jobs = []
+    seq_index = ACTIVITY_LOG_COLUMNS.index('client_seq')
+    for (index, email, member_id, device_db_id, sample), row in zip(accepted, rows):
+        seq = row[seq_index]
+        if seq is None:
+            raw_data_id = inserted_unkeyed.pop()
+        else:
+            raw_data_id = inserted_by_seq.pop((str(row[2]), seq), None)
+        if raw_data_id is None:
+            results[index] = {"index": index, "accepted": True, "code": "DUPLICATE",
+                              "ackseq": seq, "rawdataid": None}
+            continue
+        screenshot_id = None
+        screenshot = files.get(f'screenshot_{index}') or sample.get('screenshot')
+        if screenshot:
+            if SCREENSHOT_PIPELINE_ENABLED:
+                screenshot_jobs.append((index, {
+                    'company_id': company_id,
+                    'member_id': member_id,
+                    'device_db_id': device_db_id,
+                    'raw_data_id': raw_data_id,
+                    'timestamp': sample_timestamp(sample, now),
+                    'tracking_date': now.date()
+                }, screenshot))
+            else:
+                screenshot_id = store_screenshot(
+                    cur, company_id, member_id, device_db_id, raw_data_id,
+                    sample_timestamp(sample, now), now.date(), screenshot
+                )
+        member_status = member_status_for_sample(sample)
+        if punched_in.get(member_id):
+            # Replayed samples of a member who has punched out since don't change presence
+            status_updates[member_id] = member_status
+        results[index] = {
+            "index": index,
+            "accepted": True,
+            "rawdataid": raw_data_id,
+            "screenshotid": screenshot_id,
+            "memberstatus": member_status
+        }
+        if index in delta_outcomes:
+            results[index]['ackseq'] = delta_outcomes[index]['seq']
+
+    return results, status_updates, screenshot_jobs
+
+
+def ingest_batch(company_id, samples, files=None, captured_punched_in=None):
+    """
+    Ingest samples in one transaction, then record presence, queue
+    screenshots and emit status updates. Returns the per-sample results.
+    """
+    dimension_ids = intern_samples(samples)
+
+    with get_db() as conn:
+        cur = conn.cursor()
+        results, status_updates, screenshot_jobs = ingest_sample_batch(
+            cur, company_id, samples, dimension_ids, files, captured_punched_in
+        )
+        conn.commit()
+
+    record_batch_presence(company_id, status_updates)
+
+    job_ids = queue_screenshots([(meta, shot) for _, meta, shot in screenshot_jobs])
+    for (index, _, _), job_id in zip(screenshot_jobs, job_ids):
+        results[index]['screenshotqueued'] = job_id is not None
+
+    for member_id, member_status in status_updates.items():
+        emit_member_status_update(company_id, member_id, member_status)
+
+    return results
+
+
+def replay_spooled_batch(company_id, samples, files, captured_punched_in=None):
+    """Ingest spool drainer callback: returns the per-sample results"""
+    return ingest_batch(company_id, samples, files, captured_punched_in)
+
+
+def captured_punch_states(company_id, samples):
+    """
+    Each sample's punched-in flag as known now, from the identity cache and
+    presence store only (None where unknown), recorded with spooled samples
+    """
+    states = []
+    for sample in samples:
+        email = str(sample.get('email') or '').lower().strip() if isinstance(sample, dict) else ''
+        member_id = get_cached_identity(member_key(company_id, email)) if email else None
+        states.append(get_punched_in(member_id) if member_id is not None else None)
+    return states
+
+
+def spool_upload(company_id, samples, screenshots=None):
+    """
+    Durably spool samples (screenshots: sample index -> file part) and answer
+    202. Delta samples are acknowledged now; the drainer applies them in order.
+    The punched-in state at receipt travels with the samples, and so does
+    the receive time of samples whose timestamp falls back to it.
+    """
+    stamp_receipt_time(samples, datetime.utcnow())
+    try:
+        spool_samples(company_id, samples, screenshots, captured_punch_states(company_id, samples))
+    except SpoolFullError as e:
+        print(f"❌ UPLOAD: {e}")
+        response = jsonify({"success": False, "error": "Ingest temporarily unavailable", "code": "SPOOL_FULL"})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+
+    results = [{
+        "index": index,
+        "accepted": True,
+        "spooled": True,
+        "ackseq": client_seq(sample) if isinstance(sample, dict) else None
+    } for index, sample in enumerate(samples)]
+
+    return jsonify({
+        "success": True,
+        "spooled": True,
+        "message": "Upload accepted for processing",
+        "accepted": len(samples),
+        "rejected": 0,
+        "ackseq": results[0]['ackseq'] if len(results) == 1 else None,
+        "results": results
+    }), 202
+
+
+def record_batch_presence(company_id, status_updates):
+    """Record each member's latest batch status; flush status transitions to Postgres right away"""
+    transitions = [
+        member_id for member_id, member_status in status_updates.items()
+        if record_member_activity(company_id, member_id, member_status)
+    ]
+    if transitions:
+        flush_presence(transitions)
+
+
+@tracker_bp.route('/tracker/upload-batch', methods=['POST'])
+@require_tracker_token
+def tracker_upload_batch():
+    """
+    Upload many tracking samples (from one or many devices) in one request
+
+    Body: {"samples": [<same fields as /tracker/upload>, ...]}
+    or multipart/form-data with that JSON in 'payload' and each sample's
+    screenshot as a binary part named 'screenshot_<index>'.
+    All accepted samples are written in a single transaction. The response
+    lists, per sample index, whether it was accepted and why not.
+    """
+    try:
+        data, files = read_upload_body()
+        company_id = request.tracker_company_id
+        samples = data.get('samples')
+
+        if not isinstance(samples, list) or not samples:
+            return jsonify({"error": "samples must be a non-empty array"}), 400
+
+        if len(samples) > TRACKER_BATCH_MAX_SAMPLES:
+            return jsonify({
+                "error": f"Too many samples (max {TRACKER_BATCH_MAX_SAMPLES})"
+            }), 413
+
+        rejection = ingest_rejection(company_id, request.tracker_company, cost=len(samples))
+        if rejection:
+            return rejection
+
+        batch_screenshots = {
+            int(name.split('_', 1)[1]): part for name, part in files.items()
+            if name.startswith('screenshot_') and name.split('_', 1)[1].isdigit()
+        }
+
+        if should_spool():
+            return spool_upload(company_id, samples, batch_screenshots)
+
+        try:
+            results = ingest_batch(company_id, samples, files)
+        except DB_UNAVAILABLE_ERRORS as e:
+            if not spool_enabled():
+                raise
+            print(f"⚠️ UPLOAD-BATCH: database unavailable ({e}) — spooling {len(samples)} samples")
+            return spool_upload(company_id, samples, batch_screenshots)
+
+        accepted_count = sum(1 for r in results if r['accepted'])
+        print(f"✅ UPLOAD-BATCH: company {company_id}, accepted {accepted_count}/{len(samples)}")
+
+        return jsonify({
+            "success": True,
+            "accepted": accepted_count,
+            "rejected": len(samples) - accepted_count,
+            "results": results
+        }), 200
+
+    except Exception as e:
+        print(f"❌ UPLOAD-BATCH Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": "Failed to upload batch"}), 500
+
+
 # ============================================================================
 # HEARTBEAT
 # ============================================================================
@@ -2231,30 +2897,20 @@ def tracker_heartbeat():
             # ✅ FIX 7: Only update device last_seen if member is still punched in.
             # Heartbeat after punch-out was keeping device status as 'online',
             # causing confusion on the dashboard.
-            cur.execute("""
-                SELECT m.id, m.is_punched_in
-                FROM members m
-                WHERE m.company_id = %s AND m.email = %s
-            """, (company_id, email))
-
-            member = cur.fetchone()
+            member_id = resolve_member_id(cur, company_id, email)
 
-            if not member:
+            if not member_id:
                 return jsonify({"error": "Member not found"}), 404
 
-            if not member.get('is_punched_in'):
-                print(f"⚠️ HEARTBEAT: Member {member['id']} is not punched in — ignoring heartbeat device update")
+            if not member_is_punched_in(cur, company_id, member_id):
+                print(f"⚠️ HEARTBEAT: Member {member_id} is not punched in — ignoring heartbeat device update")
                 return jsonify({"success": True, "message": "Heartbeat received (member not punched in)"}), 200
 
-            cur.execute("""
-                UPDATE devices d 
-                SET last_seen_at = %s, status = 'online'
-                FROM members m 
-                WHERE d.company_id = %s AND d.member_id = m.id 
-                  AND m.email = %s AND d.device_id = %s
-            """, (datetime.utcnow(), company_id, email, deviceid_str))
+            device_db_id = resolve_device_db_id(cur, company_id, member_id, deviceid_str)
 
-            conn.commit()
+        # devices.last_seen_at is written behind by the presence flusher
+        if device_db_id:
+            record_device_seen(company_id, device_db_id)
 
         return jsonify({"success": True, "message": "Heartbeat received"}), 200
 
@@ -0,0 +1,229 @@
+"""
+TRACKER_STATE.PY - Delta upload protocol (server-side reconstruction)
+=====================================================================
+✅ Trackers send counter increments and new window entries since the last
+   acknowledged sequence number instead of the full cumulative state
+✅ Per (member, device) state in `tracker_device_state` rebuilds the
+   cumulative counters and the rolling windows list
+✅ activity_log keeps cumulative counters (dashboards unchanged) but stores
+   only the newly opened windows in windows_opened
+✅ Retries of an applied upload are acknowledged without writing twice;
+   a gap in the sequence asks the tracker to resend from zero (RESYNC)
+
+Protocol (sample fields, `protocol: 2`):
+    seq            upload sequence number, never reused by a device
+    baseseq        last seq the server acknowledged; 0 = delta from zero
+                   (first upload of a session, or after RESYNC)
+    delta          {"totalseconds", "activeseconds", "idleseconds",
+                    "lockedseconds"} increments since baseseq
+    windowsadded   window entries opened since baseseq
+Everything else (idle/locked flags, current window, ...) is sent as before.
+Samples without `protocol` are full cumulative payloads and bypass this module.
+"""
+
+import json
+
+from psycopg2.extras import execute_values
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+DELTA_PROTOCOL_VERSION = 2
+MAX_WINDOWS_OPENED = 50
+
+COUNTER_FIELDS = {
+    'totalseconds': 'total_seconds',
+    'activeseconds': 'active_seconds',
+    'idleseconds': 'idle_seconds',
+    'lockedseconds': 'locked_seconds',
+}
+
+
+def is_delta_sample(sample):
+    try:
+        return int(sample.get('protocol') or 0) >= DELTA_PROTOCOL_VERSION
+    except (TypeError, ValueError):
+        return False
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_float(value):
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def merge_windows(windows, added):
+    """Replay the tracker's rolling list: append unseen entries, keep the last 50"""
+    windows = list(windows)
+    for entry in added:
+        if isinstance(entry, str) and entry not in windows:
+            windows.append(entry)
+    return windows[-MAX_WINDOWS_OPENED:]
+
+
+# ============================================================================
+# RECONSTRUCTION
+# ============================================================================
+
+STATE_COLUMNS = ('session_start', 'last_seq', 'windows_opened') + tuple(COUNTER_FIELDS.values())
+
+# One tracker_device_state upsert; {values} is '%s' for execute_values or a
+# DEVICE_STATE_VALUES row when embedded in a single-statement upload
+DEVICE_STATE_UPSERT = f"""
+    INSERT INTO tracker_device_state
+        (company_id, member_id, device_id, session_start, last_seq, windows_opened,
+         {', '.join(COUNTER_FIELDS.values())}, updated_at)
+    VALUES {{values}}
+    ON CONFLICT (member_id, device_id) DO UPDATE SET
+        session_start = EXCLUDED.session_start,
+        last_seq = EXCLUDED.last_seq,
+        windows_opened = EXCLUDED.windows_opened,
+        {', '.join(f'{col} = EXCLUDED.{col}' for col in COUNTER_FIELDS.values())},
+        updated_at = EXCLUDED.updated_at
+"""
+
+DEVICE_STATE_VALUES = f"(%s, %s, %s, %s, %s, %s, {', '.join(['%s'] * len(COUNTER_FIELDS))}, CURRENT_TIMESTAMP)"
+
+
+def device_state_from_row(row):
+    """State dict for a row holding STATE_COLUMNS, or None if the device has no state yet"""
+    if row is None or row.get('last_seq') is None:
+        return None
+    return {
+        'session_start': row['session_start'],
+        'last_seq': row['last_seq'],
+        'windows': row['windows_opened'] or [],
+        'counters': {col: float(row[col] or 0) for col in COUNTER_FIELDS.values()}
+    }
+
+
+def device_state_row(company_id, member_id, deviceid_str, state):
+    """Values tuple for DEVICE_STATE_VALUES"""
+    return (company_id, member_id, deviceid_str, state['session_start'], state['last_seq'],
+            json.dumps(state['windows']), *[state['counters'][col] for col in COUNTER_FIELDS.values()])
+
+
+def reconstruct_sample_deltas(states, entries):
+    """
+    Replay delta samples against `states` ({(member_id, deviceid_str): state}).
+
+    Pure part of apply_sample_deltas(): no SQL. Returns (outcomes, changed),
+    changed being {(member_id, deviceid_str): state} to write back.
+    """
+    outcomes = {}
+    changed = {}
+    for key, member_id, deviceid_str, sample in entries:
+        if not is_delta_sample(sample):
+            continue
+        seq = _as_int(sample.get('seq'))
+        base_seq = _as_int(sample.get('baseseq') or 0)
+        state = states.get((member_id, deviceid_str))
+        last_seq = state['last_seq'] if state else 0
+
+        if seq is None or base_seq is None:
+            outcomes[key] = {'status': 'resync', 'seq': seq, 'lastseq': last_seq}
+            continue
+
+        if base_seq == 0 and state is not None and seq <= last_seq:
+            # Seqs never repeat per device, so this is a late replay
+            outcomes[key] = {'status': 'duplicate', 'seq': seq, 'lastseq': last_seq}
+            continue
+
+        if base_seq == 0:
+            # Delta from zero: the tracker is (re)starting its baseline
+            state = {
+                'session_start': sample.get('sessionstart'),
+                'last_seq': 0,
+                'windows': [],
+                'counters': {col: 0.0 for col in COUNTER_FIELDS.values()}
+            }
+        elif state is None or base_seq != last_seq:
+            status = 'duplicate' if state is not None and seq == last_seq else 'resync'
+            outcomes[key] = {'status': status, 'seq': seq, 'lastseq': last_seq}
+            continue
+
+        delta = sample.get('delta') or {}
+        added = sample.get('windowsadded') or []
+        if not isinstance(delta, dict) or not isinstance(added, list):
+            outcomes[key] = {'status': 'resync', 'seq': seq, 'lastseq': last_seq}
+            continue
+
+        for field, col in COUNTER_FIELDS.items():
+            state['counters'][col] += _as_float(delta.get(field))
+            sample[field] = round(state['counters'][col], 2)
+        previous_windows = state['windows']
+        state['windows'] = merge_windows(previous_windows, added)
+        state['last_seq'] = seq
+        state['session_start'] = sample.get('sessionstart') or state['session_start']
+        sample['windowsopened'] = [w for w in state['windows'] if w not in previous_windows]
+
+        states[(member_id, deviceid_str)] = state
+        changed[(member_id, deviceid_str)] = state
+        outcomes[key] = {'status': 'applied', 'seq': seq, 'lastseq': seq}
+
+    return outcomes, changed
+
+
+def apply_sample_deltas(cur, company_id, entries):
+    """
+    Apply delta samples to tracker_device_state (inside the caller's transaction).
+
+    entries is a list of (key, member_id, deviceid_str, sample) in upload
+    order. Applied samples are rewritten in place into the full form that
+    activity_log_row() expects (cumulative counters, windowsopened = new
+    entries only). Full (protocol 1) samples are ignored.
+
+    Returns {key: outcome} for every delta sample, outcome being a dict with
+    'status' ('applied' | 'duplicate' | 'resync'), 'seq' and 'lastseq'.
+    """
+    delta_entries = [e for e in entries if is_delta_sample(e[3])]
+    if not delta_entries:
+        return {}
+
+    cur.execute(f"""
+        SELECT member_id, device_id, {', '.join(STATE_COLUMNS)}
+        FROM tracker_device_state
+        WHERE company_id = %s AND member_id = ANY(%s) AND device_id = ANY(%s)
+        FOR UPDATE
+    """, (company_id,
+          sorted({e[1] for e in delta_entries}),
+          sorted({e[2] for e in delta_entries})))
+
+    states = {(row['member_id'], row['device_id']): device_state_from_row(row) for row in cur.fetchall()}
+
+    outcomes, changed = reconstruct_sample_deltas(states, delta_entries)
+
+    if changed:
+        execute_values(cur, DEVICE_STATE_UPSERT.format(values='%s'), [
+            device_state_row(company_id, member_id, deviceid_str, state)
+            for (member_id, deviceid_str), state in changed.items()
+        ], template=DEVICE_STATE_VALUES)
+
+    return outcomes
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'DELTA_PROTOCOL_VERSION',
+    'STATE_COLUMNS',
+    'DEVICE_STATE_UPSERT',
+    'DEVICE_STATE_VALUES',
+    'is_delta_sample',
+    'merge_windows',
+    'device_state_from_row',
+    'device_state_row',
+    'reconstruct_sample_deltas',
+    'apply_sample_deltas'
+]
@@ -0,0 +1,135 @@
+"""
+WINDOW_ACTIVITY.PY - Per window dwell time maintained at ingest
+===============================================================
+✅ window_activity holds one row per (device, local date, window title,
+   process): dwell seconds, visits, first and last seen
+✅ Upserted in the same statement that writes activity_log (a CTE over the
+   inserted rows), like member_day_state
+✅ Window analytics read this table instead of activity_log rows and
+   their windows_opened JSONB
+
+A sample's dwell time is the increase of total_seconds since the previous
+sample of the same device session (the whole value for the first sample of
+a session or after a counter reset), credited to the sample's current
+window. A visit starts whenever the current window or process differs from
+the previous sample's, and on the first sample of a local day. Samples that
+arrive out of order are credited against the sample before them, so part
+of their interval can be counted twice. Titles are cut to
+WINDOW_TITLE_MAX_LENGTH characters (they are part of the unique key).
+Requires scripts/add_window_activity_ingest.py.
+"""
+
+from member_day import LOCAL_DATE_SQL
+
+WINDOW_TITLE_MAX_LENGTH = 512
+
+# Columns an activity_log insert must RETURN for WINDOW_ACTIVITY_FROM_INSERT,
+# besides device_id and member_day.ACTIVITY_RETURNING
+WINDOW_RETURNING = "session_start, current_window, current_process"
+
+_SAMPLE_COLUMNS = "company_id, member_id, device_id, timestamp, session_start, total_seconds, current_window, current_process"
+
+# CTEs folding the rows of a preceding `ins` CTE into window_activity. The
+# sample before each device's first inserted one (read from the snapshot the
+# statement started with) is the baseline for the first increment. Rows are
+# upserted in key order so concurrent batches lock them in the same order.
+WINDOW_ACTIVITY_FROM_INSERT = f"""
+    win_seed AS (
+        SELECT f.company_id, f.member_id, f.device_id, p.timestamp, p.session_start, p.total_seconds,
+               p.current_window, p.current_process, TRUE AS is_seed
+        FROM (
+            SELECT company_id, member_id, device_id, MIN(timestamp) AS first_at
+            FROM ins WHERE member_id IS NOT NULL GROUP BY 1, 2, 3
+        ) f
+        CROSS JOIN LATERAL (
+            SELECT timestamp, session_start, total_seconds, current_window, current_process
+            FROM activity_log p
+            WHERE p.member_id = f.member_id AND p.device_id = f.device_id
+              AND p.timestamp < f.first_at AND p.timestamp >= f.first_at - INTERVAL '1 day'
+            ORDER BY p.timestamp DESC
+            LIMIT 1
+        ) p
+    ),
+    win_steps AS (
+        SELECT s.*,
+               {LOCAL_DATE_SQL.format(expr='s.timestamp')} AS local_date,
+               LAG(total_seconds) OVER w AS prev_total_seconds,
+               LAG(session_start) OVER w IS DISTINCT FROM session_start AS new_session,
+               LAG({LOCAL_DATE_SQL.format(expr='s.timestamp')}) OVER w AS prev_local_date,
+               LAG(current_window) OVER w AS prev_window,
+               LAG(current_process) OVER w AS prev_process
+        FROM (
+            SELECT {_SAMPLE_COLUMNS}, FALSE AS is_seed FROM ins WHERE member_id IS NOT NULL
+            UNION ALL
+            SELECT {_SAMPLE_COLUMNS}, is_seed FROM win_seed
+        ) s
+        WINDOW w AS (PARTITION BY member_id, device_id ORDER BY timestamp, is_seed DESC)
+    ),
+    win AS (
+        INSERT INTO window_activity (
+            company_id, device_id, date, window_title, process_name, member_id,
+            total_time_seconds, visit_count, first_seen, last_seen
+        )
+        SELECT company_id, device_id, local_date,
+               LEFT(COALESCE(current_window, ''), {WINDOW_TITLE_MAX_LENGTH}), COALESCE(current_process, ''),
+               MAX(member_id),
+               SUM(CASE WHEN prev_total_seconds IS NULL OR new_session OR total_seconds < prev_total_seconds
+                        THEN total_seconds ELSE total_seconds - prev_total_seconds END),
+               SUM(CASE WHEN prev_local_date IS DISTINCT FROM local_date
+                          OR prev_window IS DISTINCT FROM current_window
+                          OR prev_process IS DISTINCT FROM current_process
+                        THEN 1 ELSE 0 END),
+               MIN(timestamp), MAX(timestamp)
+        FROM win_steps
+        WHERE NOT is_seed AND (COALESCE(current_window, '') <> '' OR COALESCE(current_process, '') <> '')
+        GROUP BY 1, 2, 3, 4, 5
+        ORDER BY 1, 2, 3, 4, 5
+        ON CONFLICT (company_id, device_id, date, window_title, process_name) DO UPDATE
+        SET total_time_seconds = window_activity.total_time_seconds + EXCLUDED.total_time_seconds,
+            visit_count = window_activity.visit_count + EXCLUDED.visit_count,
+            member_id = EXCLUDED.member_id,
+            first_seen = LEAST(window_activity.first_seen, EXCLUDED.first_seen),
+            last_seen = GREATEST(window_activity.last_seen, EXCLUDED.last_seen)
+    )
+"""
+
+
+def window_usage(cur, company_id, member_id, start_date, end_date, limit=None):
+    """
+    A member's windows over local dates [start_date, end_date] (all
+    devices), longest dwell first
+    """
+    query = """
+        SELECT
+            window_title,
+            process_name,
+            SUM(total_time_seconds) as total_time_seconds,
+            SUM(visit_count) as visit_count,
+            MIN(first_seen) as first_seen,
+            MAX(last_seen) as last_seen
+        FROM window_activity
+        WHERE company_id = %s
+          AND member_id = %s
+          AND date >= %s
+          AND date <= %s
+        GROUP BY window_title, process_name
+        ORDER BY total_time_seconds DESC
+    """
+    params = [company_id, member_id, start_date, end_date]
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    cur.execute(query, params)
+    return cur.fetchall()
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+__all__ = [
+    'WINDOW_TITLE_MAX_LENGTH',
+    'WINDOW_RETURNING',
+    'WINDOW_ACTIVITY_FROM_INSERT',
+    'window_usage'
+]
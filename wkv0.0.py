@@ -1054,7 +1054,7 @@ FIXES:
   3. All thread/socket/lock fixes from previous version retained
 """
 
-import os, sys, time, json, base64, ctypes, psutil
+import os, sys, time, json, gzip, ctypes, psutil
 import win32gui, win32process, win32api
 from PIL import Image, ImageGrab
 from datetime import datetime
@@ -1137,6 +1137,9 @@ class ConfigurationManager:
 
 config_manager = ConfigurationManager()
 
+SEQ_BLOCK_SIZE = 1000
+UPLOAD_ATTEMPTS = 3
+
 
 class GlobalState:
     def __init__(self):
@@ -1155,35 +1158,62 @@ class GlobalState:
         self.last_activity_time = datetime.now()
         self.last_screenshot_time = datetime.now()
         self.windows_opened = []
-        self.latest_screenshot_b64 = None
+        self.latest_screenshot = None
+        # Delta protocol: last state the server acknowledged and the upload in flight
+        self.acked = None
+        self.pending = None
+        self.retry_after_until = 0.0   # server backpressure (429 Retry-After)
         self.last_mouse_pos = None
         self.mouse_active = False
         self.keyboard_active = False
         self.device_id = self._get_or_create_device_id()
+        # Upload seq is the server's idempotency key with device_id: it must never
+        # repeat, so it continues after the last block reserved in device.json
+        self.upload_seq = self.seq_reserved = self._load_device_file().get('seq_reserved', 0)
         self.username = getpass.getuser()
         self.hostname = socket.gethostname()
         self.os_info = f"{platform.system()} {platform.release()}"
         self.is_tracking = False
 
-    def _get_or_create_device_id(self):
-        config_file = os.path.join(os.getenv('APPDATA'), 'Tracker', 'device.json')
+    @staticmethod
+    def _device_file():
+        return os.path.join(os.getenv('APPDATA'), 'Tracker', 'device.json')
+
+    def _load_device_file(self):
         try:
-            if os.path.exists(config_file):
-                with open(config_file, 'r') as f:
-                    data = json.load(f)
-                    if data.get('device_id'):
-                        return data['device_id']
+            if os.path.exists(self._device_file()):
+                with open(self._device_file(), 'r') as f:
+                    return json.load(f)
         except Exception:
             pass
-        device_id = str(uuid.uuid4())[:8]
+        return {}
+
+    def _save_device_file(self, **values):
+        data = self._load_device_file()
+        data.update(values)
         try:
-            os.makedirs(os.path.dirname(config_file), exist_ok=True)
-            with open(config_file, 'w') as f:
-                json.dump({'device_id': device_id}, f)
+            os.makedirs(os.path.dirname(self._device_file()), exist_ok=True)
+            with open(self._device_file(), 'w') as f:
+                json.dump(data, f)
         except Exception:
             pass
+
+    def _get_or_create_device_id(self):
+        device_id = self._load_device_file().get('device_id')
+        if device_id:
+            return device_id
+        device_id = str(uuid.uuid4())[:8]
+        self._save_device_file(device_id=device_id)
         return device_id
 
+    def _next_seq(self):
+        """Next upload seq (caller holds the lock); reserves seqs in blocks to limit disk writes"""
+        self.upload_seq += 1
+        if self.upload_seq > self.seq_reserved:
+            self.seq_reserved = self.upload_seq + SEQ_BLOCK_SIZE
+            self._save_device_file(seq_reserved=self.seq_reserved)
+        return self.upload_seq
+
     def add_time(self, seconds, is_active, is_idle, is_locked):
         with self.lock:
             self.total_seconds += seconds
@@ -1201,31 +1231,48 @@ class GlobalState:
                 if len(self.windows_opened) > 50:
                     self.windows_opened = self.windows_opened[-50:]
 
-    def get_payload(self, include_screenshot=False):
+    def get_payload(self):
+        """Delta payload: counter increments and new windows since the last acknowledged upload"""
         with self.lock:
+            self._next_seq()
+            counters = {
+                "totalseconds": round(self.total_seconds, 2),
+                "activeseconds": round(self.active_seconds, 2),
+                "idleseconds": round(self.idle_seconds, 2),
+                "lockedseconds": round(self.locked_seconds, 2),
+            }
+            base = self.acked or {"seq": 0, "counters": dict.fromkeys(counters, 0.0), "windows": []}
+            self.pending = {"seq": self.upload_seq, "counters": counters, "windows": self.windows_opened[:]}
             payload = {
+                "protocol": 2, "seq": self.upload_seq, "baseseq": base["seq"],
                 "deviceid": self.device_id, "username": self.username,
                 "email": CONFIG.get('member_email', ''), "hostname": self.hostname,
                 "osinfo": self.os_info, "timestamp": datetime.now().isoformat(),
                 "sessionstart": self.session_start.isoformat(),
                 "lastactivity": self.last_activity_time.isoformat(),
-                "totalseconds": round(self.total_seconds, 2),
-                "activeseconds": round(self.active_seconds, 2),
-                "idleseconds": round(self.idle_seconds, 2),
-                "lockedseconds": round(self.locked_seconds, 2),
+                "delta": {k: round(v - base["counters"][k], 2) for k, v in counters.items()},
+                "windowsadded": [w for w in self.windows_opened if w not in base["windows"]],
                 "idlefor": round(self.idle_for, 2),
                 "isidle": self.is_idle, "locked": self.is_locked,
                 "mouseactive": self.mouse_active, "keyboardactive": self.keyboard_active,
                 "currentwindow": self.current_window, "currentprocess": self.current_process,
-                "windowsopened": self.windows_opened[:], "browserhistory": [],
+                "browserhistory": [],
             }
-            if include_screenshot and self.latest_screenshot_b64:
-                payload["screenshot"] = self.latest_screenshot_b64
             return payload
 
+    def ack_upload(self, seq):
+        with self.lock:
+            if self.pending and self.pending["seq"] == seq:
+                self.acked, self.pending = self.pending, None
+
+    def request_resync(self):
+        """Server lost our baseline: next upload resends everything as a delta from zero"""
+        with self.lock:
+            self.acked = self.pending = None
+
     def reset_for_upload(self):
         with self.lock:
-            self.latest_screenshot_b64 = None
+            self.latest_screenshot = None
 
     def reset_session(self):
         with self.lock:
@@ -1235,7 +1282,8 @@ class GlobalState:
             self.mouse_active = self.keyboard_active = False
             self.session_start = datetime.now()
             self.windows_opened = []
-            self.latest_screenshot_b64 = None
+            self.latest_screenshot = None
+            self.acked = self.pending = None
 
 
 STATE = GlobalState()
@@ -1291,7 +1339,7 @@ def capture_screenshot():
                 f.write(buf.getvalue())
         except Exception:
             pass
-        return base64.b64encode(buf.getvalue()).decode()
+        return buf.getvalue()
     except Exception as e:
         print(f"[SCREENSHOT] {e}")
         return None
@@ -1379,20 +1427,60 @@ def punch_out():
         return False, str(e)
 
 
+def post_compressed(url, headers, timeout, **kwargs):
+    """POST with a gzip body (Content-Encoding: gzip); window titles compress ~10x"""
+    req = requests.Request('POST', url, headers=headers, **kwargs).prepare()
+    body = req.body.encode() if isinstance(req.body, str) else req.body
+    req.body = gzip.compress(body, compresslevel=6)
+    req.headers['Content-Encoding'] = 'gzip'
+    req.headers['Content-Length'] = str(len(req.body))
+    with requests.Session() as session:
+        return session.send(req, timeout=timeout)
+
 def upload_data():
     try:
         if not CONFIG.get('member_email') or not CONFIG.get('tracker_token'):
             return False
-        payload = STATE.get_payload(include_screenshot=STATE.latest_screenshot_b64 is not None)
-        r = requests.post(f"{CONFIG['backend_url']}/tracker/upload", json=payload,
-                          headers={'Content-Type': 'application/json',
-                                   'X-Tracker-Token': CONFIG['tracker_token']}, timeout=15)
-        if r.status_code == 200:
+        payload = STATE.get_payload()
+        with STATE.lock:
+            jpeg = STATE.latest_screenshot
+        url = f"{CONFIG['backend_url']}/tracker/upload"
+        headers = {'X-Tracker-Token': CONFIG['tracker_token']}
+        # Retries resend the same payload (same seq): the server drops replays
+        for attempt in range(UPLOAD_ATTEMPTS):
+            try:
+                if jpeg:
+                    # Binary multipart part: no base64 inflation, server streams it to disk
+                    r = post_compressed(url, headers, 15, data={'payload': json.dumps(payload)},
+                                        files={'screenshot': ('screenshot.jpg', jpeg, 'image/jpeg')})
+                else:
+                    r = post_compressed(url, headers, 15, json=payload)
+                if r.status_code == 429:
+                    # Backpressure: keep the unacked delta, upload again after Retry-After
+                    wait = float(r.headers.get('Retry-After') or CONFIG['upload_interval'])
+                    STATE.retry_after_until = time.time() + wait
+                    print(f"[UPLOAD] 🚦 Rate limited — next upload in {wait:.0f}s")
+                    return False
+                if r.status_code < 500:
+                    break
+                print(f"[UPLOAD] ⚠️ HTTP {r.status_code}, retrying seq {payload['seq']}")
+            except requests.RequestException as e:
+                if attempt == UPLOAD_ATTEMPTS - 1:
+                    raise
+                print(f"[UPLOAD] ⚠️ {e}, retrying seq {payload['seq']}")
+            if attempt < UPLOAD_ATTEMPTS - 1:
+                time.sleep(2 ** attempt)
+        if r.status_code in (200, 202):   # 202 = spooled by the server, still acknowledged
             data = r.json()
             if data.get('code') == 'NOT_PUNCHED_IN':
                 print("[UPLOAD] ⚠️ Not punched in — stopping")
                 STATE.is_tracking = False
                 return False
+            if data.get('code') == 'RESYNC':
+                print(f"[UPLOAD] 🔄 Server at seq {data.get('lastseq')} — resending full state")
+                STATE.request_resync()
+                return False
+            STATE.ack_upload(data.get('ackseq'))
             status = "IDLE" if STATE.is_idle else ("LOCKED" if STATE.is_locked else "ACTIVE")
             print(f"[UPLOAD] ✅ {status} idle_for={STATE.idle_for:.0f}s")
             STATE.reset_for_upload()
@@ -1471,7 +1559,7 @@ class DataUploader(Thread):
     def run(self):
         print(f"[UPLOADER] Started — every {CONFIG['upload_interval']}s")
         while self.running:
-            interval = CONFIG['upload_interval']
+            interval = max(CONFIG['upload_interval'], STATE.retry_after_until - time.time())
             elapsed = 0
             while elapsed < interval and self.running:
                 time.sleep(min(2, interval - elapsed))
@@ -1536,10 +1624,10 @@ class ScreenshotCapture(Thread):
                     elapsed = 0
             if not self.running or not STATE.is_tracking: break
             try:
-                b64 = capture_screenshot()
-                if b64:
+                jpeg = capture_screenshot()
+                if jpeg:
                     with STATE.lock:
-                        STATE.latest_screenshot_b64 = b64
+                        STATE.latest_screenshot = jpeg
                         STATE.last_screenshot_time = datetime.now()
                     print(f"[SCREENSHOT] 📸 {datetime.now().strftime('%H:%M:%S')}")
             except Exception as e: